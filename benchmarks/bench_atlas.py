@@ -0,0 +1,32 @@
+# imports
+from harness import case
+
+
+class _Image:
+    """
+    Stands in for a PIL image: packing only looks at the size.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+
+@case("atlas.pack_uniform")
+def pack_uniform():
+    from core.atlas import TextureAtlasGenerator
+
+    images = [_Image((32, 32)) for _ in range(100)]
+
+    def run():
+        generator = TextureAtlasGenerator()
+        for image in images:
+            generator.add(image)
+    return run, len(images), "textures"
+
+
+@case("atlas.pack_shelves")
+def pack_mixed():
+    from core.atlas import pack_shelves
+
+    sizes = [(16 << (i % 3), 16 << (i % 2)) for i in range(1000)]
+    return lambda: pack_shelves(sizes, 1024), len(sizes), "rects"
@@ -0,0 +1,62 @@
+# imports
+import numpy as np
+
+from harness import case
+
+from core.light import compute_light
+from core.mesher import mesh_blocks
+from core.terrain import TerrainGenerator
+from core.vertex_format import encode
+from core.world import CHUNK_SIZE, SECTION_SIZE, WORLD_HEIGHT, Chunk
+
+
+def _padded():
+    columns = TerrainGenerator(1).generate(-1, -1, CHUNK_SIZE + 2, CHUNK_SIZE + 2)
+    padded = np.zeros((CHUNK_SIZE + 2, WORLD_HEIGHT + 2, CHUNK_SIZE + 2), dtype=columns.dtype)
+    padded[:, 1:-1, :] = columns
+    return padded
+
+
+def _tile_table():
+    return np.arange(64 * 6, dtype=np.uint16).reshape(64, 6)
+
+
+@case("terrain.generate")
+def generate():
+    terrain = TerrainGenerator(1)
+    return lambda: terrain.generate(0, 0, CHUNK_SIZE, CHUNK_SIZE), 1, "chunks"
+
+
+@case("world.set_blocks")
+def set_blocks():
+    blocks = TerrainGenerator(1).generate(0, 0, CHUNK_SIZE, CHUNK_SIZE)
+    return lambda: Chunk(0, 0).set_blocks(blocks), 1, "chunks"
+
+
+@case("mesher.naive")
+def naive():
+    padded = _padded()
+    return lambda: mesh_blocks(padded, tile_table=_tile_table()), 1, "chunks"
+
+
+@case("mesher.greedy")
+def greedy():
+    padded = _padded()
+    return lambda: mesh_blocks(padded, tile_table=_tile_table(), greedy=True), 1, "chunks"
+
+
+@case("mesher.pack")
+def pack():
+    mesh = mesh_blocks(_padded(), tile_table=_tile_table())
+    return lambda: encode(mesh), mesh.count // 6, "quads"
+
+
+@case("mesher.section")
+def section():
+    # What an edit costs: one lit section, the one holding the surface
+    padded = _padded()
+    light = compute_light(padded)
+    sy = int(np.nonzero((padded[1:-1, 1:-1, 1:-1] != 0).any(axis=(0, 2)))[0].max()) // SECTION_SIZE
+    rows = slice(sy * SECTION_SIZE, (sy + 1) * SECTION_SIZE + 2)
+    padded, light, tiles = padded[:, rows], light[:, rows], _tile_table()
+    return lambda: encode(mesh_blocks(padded, tile_table=tiles, greedy=True, light=light)), 1, "sections"
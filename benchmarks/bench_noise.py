@@ -0,0 +1,34 @@
+# imports
+import numpy as np
+
+from harness import case
+
+from core.perlin import PerlinNoiseFactory
+
+# constants
+POINTS = 4096
+
+
+def _points():
+    return np.random.default_rng(0).uniform(-64, 64, (POINTS, 2))
+
+
+@case("noise.scalar")
+def scalar():
+    noise = PerlinNoiseFactory(2, octaves=4, seed=1)
+    points = [tuple(p) for p in _points()]
+    return lambda: [noise(*p) for p in points], POINTS, "points"
+
+
+@case("noise.batch")
+def batch():
+    noise = PerlinNoiseFactory(2, octaves=4, seed=1)
+    points = _points()
+    return lambda: noise.sample(points), POINTS, "points"
+
+
+@case("noise.grid")
+def grid():
+    noise = PerlinNoiseFactory(2, octaves=4, seed=1)
+    axis = np.arange(64) / 64.0
+    return lambda: noise.sample_grid(axis, axis), 64 * 64, "points"
@@ -0,0 +1,69 @@
+# imports
+import itertools
+
+import numpy as np
+
+from harness import case
+
+# constants
+UPLOAD_SIZE = 4 * 1024 * 1024  # Bytes per upload
+MB = 1024 * 1024
+
+
+@case("buffer.modify", gl=True)
+def buffer_modify():
+    from core.buffer import Buffer
+
+    buffer = Buffer("bench", 2 * UPLOAD_SIZE)
+    data = np.random.default_rng(0).random(UPLOAD_SIZE // 4, dtype=np.float32)
+    return lambda: buffer.modify(data), UPLOAD_SIZE / MB, "MB"
+
+
+@case("renderer.modify", gl=True)
+def renderer_modify():
+    from core.renderer import Renderer
+
+    renderer = Renderer(None, None)
+    renderer.create_buffer("bench")
+    count = UPLOAD_SIZE // 20  # 12 + 8 bytes per vertex
+    vertices = np.random.default_rng(0).random(count * 3, dtype=np.float32)
+    texture = np.random.default_rng(1).random(count * 2, dtype=np.float32)
+    renderer.modify("bench", vertices, texture)
+    return lambda: renderer.modify("bench", vertices, texture), (vertices.nbytes + texture.nbytes) / MB, "MB"
+
+
+@case("renderer.modify_packed", gl=True)
+def renderer_modify_packed():
+    from core.renderer import Renderer
+    from core.vertex_format import PACKED_VERTEX
+
+    renderer = Renderer(None, None)
+    renderer.strides = (PACKED_VERTEX.itemsize,)  # Packed arenas, without the shader drawing needs
+    renderer.create_buffer("bench")
+    packed = np.zeros(UPLOAD_SIZE // PACKED_VERTEX.itemsize, dtype=PACKED_VERTEX)
+    renderer.modify_packed("bench", packed)
+    return lambda: renderer.modify_packed("bench", packed), packed.nbytes / MB, "MB"
+
+
+@case("renderer.patch", gl=True)
+def renderer_patch():
+    from core.renderer import Renderer
+    from core.vertex_format import PACKED_VERTEX
+
+    renderer = Renderer(None, None)
+    renderer.strides = (PACKED_VERTEX.itemsize,)
+    renderer.create_buffer("bench")
+    # A chunk of 16 sections, 2048 quads each; patch one near the bottom, so the rest move
+    section = np.zeros(2048 * 4, dtype=PACKED_VERTEX)
+    renderer.modify_packed("bench", np.concatenate([section] * 16))
+    renderer.set_sections("bench", [len(section)] * 16)
+    sizes = itertools.cycle((section[:-4 * 64], section))  # Shrink then grow back
+
+    def patch():
+        renderer.patch("bench", 1, (next(sizes),))
+        # Nothing draws here, so the replaced region can be freed at once
+        for arena, first in renderer.retiring:
+            renderer.free(arena, first)
+        renderer.retiring = []
+
+    return patch, 1, "sections"
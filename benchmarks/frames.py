@@ -0,0 +1,211 @@
+"""
+End-to-end frame benchmark: replays a camera path in a headless window and
+reports the frame time distribution, triangles drawn and bytes uploaded
+per frame.
+
+    python benchmarks/frames.py --frames 600 -o frames.json
+    python benchmarks/frames.py --path recorded.json --dump out/ --dump-every 30
+    python benchmarks/frames.py --diff out/ reference/
+
+Without a display (or with --osmesa) it renders through OSMesa, which
+needs GLFW 3.4 or newer. The chunks around the path are loaded before the
+replay, so frames measure drawing only; --stream loads them through the
+ChunkPipeline during the replay instead, to measure uploads too.
+"""
+
+# imports
+import argparse
+import json
+import math
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+# constants
+DEFAULT_FRAMES = 600
+FOV = 70.0
+
+
+class Scene:
+    """
+    Scene
+
+    Clears the frame and sets the projection and the atlas up for the
+    renderer. Schedule its drawcall first.
+    """
+
+    def __init__(self, window, texture_manager, texture):
+        from OpenGL.GL import GL_DEPTH_TEST, glEnable
+
+        self.window = window
+        self.texture_manager = texture_manager
+        self.texture = texture
+        glEnable(GL_DEPTH_TEST)
+
+    def drawcall(self):
+        from OpenGL.GL import (GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_MODELVIEW, GL_PROJECTION,
+                               glClear, glClearColor, glLoadIdentity, glLoadMatrixd, glMatrixMode, glViewport)
+        from core.frustum import perspective
+
+        width, height = self.window.size
+        glViewport(0, 0, width, height)
+        glClearColor(0.5, 0.7, 1.0, 1.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glMatrixMode(GL_PROJECTION)
+        glLoadMatrixd(perspective(FOV, width / height, 0.1, 1000).T)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        self.texture_manager.bind(self.texture)
+
+
+def path_chunks(path, radius):
+    """
+    Returns the chunks within radius of any keyframe of a path, nearest
+    to the start first.
+    """
+    from core.world import CHUNK_SIZE
+
+    chunks = {}
+    for i, (position, _) in enumerate(path.keyframes):
+        cx, cz = int(position[0] // CHUNK_SIZE), int(position[2] // CHUNK_SIZE)
+        for dx in range(-radius, radius + 1):
+            for dz in range(-radius, radius + 1):
+                if dx * dx + dz * dz <= radius * radius:
+                    chunks.setdefault((cx + dx, cz + dz), i)
+    return sorted(chunks, key=chunks.get)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyCraft headless frame benchmark")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help="frames to draw")
+    parser.add_argument("--path", help="camera path JSON (see core.replay.CameraPath); default: an orbit")
+    parser.add_argument("--size", type=int, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--radius", type=int, default=None, help="chunks loaded around the path")
+    parser.add_argument("--packed", action="store_true", help="packed vertices and greedy meshing")
+    parser.add_argument("--stream", action="store_true", help="load chunks during the replay")
+    parser.add_argument("--lod", action="store_true", help="coarser meshes for distant chunks")
+    parser.add_argument("--osmesa", action="store_true", help="render through OSMesa even with a display")
+    parser.add_argument("--dump", help="directory to write frames to")
+    parser.add_argument("--dump-every", type=int, default=1)
+    parser.add_argument("--diff", nargs=2, metavar=("DIR_A", "DIR_B"), help="compare two frame dumps and exit")
+    parser.add_argument("-o", "--output", help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.osmesa or not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        os.environ.setdefault("PYOPENGL_PLATFORM", "osmesa")
+    for arg in ("path", "dump", "output"):
+        if getattr(args, arg):
+            setattr(args, arg, os.path.abspath(getattr(args, arg)))
+    if args.diff:
+        args.diff = [os.path.abspath(d) for d in args.diff]
+    sys.path.insert(0, SRC)
+    os.chdir(SRC)  # Assets and the log are relative to src/
+
+    from core.replay import diff_frames
+    if args.diff:
+        diffs = diff_frames(*args.diff)
+        for name, diff in diffs.items():
+            print("{}  {:.3f}".format(name, diff))
+        print("max {:.3f} over {} frames".format(max(diffs.values(), default=0.0), len(diffs)))
+        return 0
+
+    from core.camera import FPC
+    from core.config import RENDER_DISTANCE, WINDOW_SIZE
+    from core.lod import LODManager, mesh_chunk_lod
+    from core.mesher import build_tile_table, build_uv_table
+    from core.pipeline import ChunkPipeline
+    from core.renderer import Renderer
+    from core.replay import CameraPath, FrameRecorder
+    from core.terrain import TerrainGenerator
+    from core.texture_manager import TextureAtlas
+    from core.window import Window
+    from core.world import World
+
+    window = Window(headless=True, size=tuple(args.size) if args.size else WINDOW_SIZE)
+
+    atlas = TextureAtlas(array=args.packed)
+    atlas.load_folder("assets/textures/block/", "block")
+    texture = atlas.generate()
+    uv_table = None if args.packed else build_uv_table(atlas)
+    tile_table = build_tile_table(atlas) if args.packed else None
+
+    world = World()
+    camera = FPC(window, world)
+    renderer = Renderer(window, atlas, camera, packed=args.packed)
+
+    if args.path:
+        path = CameraPath.load(args.path)
+    else:
+        terrain = TerrainGenerator(args.seed)
+        height = float(terrain.heightmap(0, 0, 1, 1)[0, 0]) + 24
+        path = CameraPath.orbit((0, 0), 48, height, args.frames)
+    camera.path = path
+    path.step(camera)  # Start where the path does, for the first LOD levels
+    path.rewind()
+
+    radius = args.radius if args.radius is not None else RENDER_DISTANCE
+    chunks = path_chunks(path, radius)
+    pipeline = None
+    lod = None
+    if args.stream:
+        pipeline = ChunkPipeline(world, renderer, args.seed, uv_table, tile_table, args.packed,
+                                 scheduler=window.jobs, camera=camera)
+        if args.lod:
+            lod = LODManager(pipeline, camera)
+            window.schedule_tick(lod)
+        for cx, cz in chunks:
+            pipeline.request(cx, cz, lod.level(cx, cz) if lod else 0)
+    else:
+        from core.lod import lod_levels
+        from core.vertex_format import encode
+        from core.world import CHUNK_SIZE
+
+        terrain = TerrainGenerator(args.seed)
+        for cx, cz in chunks:
+            world.load_chunk(cx, cz, terrain.generate(cx * CHUNK_SIZE, cz * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+        for cx, cz in chunks:
+            id = "chunk_{}_{}".format(cx, cz)
+            level = 0
+            if args.lod:
+                # Fixed for the whole replay, from where the path starts
+                x, _, z = camera.state["position"]
+                level = int(lod_levels(math.hypot(cx + 0.5 - x / CHUNK_SIZE, cz + 0.5 - z / CHUNK_SIZE)))
+            mesh = mesh_chunk_lod(world, cx, cz, level, uv_table, tile_table, args.packed)
+            if args.packed:
+                origin = (cx * CHUNK_SIZE, cz * CHUNK_SIZE)
+                renderer.create_buffer(id, origin=origin)
+                renderer.modify_packed(id, encode(mesh, origin))
+            else:
+                renderer.create_buffer(id)
+                renderer.modify(id, mesh.vertices, mesh.texcoords)
+        renderer.stats["upload_bytes"] = 0  # Only count what the replay uploads
+
+    recorder = FrameRecorder(window, renderer, args.dump, args.dump_every)
+    window.schedule_tick(camera)
+    window.schedule_drawcall(Scene(window, atlas, texture))
+    window.schedule_drawcall(camera)
+    window.schedule_drawcall(renderer)
+    window.schedule_drawcall(recorder)
+    window.mainloop(frames=args.frames)
+    window.thread.join()
+    if pipeline is not None:
+        pipeline.shutdown()
+
+    report = {"frames": args.frames, "size": list(window.size), "chunks": len(chunks),
+              "stream": args.stream, "packed": args.packed, "lod": args.lod}
+    report.update(recorder.report())
+    frame_ms = report.get("frame_ms", {})
+    print("{} frames  p50 {:.2f} ms  p99 {:.2f} ms  {:.1f} fps  {:.0f} triangles  {:.0f} upload bytes/frame".format(
+        report["frames"], frame_ms.get("p50", math.nan), frame_ms.get("p99", math.nan), report.get("fps", math.nan),
+        report.get("triangles", {}).get("mean", math.nan), report.get("upload_bytes", {}).get("mean", math.nan)))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# imports
+import os
+import platform
+import sys
+import time
+
+# Benchmarks import the engine the same way main.py does, from src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# constants
+MIN_TIME = 0.2  # Seconds each repeat runs for, at least
+REPEATS = 5  # Repeats per case; the median is reported
+
+# Registered cases: name -> (function, needs_gl)
+cases = {}
+
+
+def case(name, gl=False):
+    """
+    Registers a benchmark case.
+
+    The decorated function does its setup and returns (run, units, unit):
+    the callable to time, the work it does per call and the unit of that
+    work ("points", "MB"...), used to report throughput.
+
+    :param name: The name of the case, "group.case".
+    :param gl: Whether it needs an OpenGL context.
+    """
+    def register(function):
+        cases[name] = (function, gl)
+        return function
+    return register
+
+
+def measure(run, repeats=REPEATS, min_time=MIN_TIME):
+    """
+    Times a callable. Returns the seconds per call of each repeat.
+
+    :param run: The callable.
+    :param repeats: The number of repeats.
+    :param min_time: The minimum duration of a repeat, in seconds.
+    """
+    run()  # Warm up caches and lazy setup
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / elapsed))
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+
+def offscreen_context(width=64, height=64):
+    """
+    Makes an offscreen OSMesa context current, for the GL cases.
+    PYOPENGL_PLATFORM must be "osmesa" before OpenGL is first imported
+    (run.py sets it). Returns the context and its color buffer, which must
+    be kept alive.
+
+    :param width: The width of the color buffer.
+    :param height: The height of the color buffer.
+    """
+    from OpenGL import GL, arrays, osmesa
+
+    try:
+        context = osmesa.OSMesaCreateContextAttribs([
+            osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+            osmesa.OSMESA_DEPTH_BITS, 24,
+            osmesa.OSMESA_PROFILE, osmesa.OSMESA_COMPAT_PROFILE,
+            osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 4,
+            osmesa.OSMESA_CONTEXT_MINOR_VERSION, 5,
+            0,
+        ], None)
+    except Exception:
+        context = None
+    if not context:
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+    if not context:
+        raise RuntimeError("Couldn't create an OSMesa context")
+    buf = arrays.GLubyteArray.zeros((height, width, 4))
+    if not osmesa.OSMesaMakeCurrent(context, buf, GL.GL_UNSIGNED_BYTE, width, height):
+        raise RuntimeError("Couldn't make the OSMesa context current")
+    return context, buf
+
+
+def machine():
+    """
+    Describes the machine, stored with the results.
+    """
+    import numpy as np
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results against a baseline. Returns {case: ratio} of the
+    cases slower than the baseline by more than the threshold, where ratio
+    is current / baseline time.
+
+    :param results: The "results" of this run.
+    :param baseline: The "results" of the baseline run.
+    :param threshold: The allowed slowdown, e.g. 0.1 for 10%.
+    """
+    regressions = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or "median_s" not in base or "median_s" not in result:
+            continue
+        ratio = result["median_s"] / base["median_s"]
+        if ratio > 1 + threshold:
+            regressions[name] = ratio
+    return regressions
@@ -0,0 +1,137 @@
+"""
+Runs the micro-benchmarks and compares them against a stored baseline.
+
+    python benchmarks/run.py                      # run, compare to baseline.json
+    python benchmarks/run.py --save-baseline      # run, store as the baseline
+    python benchmarks/run.py -k mesher -o out.json
+
+No display is needed: the GL cases run on an offscreen OSMesa context,
+and are skipped when OSMesa isn't available. Exits with 1 when a case is
+slower than the baseline by more than --threshold.
+
+benchmarks/baseline.json is the reference baseline, committed with the
+repository and used unless --baseline names another. It was recorded on
+the machine in its "machine" field, without OSMesa, so its GL cases are
+skipped and have nothing to compare against. Timings only compare on
+similar machines. To compare against your own machine, store a baseline
+elsewhere first:
+
+    python benchmarks/run.py --save-baseline --baseline local.json
+    python benchmarks/run.py --baseline local.json
+
+Update the committed baseline only when a change is meant to move the
+reference timings.
+"""
+
+# imports
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+# Must be set before OpenGL is first imported, by any module
+os.environ.setdefault("PYOPENGL_PLATFORM", "osmesa")
+
+import harness
+
+# constants
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODULES = ("bench_noise", "bench_mesher", "bench_atlas", "bench_uploads")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_THRESHOLD = 0.25  # Allowed slowdown before a case counts as a regression
+
+
+def run(pattern, repeats, min_time):
+    """
+    Runs the cases whose name contains pattern. Returns {case: result}.
+
+    :param pattern: A substring of the case names to run.
+    :param repeats: Repeats per case.
+    :param min_time: The minimum duration of a repeat, in seconds.
+    """
+    for name in MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:  # A missing dependency skips the module's cases
+            print("skipping {}: {}".format(name, e), file=sys.stderr)
+
+    results = {}
+    context = None
+    for name, (function, gl) in sorted(harness.cases.items()):
+        if pattern not in name:
+            continue
+        try:
+            if gl and context is None:
+                context = harness.offscreen_context()
+            target, units, unit = function()
+            times = harness.measure(target, repeats, min_time)
+        except Exception as e:
+            results[name] = {"skipped": "{}: {}".format(type(e).__name__, e)}
+            print("{:<28} skipped ({})".format(name, results[name]["skipped"]), file=sys.stderr)
+            continue
+
+        times.sort()
+        median = times[len(times) // 2]
+        results[name] = {
+            "median_s": median,
+            "min_s": times[0],
+            "max_s": times[-1],
+            "repeats": len(times),
+            "throughput": units / median,
+            "unit": unit + "/s",
+        }
+        print("{:<28} {:10.3f} ms  {:12.1f} {}".format(name, median * 1000, units / median, unit + "/s"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PyCraft micro-benchmarks")
+    parser.add_argument("-k", dest="pattern", default="", help="only run cases whose name contains this")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown, as a fraction (default %(default)s)")
+    parser.add_argument("--repeats", type=int, default=harness.REPEATS)
+    parser.add_argument("--min-time", type=float, default=harness.MIN_TIME)
+    args = parser.parse_args()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": harness.machine(),
+        "results": run(args.pattern, args.repeats, args.min_time),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved the baseline to {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --save-baseline".format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("machine") != report["machine"]:
+        print("Warning: the baseline was recorded on a different machine", file=sys.stderr)
+
+    regressions = harness.compare(report["results"], baseline["results"], args.threshold)
+    unmatched = sorted(name for name, result in report["results"].items()
+                       if "median_s" in result and "median_s" not in baseline["results"].get(name, {}))
+    if unmatched:
+        print("Not in the baseline, so not compared: {}".format(", ".join(unmatched)))
+    for name, ratio in sorted(regressions.items()):
+        print("REGRESSION {:<28} {:.2f}x slower than the baseline".format(name, ratio))
+    if not regressions:
+        print("No regressions (threshold {:.0%})".format(args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# imports
+import bisect
+
+
+class Allocator:
+    """
+    Allocator
+
+    Hands out regions of a fixed range [0, capacity) using a sorted free list.
+    Freed regions are merged with their free neighbours, and compact() slides
+    every used region down to remove fragmentation.
+    Units are up to the caller (bytes, vertices, ...).
+    """
+
+    def __init__(self, capacity, alignment=1):
+        """
+        Initializes the allocator with the whole range free.
+
+        :param capacity: The size of the range.
+        :param alignment: Every region starts at a multiple of this.
+        """
+        self.capacity = capacity
+        self.alignment = alignment
+        self.free_list = [(0, capacity)]  # Sorted (offset, size) pairs
+        self.used = {}  # offset -> size
+
+    @property
+    def used_space(self):
+        """
+        The total size of the used regions.
+        """
+        return sum(self.used.values())
+
+    @property
+    def largest_free(self):
+        """
+        The size of the largest free region.
+        """
+        return max((size for _, size in self.free_list), default=0)
+
+    def alloc(self, size):
+        """
+        Allocates a region. Returns its offset, or None if no free region is
+        large enough.
+
+        :param size: The size of the region.
+        """
+        size = max(-(-size // self.alignment) * self.alignment, self.alignment)
+        for i, (offset, free_size) in enumerate(self.free_list):
+            if free_size >= size:
+                if free_size == size:
+                    del self.free_list[i]
+                else:
+                    self.free_list[i] = (offset + size, free_size - size)
+                self.used[offset] = size
+                return offset
+        return None
+
+    def reserve(self, offset, size):
+        """
+        Marks a known region as used, e.g. when rebuilding the allocator of
+        existing data. The region must be free.
+
+        :param offset: The offset of the region.
+        :param size: The size of the region.
+        """
+        size = max(-(-size // self.alignment) * self.alignment, self.alignment)
+        i = bisect.bisect(self.free_list, (offset, float("inf"))) - 1
+        if i < 0 or sum(self.free_list[i]) < offset + size:
+            raise ValueError("Region {}+{} isn't free".format(offset, size))
+        start, free_size = self.free_list.pop(i)
+        after = (offset + size, start + free_size - offset - size)
+        if after[1]:
+            self.free_list.insert(i, after)
+        if offset > start:
+            self.free_list.insert(i, (start, offset - start))
+        self.used[offset] = size
+
+    def free(self, offset):
+        """
+        Frees a region.
+
+        :param offset: The offset returned by alloc().
+        """
+        size = self.used.pop(offset)
+        i = bisect.bisect(self.free_list, (offset, size))
+
+        # Merge with the free region after, then the one before
+        if i < len(self.free_list) and self.free_list[i][0] == offset + size:
+            size += self.free_list.pop(i)[1]
+        if i > 0 and sum(self.free_list[i - 1]) == offset:
+            offset, before = self.free_list.pop(i - 1)
+            size += before
+            i -= 1
+        self.free_list.insert(i, (offset, size))
+
+    def size_of(self, offset):
+        """
+        Gets the size of a used region.
+
+        :param offset: The offset returned by alloc().
+        """
+        return self.used[offset]
+
+    def compact(self):
+        """
+        Moves every used region down so the free space is one region at the
+        end. Returns the moves as (old offset, new offset, size), in an order
+        that is safe to apply one by one.
+        """
+        moves = []
+        used = {}
+        end = 0
+        for offset in sorted(self.used):
+            size = self.used[offset]
+            if offset != end:
+                moves.append((offset, end, size))
+            used[end] = size
+            end += size
+        self.used = used
+        self.free_list = [(end, self.capacity - end)] if end < self.capacity else []
+        return moves
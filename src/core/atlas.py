@@ -0,0 +1,122 @@
+# imports
+import math
+
+
+def pack_shelves(sizes, width):
+    """
+    Packs rectangles into shelves: left to right along a shelf, then a new
+    shelf on top once a rectangle doesn't fit. Returns the (shelf, x, y) of
+    each rectangle and the height used, or None if one is wider than width.
+
+    :param sizes: The (width, height) of each rectangle, in packing order.
+    :param width: The width to pack into.
+    """
+    rects = []
+    shelf, x, y, shelf_height = 0, 0, 0, 0
+    for w, h in sizes:
+        if w > width:
+            return None
+        if x + w > width:
+            shelf, x, y, shelf_height = shelf + 1, 0, y + shelf_height, 0
+        rects.append((shelf, x, y))
+        x += w
+        shelf_height = max(shelf_height, h)
+    return rects, y + shelf_height
+
+
+class TextureAtlasGenerator:
+    """
+    TextureAtlasGenerator
+
+    Packs images into a square, power of two atlas that grows with its
+    contents, up to texture_size * n_textures pixels a side. Uniform tiles
+    stay aligned to their size, so the atlas can be mipmapped down to one
+    pixel per tile without tiles bleeding into each other.
+    Packing only needs the images' sizes: PIL is imported when the atlas
+    image is first pasted, and OpenGL not at all.
+    """
+
+    def __init__(self, texture_size=32, n_textures = 100):
+        self.max_size = texture_size * n_textures
+        self.texture_size = 1 << max(texture_size - 1, 0).bit_length()  # Grows as images are added
+        self.n_textures = n_textures
+        self.images = []
+        self.used = []
+        self.texture_atlas = None
+        self.cursor = (0, 0, 0, 0)  # (shelf, x, y, shelf height) where the next image goes
+
+    def place(self, w, h):
+        """
+        Places an image after the ones already packed, as pack_shelves()
+        would. Returns its (shelf, x, y, w, h), or None if it doesn't fit in
+        the atlas.
+
+        :param w: The width of the image.
+        :param h: The height of the image.
+        """
+        shelf, x, y, shelf_height = self.cursor
+        if w > self.texture_size:
+            return None
+        if x + w > self.texture_size:
+            shelf, x, y, shelf_height = shelf + 1, 0, y + shelf_height, 0
+        shelf_height = max(shelf_height, h)
+        if y + shelf_height > self.texture_size:
+            return None
+        self.cursor = (shelf, x + w, y, shelf_height)
+        return shelf, x, y, w, h
+
+    def add(self, image):
+        # Add image to texture atlas, only repacking into a larger one if it doesn't fit.
+        if len(self.images) != len(self.used):
+            raise Exception("Can't add to an atlas loaded from the cache.")
+        rect = self.place(*image.size)
+        if rect is None:
+            sizes = [img.size for img in self.images] + [image.size]
+            size = max(2 * self.texture_size, 1 << (max(image.size) - 1).bit_length())
+            while True:
+                if size > self.max_size:
+                    raise Exception("Texture atlas is full.")
+                packed = pack_shelves(sizes, size)
+                if packed is not None and packed[1] <= size:
+                    break
+                size *= 2
+
+            self.texture_size = size
+            self.used = [(shelf, x, y, w, h) for (shelf, x, y), (w, h) in zip(packed[0], sizes)]
+            shelf, x, y, w, h = self.used[-1]
+            self.cursor = (shelf, x + w, y, packed[1] - y)
+        else:
+            self.used.append(rect)
+
+        self.images.append(image)
+        self.texture_atlas = None  # Pasted again on demand
+        return self.used[-1]
+
+    def get_texture_atlas(self):
+        if self.texture_atlas is None:
+            from PIL import Image
+
+            self.texture_atlas = Image.new("RGBA", (self.texture_size, self.texture_size), (0, 0, 0, 0))
+            for image, (_, x, y, _, _) in zip(self.images, self.used):
+                self.texture_atlas.paste(image, (x, y))
+        return self.texture_atlas
+
+    def save(self, path):
+        self.get_texture_atlas().save(path)
+
+    def get_rect(self, index):
+        side, x, y, w, h = self.used[index]
+        return side, x, y, w, h
+
+    def get_mip_levels(self):
+        """
+        The number of mip levels that keep every tile apart: as many as
+        the tiles' sizes and positions stay divisible by. An empty atlas
+        has one.
+        """
+        if not self.used:
+            return 1
+        bits = 0
+        for _, x, y, w, h in self.used:
+            bits |= x | y | w | h
+        return int(math.log2(bits & -bits)) + 1
@@ -1,12 +1,52 @@
 # imports
 import ctypes
-import random
 
 import numpy as np
 from OpenGL.GL import *
 
-# TODO: Make this configurable
-VBO_SIZE = 1000000
+from core.allocator import Allocator
+from core.config import BUFFER_SIZE
+
+# constants
+flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+SIGNALED = (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED)
+
+
+def copy_buffer(src, dst, src_offset, dst_offset, size):
+    """
+    Copies a range of one buffer object to another on the GPU, after the
+    commands already issued. The ranges may overlap if src is dst; the copy
+    is then split into steps that don't.
+
+    :param src: The source GL buffer name.
+    :param dst: The destination GL buffer name.
+    :param src_offset: The source offset, in bytes.
+    :param dst_offset: The destination offset, in bytes.
+    :param size: The number of bytes.
+    """
+    if size <= 0 or (src == dst and src_offset == dst_offset):
+        return
+    step = abs(dst_offset - src_offset) if src == dst else size
+    glBindBuffer(GL_COPY_READ_BUFFER, src)
+    glBindBuffer(GL_COPY_WRITE_BUFFER, dst)
+    # Moving down copies front to back, moving up back to front, so no step
+    # reads what an earlier one wrote
+    starts = range(0, size, step)
+    for start in (starts if dst_offset <= src_offset else reversed(starts)):
+        glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, src_offset + start, dst_offset + start,
+                            min(step, size - start))
+    glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+    glBindBuffer(GL_COPY_READ_BUFFER, 0)
+
+
+def signalled(fence):
+    """
+    Whether a fence has signalled, without waiting for it. No fence counts
+    as signalled.
+
+    :param fence: A fence from glFenceSync(), or None.
+    """
+    return fence is None or glClientWaitSync(fence, 0, 0) in SIGNALED
 
 
 class Buffer:
@@ -14,66 +54,219 @@ class Buffer:
     Buffer
 
     This is a wrapper for OpenGL buffer objects.
-    It supports persistent mapping.
+    The buffer is persistently and coherently mapped once, so writes go
+    straight to the mapped memory with no map/unmap or flush per write.
+    Writes are visible to the GPU immediately: don't overwrite a range that
+    a frame in flight is still drawing from.
+    The mapping is write only, so the buffer is never read through it:
+    copies within and between buffers are done by the GPU.
     """
 
-    def __init__(self, id):
+    def __init__(self, id, size=BUFFER_SIZE, target=GL_ARRAY_BUFFER):
         """
         Initializes the buffer.
+
+        :param id: The ID of the buffer.
+        :param size: The size of the buffer, in bytes.
+        :param target: The binding target.
         """
         self.id = id
+        self.size = size
+        self.target = target
+        self.allocator = Allocator(size)
         self.buf = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.buf)
+        glBindBuffer(self.target, self.buf)
 
-        # Allocate storage for the buffer using glBufferStorage and specify the desired storage flags
-        glBufferStorage(GL_ARRAY_BUFFER, VBO_SIZE, None,
-                        GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT)
+        # Allocate immutable storage that can stay mapped while we draw from it
+        glBufferStorage(self.target, self.size, None, flags)
+        self.map_buffer()
 
     def map_buffer(self):
         """
         Maps the buffer to memory.
         """
         # Bind the buffer
-        glBindBuffer(GL_ARRAY_BUFFER, self.buf)
+        glBindBuffer(self.target, self.buf)
 
-        # Map the buffer to memory using glMapBufferRange
-        ptr = glMapBufferRange(GL_ARRAY_BUFFER, 0, VBO_SIZE,
-                               GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT)
+        # Map the whole buffer, once, for as long as it lives
+        ptr = glMapBufferRange(self.target, 0, self.size, flags)
+        self.ptr = ctypes.cast(ptr, ctypes.c_void_p).value
 
-        # Create a pointer to the data buffer object
-        self.data_ptr = ctypes.cast(ptr, ctypes.POINTER(GLfloat * VBO_SIZE))
+        # Byte view of the mapped memory
+        self.data = np.ctypeslib.as_array((ctypes.c_ubyte * self.size).from_address(self.ptr))
 
     def unmap_buffer(self):
         """
         Unmaps the buffer.
         """
-        # Unmap the buffer
-        glUnmapBuffer(GL_ARRAY_BUFFER)
+        self.data = None
+        glBindBuffer(self.target, self.buf)
+        glUnmapBuffer(self.target)
+        glBindBuffer(self.target, 0)
 
-        # Unbind the buffer
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
+    def write(self, data, byte_offset=0):
+        """
+        Copies data into the buffer with a single memmove.
+
+        :param data: A NumPy array, memoryview or other buffer-protocol object.
+        :param byte_offset: The offset to start writing at, in bytes.
+        """
+        if not isinstance(data, np.ndarray):
+            data = np.frombuffer(data, dtype=np.uint8)
+        if not data.flags.c_contiguous:
+            data = np.ascontiguousarray(data)
+        if byte_offset < 0 or byte_offset + data.nbytes > self.size:
+            raise ValueError("Write of {} bytes at {} overflows buffer {} ({} bytes)".format(
+                data.nbytes, byte_offset, self.id, self.size))
+        ctypes.memmove(self.ptr + byte_offset, data.ctypes.data, data.nbytes)
 
     def modify(self, data, offset=0):
         """
         Adds data to the buffer.
 
-        :param data: The data to add to the buffer.
-        :param offset: The offset to start writing at.
+        :param data: The data to add to the buffer: a NumPy array, a
+                     memoryview, or a sequence of GLfloats.
+        :param offset: The offset to start writing at, in elements of data.
         """
-        # Modify the buffer
-        self.map_buffer()
-        self.data_ptr.contents[offset:offset + len(data)] = data
-        glFlush()
-        self.unmap_buffer()
-    
+        if not isinstance(data, (np.ndarray, memoryview)):
+            data = np.asarray(data, dtype=np.float32)
+        self.write(data, offset * data.itemsize)
+
+    def copy(self, src_offset, dst_offset, size):
+        """
+        Copies a range of the buffer to another place in it, on the GPU.
+        The ranges may overlap.
+
+        :param src_offset: The source offset, in bytes.
+        :param dst_offset: The destination offset, in bytes.
+        :param size: The number of bytes.
+        """
+        copy_buffer(self.buf, self.buf, src_offset, dst_offset, size)
+
+    def alloc(self, size):
+        """
+        Allocates a region of the buffer. Returns its byte offset, or None if
+        the buffer is full.
+
+        :param size: The size of the region, in bytes.
+        """
+        return self.allocator.alloc(size)
+
+    def free(self, offset):
+        """
+        Frees a region of the buffer.
+
+        :param offset: The byte offset returned by alloc().
+        """
+        self.allocator.free(offset)
+
+    def compact(self, fence=None):
+        """
+        Moves every allocated region down to the start of the buffer.
+        Returns the moves as (old offset, new offset, size), so owners can
+        update their offsets, or None if nothing was moved because the fence
+        hasn't signalled.
+
+        :param fence: Optional fence placed after the last draw from the
+                      buffer; regions only move once it has signalled.
+        """
+        if not signalled(fence):
+            return None
+        moves = self.allocator.compact()
+        for src, dst, size in moves:
+            self.copy(src, dst, size)
+        return moves
+
     def bind(self):
         """
         Binds the buffer.
         """
-        glBindBuffer(GL_ARRAY_BUFFER, self.buf)
-        
+        glBindBuffer(self.target, self.buf)
+
     def __del__(self):
         """
-        Deletes the buffer.
+        Unmaps and deletes the buffer.
+        """
+        if self.data is not None:
+            self.unmap_buffer()
+        glDeleteBuffers(1, [self.buf])
+
+
+class Arena:
+    """
+    Arena
+
+    A set of parallel buffers, one per vertex attribute, sharing a single
+    allocator counted in vertices. A region holds the same vertex range in
+    every buffer, so one draw call can use them all.
+    """
+
+    def __init__(self, id, strides, size=BUFFER_SIZE):
+        """
+        Initializes the arena.
+
+        :param id: The ID of the arena.
+        :param strides: The size of one vertex in each buffer, in bytes.
+        :param size: The size of the largest buffer, in bytes.
+        """
+        self.id = id
+        self.strides = tuple(strides)
+        self.capacity = size // max(self.strides)
+        self.allocator = Allocator(self.capacity)
+        self.buffers = [Buffer("{}_{}".format(id, i), self.capacity * stride)
+                        for i, stride in enumerate(self.strides)]
+
+    def alloc(self, count):
+        """
+        Allocates room for some vertices. Returns the first vertex, or None
+        if the arena is full.
+
+        :param count: The number of vertices.
+        """
+        return self.allocator.alloc(count)
+
+    def free(self, first):
+        """
+        Frees a region.
+
+        :param first: The first vertex, as returned by alloc().
+        """
+        self.allocator.free(first)
+
+    def write(self, index, data, first):
+        """
+        Writes one attribute of some vertices.
+
+        :param index: The buffer (attribute) index.
+        :param data: A contiguous NumPy array.
+        :param first: The first vertex to write.
+        """
+        self.buffers[index].write(data, first * self.strides[index])
+
+    def copy_to(self, other, src_first, dst_first, count):
+        """
+        Copies vertices to another arena with the same strides, on the GPU.
+
+        :param other: The destination arena (may be this one).
+        :param src_first: The first source vertex.
+        :param dst_first: The first destination vertex.
+        :param count: The number of vertices.
+        """
+        for stride, src, dst in zip(self.strides, self.buffers, other.buffers):
+            copy_buffer(src.buf, dst.buf, src_first * stride, dst_first * stride, count * stride)
+
+    def compact(self, fence=None):
+        """
+        Moves every region down to the start of the arena.
+        Returns the moves as (old first, new first, count), or None if
+        nothing was moved because the fence hasn't signalled.
+
+        :param fence: Optional fence placed after the last draw from the
+                      arena; regions only move once it has signalled.
         """
-        glDeleteBuffers(1, [self.buf])
\ No newline at end of file
+        if not signalled(fence):
+            return None
+        moves = self.allocator.compact()
+        for src, dst, count in moves:
+            self.copy_to(self, src, dst, count)
+        return moves
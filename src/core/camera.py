@@ -1,10 +1,15 @@
 # imports
+import logging
 import math
 
 import glfw
 from OpenGL.GL import glRotatef, glTranslatef
 
-from core import logger
+from core.collision import player_box, sweep
+from core.config import TICK_RATE
+from core.raycast import look_direction, raycast
+
+logger = logging.getLogger("PyCraft")
 
 ##################################################
 # Player class                                   #
@@ -16,6 +21,11 @@ class FPC:
     First Person Camera
 
     The player class for PyCraft.
+    Movement runs in tick(), at the window's fixed tick rate. Speeds are
+    given per tick at TICK_RATE, and scaled by the tick's length, so
+    changing TICK_RATE doesn't change how fast the player moves. drawcall() only turns the camera with the mouse and places it
+    between the last two ticks, for smooth motion at any frame rate.
+    With a CameraPath set as path, ticks replay it instead of reading input.
     """
 
     def __init__(self, window=None, world=None):
@@ -29,6 +39,8 @@ class FPC:
         # Set properties
         self.window = window
         self.world = world
+        self.path = None  # CameraPath replayed instead of the input
+        self.recording = None  # CameraPath every tick is appended to
 
         # Lock mouse pointer
         self.lock = True
@@ -39,6 +51,8 @@ class FPC:
         self.state = {
             "mouse_delta": [0, 0],
             "position": [0, 130, 0],
+            "previous_position": [0, 130, 0],  # Position at the previous tick
+            "view_position": [0, 130, 0],  # Interpolated position drawn this frame
             "rotation": [0, 0, 0],
             "velocity": [0, 0, 0],
             "friction": 0.9,
@@ -49,12 +63,28 @@ class FPC:
             "fly": False,
         }
 
-    def drawcall(self):
+    def raycast(self, max_distance=8.0):
+        """
+        Finds the block the player is looking at. See raycast.raycast().
+
+        :param max_distance: The reach, in blocks.
+        """
+        return raycast(self.world, self.state["position"], look_direction(self.state["rotation"]), max_distance)
+
+    def tick(self, dt):
         """
-        Update the player on drawcall.
+        Update the player on tick: input, movement and collision.
+
+        :param dt: The tick length, in seconds.
         """
-        # Get the state
-        sens = self.state["speed"]
+        self.state["previous_position"] = list(self.state["position"])
+        if self.path is not None:
+            self.path.step(self)
+            return
+
+        # Get the state; speeds are per tick at TICK_RATE
+        step = dt * TICK_RATE
+        sens = self.state["speed"] * step
         rotY = math.radians(-self.state["rotation"][1])
         dx, dz = math.sin(rotY), math.cos(rotY)
 
@@ -87,8 +117,46 @@ class FPC:
                                 glfw.CURSOR, glfw.CURSOR_DISABLED)
             self.lock = True
 
+        # SHIFT to fly down
+        if glfw.get_key(self.window.window, glfw.KEY_LEFT_SHIFT) == glfw.PRESS:
+            self.state["velocity"][1] -= 0.05 * step
+        # SPACE to fly up
+        if glfw.get_key(self.window.window, glfw.KEY_SPACE) == glfw.PRESS:
+            self.state["velocity"][1] += 0.05 * step
+
+        # Move, stopping at solid blocks along the whole path
+        if self.world is not None:
+            mins, maxs = player_box(self.state["position"])
+            moved, hit = sweep(self.world, mins, maxs, [v * step for v in self.state["velocity"]])
+            for axis in range(3):
+                self.state["position"][axis] += float(moved[axis])
+                if hit[axis]:
+                    self.state["velocity"][axis] = 0
+        else:
+            self.state["position"][0] += self.state["velocity"][0] * step
+            self.state["position"][1] += self.state["velocity"][1] * step
+            self.state["position"][2] += self.state["velocity"][2] * step
+
+        # Apply friction
+        friction = self.state["friction"] ** step
+        self.state["velocity"][0] *= friction
+        self.state["velocity"][1] *= friction
+        self.state["velocity"][2] *= friction
+        
+        # Apply gravity
+        # self.state["velocity"][1] -= self.state["gravity"] / 100
+        # if self.state["velocity"][1] < -self.state["terminal_velocity"]:
+        #     self.state["velocity"][1] = -self.state["terminal_velocity"]
+
+        if self.recording is not None:
+            self.recording.record(self)
+
+    def drawcall(self):
+        """
+        Update the player on drawcall: mouse look, and the view.
+        """
         # mouse rotation: get dx and dy
-        if self.lock:
+        if self.lock and self.path is None:
             current_position = glfw.get_cursor_pos(self.window.window)
             dx = current_position[0] - self.state["mouse_delta"][0]
             dy = current_position[1] - self.state["mouse_delta"][1]
@@ -101,44 +169,13 @@ class FPC:
                 self.state["rotation"][0] = -90
             self.state["mouse_delta"] = current_position  # update mouse delta
 
-        # SHIFT to fly down
-        if glfw.get_key(self.window.window, glfw.KEY_LEFT_SHIFT) == glfw.PRESS:
-            self.state["velocity"][1] -= 0.05
-        # SPACE to fly up
-        if glfw.get_key(self.window.window, glfw.KEY_SPACE) == glfw.PRESS:
-            self.state["velocity"][1] += 0.05
-
-        self.state["position"][0] += self.state["velocity"][0]
-        self.state["position"][1] += self.state["velocity"][1]
-        self.state["position"][2] += self.state["velocity"][2]
+        # Interpolate between the last two ticks
+        alpha = self.window.alpha
+        previous, position = self.state["previous_position"], self.state["position"]
+        view = [p + (c - p) * alpha for p, c in zip(previous, position)]
+        self.state["view_position"] = view
 
-        # Apply friction
-        self.state["velocity"][0] *= self.state["friction"]
-        self.state["velocity"][1] *= self.state["friction"]
-        self.state["velocity"][2] *= self.state["friction"]
-        
-        # Apply gravity
-        # self.state["velocity"][1] -= self.state["gravity"] / 100
-        # if self.state["velocity"][1] < -self.state["terminal_velocity"]:
-        #     self.state["velocity"][1] = -self.state["terminal_velocity"]
-        
-        # Check for collision
-        collision = self.world.check_collision(self.state["position"])
-        if collision[0] and self.state["velocity"][1] < 0:
-            self.state["velocity"][1] = 0
-        if collision[1] and self.state["velocity"][1] > 0:
-            self.state["velocity"][1] = 0
-        if collision[2] or collision[3] and self.state["velocity"][0] > 0:
-            self.state["velocity"][0] = 0
-        if collision[4] or collision[5] and self.state["velocity"][0] < 0:
-            self.state["velocity"][0] = 0
-        if collision[6] or collision[7] and self.state["velocity"][2] > 0:
-            self.state["velocity"][2] = 0
-        if collision[8] or collision[9] and self.state["velocity"][2] < 0:
-            self.state["velocity"][2] = 0
-        
         # Draw the player
         glRotatef(-self.state["rotation"][0], 1, 0, 0)
         glRotatef(-self.state["rotation"][1], 0, 1, 0)
-        glTranslatef(-self.state["position"][0], -
-                     self.state["position"][1], -self.state["position"][2])
\ No newline at end of file
+        glTranslatef(-view[0], -view[1], -view[2])
\ No newline at end of file
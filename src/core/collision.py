@@ -0,0 +1,168 @@
+# imports
+import numpy as np
+
+from core.world import BLOCKS, PLAYER_EYE, PLAYER_HEIGHT, PLAYER_RADIUS
+
+# constants
+# Whether each block id stops movement. Unknown ids are not solid.
+SOLID = np.zeros(1 << 16, dtype=bool)
+for _id, _block in BLOCKS.items():
+    SOLID[_id] = _block["solid"]
+
+SKIN = 1e-6  # Gap left between a box and the block that stopped it
+AXES = (1, 0, 2)  # Resolve y first, so landing happens before sliding
+CLUSTER_SIZE = 32  # Side of the grid cells, in blocks, batched boxes and rays are grouped by
+
+
+def player_box(position):
+    """
+    Returns the (mins, maxs) collision box of the player.
+
+    :param position: The camera position.
+    """
+    x, y, z = position
+    feet = y - PLAYER_EYE
+    return (x - PLAYER_RADIUS, feet, z - PLAYER_RADIUS), (x + PLAYER_RADIUS, feet + PLAYER_HEIGHT, z + PLAYER_RADIUS)
+
+
+def clusters(points, size=CLUSTER_SIZE):
+    """
+    Groups points by the grid cell they fall in, so a batch query reads one
+    small region per group of nearby entities instead of one spanning all
+    of them. Returns a list of index arrays.
+
+    :param points: (n, 3) array of points.
+    :param size: The grid cell side, in blocks.
+    """
+    cells = np.floor(np.asarray(points, dtype=np.float64).reshape(-1, 3) / size).astype(np.int64)
+    if not len(cells):
+        return []
+    _, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(inverse[order])) + 1)
+
+
+def _integral(solid):
+    """
+    Builds the summed volume table of a boolean grid: table[x, y, z] is the
+    number of solid cells in [0, x) x [0, y) x [0, z).
+
+    :param solid: The grid.
+    """
+    table = np.zeros(tuple(n + 1 for n in solid.shape), dtype=np.int32)
+    table[1:, 1:, 1:] = solid.cumsum(axis=0, dtype=np.int32).cumsum(axis=1).cumsum(axis=2)
+    return table
+
+
+def _count(table, lo, hi):
+    """
+    Counts the solid cells in boxes [lo, hi), for many boxes at once.
+
+    :param table: The table from _integral().
+    :param lo: (n, 3) int array of lower corners.
+    :param hi: (n, 3) int array of upper corners (exclusive).
+    """
+    x0, y0, z0 = lo.T
+    x1, y1, z1 = np.maximum(hi, lo).T
+    return (table[x1, y1, z1] - table[x0, y1, z1] - table[x1, y0, z1] - table[x1, y1, z0]
+            + table[x0, y0, z1] + table[x0, y1, z0] + table[x1, y0, z0] - table[x0, y0, z0])
+
+
+def sweep_boxes(world, mins, maxs, velocities):
+    """
+    Moves many boxes by their velocities, stopping each at the first solid
+    block in its way, one axis at a time (y, then x, then z).
+
+    Boxes are grouped into clusters of nearby ones (see clusters()), and
+    the blocks around each cluster's paths are read from the world with a
+    single get_region() call, so the batch costs grow with the number of
+    boxes rather than the distance between them. Each axis is then resolved
+    for every box of a cluster at once, with a binary search over a summed
+    volume table, so fast boxes can't tunnel through blocks and cost only a
+    few more steps.
+
+    Returns (moved, hit): the (n, 3) distance each box actually moved, and
+    whether it was stopped along each axis.
+
+    :param world: The World.
+    :param mins: (n, 3) array of box minimum corners.
+    :param maxs: (n, 3) array of box maximum corners.
+    :param velocities: (n, 3) array of movements.
+    """
+    mins = np.array(mins, dtype=np.float64).reshape(-1, 3)
+    maxs = np.array(maxs, dtype=np.float64).reshape(-1, 3)
+    velocities = np.asarray(velocities, dtype=np.float64).reshape(-1, 3)
+    moved = np.zeros_like(velocities)
+    hit = np.zeros(velocities.shape, dtype=bool)
+    for group in clusters(mins):
+        moved[group], hit[group] = _sweep_cluster(world, mins[group], maxs[group], velocities[group])
+    return moved, hit
+
+
+def _sweep_cluster(world, mins, maxs, velocities):
+    """
+    Moves a cluster of boxes, reading the blocks around them at once. See
+    sweep_boxes(); mins and maxs are moved in place.
+    """
+    moved = np.zeros_like(velocities)
+    hit = np.zeros(velocities.shape, dtype=bool)
+    origin = np.floor(np.minimum(mins, mins + velocities).min(axis=0)).astype(np.int64)
+    end = np.ceil(np.maximum(maxs, maxs + velocities).max(axis=0)).astype(np.int64)
+    table = _integral(SOLID[world.get_region(*origin, *end)])
+
+    for axis in AXES:
+        d = velocities[:, axis]
+        forward = d > 0
+
+        # The cells the box covers, and the cells it enters along the axis
+        lo = np.floor(mins).astype(np.int64) - origin
+        hi = np.ceil(maxs).astype(np.int64) - origin
+        start = np.where(forward, np.ceil(maxs[:, axis]), np.floor(mins[:, axis] + d)).astype(np.int64) - origin[axis]
+        stop = np.where(forward, np.ceil(maxs[:, axis] + d), np.floor(mins[:, axis])).astype(np.int64) - origin[axis]
+        length = np.maximum(stop - start, 0)
+
+        def blocked(k):
+            # Whether any of the first k entered cells is solid
+            lo_k, hi_k = lo.copy(), hi.copy()
+            lo_k[:, axis] = np.where(forward, start, stop - k)
+            hi_k[:, axis] = np.where(forward, start + k, stop)
+            return _count(table, lo_k, hi_k) > 0
+
+        # Binary search for the first solid cell: blocked(low) is False and
+        # blocked(high) is True
+        stopped = blocked(length)
+        low, high = np.zeros_like(length), length.copy()
+        while True:
+            searching = stopped & (high - low > 1)
+            if not searching.any():
+                break
+            mid = (low + high) // 2
+            solid = blocked(mid)
+            high = np.where(searching & solid, mid, high)
+            low = np.where(searching & ~solid, mid, low)
+
+        cell = np.where(forward, start + high - 1, stop - high) + origin[axis]
+        limit = np.where(forward, np.maximum(cell - maxs[:, axis] - SKIN, 0),
+                         np.minimum(cell + 1 - mins[:, axis] + SKIN, 0))
+        d = np.where(stopped, limit, d)
+
+        moved[:, axis] = d
+        hit[:, axis] = stopped
+        mins[:, axis] += d
+        maxs[:, axis] += d
+    return moved, hit
+
+
+def sweep(world, mins, maxs, velocity):
+    """
+    Moves one box by its velocity, stopping at solid blocks.
+    See sweep_boxes().
+
+    :param world: The World.
+    :param mins: The box minimum corner.
+    :param maxs: The box maximum corner.
+    :param velocity: The movement.
+    """
+    moved, hit = sweep_boxes(world, [mins], [maxs], [velocity])
+    return moved[0], hit[0]
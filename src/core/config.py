@@ -0,0 +1,40 @@
+##################################################
+# CONFIG.PY
+# Engine settings. Edit these to tune PyCraft for
+# your machine.
+##################################################
+
+# Buffers
+BUFFER_SIZE = 64 * 1024 * 1024  # Bytes per persistently mapped GL buffer
+STREAM_SIZE = 3 * 8 * 1024 * 1024  # Bytes of staging memory for background uploads
+STREAM_REGIONS = 3  # Staging regions in flight at once (triple buffering)
+
+# Window
+WINDOW_SIZE = (800, 600)  # Size of the window, and of the framebuffer when headless
+
+# Rendering
+RENDER_DISTANCE = 8  # Chunks drawn around the camera, horizontally
+LOD_DISTANCES = (4, 8, 16)  # Chunks from the camera where 2x, 4x and 8x coarser meshes start
+LOD_HYSTERESIS = 0.5  # Chunks past a LOD distance before a chunk changes level
+LOD_REMESH_PER_TICK = 4  # Chunks sent back to be remeshed at another level per tick
+REMESH_SECTIONS_PER_FRAME = 8  # Edited sections remeshed and patched in per frame, nearest first
+
+# Textures
+ATLAS_CACHE_DIR = "assets/textures/cache"  # Built atlases, keyed by a hash of their source textures
+
+# Saves
+SAVE_DIR = "saves/world"  # Region files of the world, see core/region.py
+MAX_PENDING_SAVES = 256  # Chunks waiting for the background writer before save() blocks
+
+# Simulation
+TICK_RATE = 60  # Simulation ticks per second, independent of the frame rate
+MAX_TICKS_PER_FRAME = 5  # Ticks run to catch up before the backlog is dropped
+
+# Shared context
+SHARED_CONTEXT_BUDGET = 0.004  # Seconds of shared context jobs (uploads) run per frame drawn
+MAX_SHARED_JOBS = 256  # Jobs queued for the shared context before JobScheduler.submit() blocks
+SHARED_CONTEXT_POLL = 0.01  # Seconds between runs of objects scheduled with schedule_shared_context()
+
+# Profiling
+PROFILER_ENABLED = False  # Time frames and scheduled objects (Window.profiler)
+PROFILER_SAMPLES = 600  # Samples per zone kept for the p50/p99
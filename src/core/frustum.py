@@ -0,0 +1,100 @@
+# imports
+import math
+
+import numpy as np
+
+
+def perspective(fov, aspect, near, far):
+    """
+    Builds a perspective projection matrix, like gluPerspective.
+
+    :param fov: The vertical field of view, in degrees.
+    :param aspect: The width / height ratio.
+    :param near: The near plane distance.
+    :param far: The far plane distance.
+    """
+    f = 1 / math.tan(math.radians(fov) / 2)
+    return np.array([
+        [f / aspect, 0, 0, 0],
+        [0, f, 0, 0],
+        [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+        [0, 0, -1, 0],
+    ], dtype=np.float64)
+
+
+def view_matrix(position, rotation):
+    """
+    Builds the view matrix FPC.drawcall applies: rotate by -pitch around x,
+    then by -yaw around y, then translate by -position.
+
+    :param position: The camera position.
+    :param rotation: The camera rotation (pitch, yaw, roll) in degrees.
+    """
+    pitch, yaw = math.radians(-rotation[0]), math.radians(-rotation[1])
+    cp, sp = math.cos(pitch), math.sin(pitch)
+    cy, sy = math.cos(yaw), math.sin(yaw)
+    rx = np.array([[1, 0, 0, 0], [0, cp, -sp, 0], [0, sp, cp, 0], [0, 0, 0, 1]])
+    ry = np.array([[cy, 0, sy, 0], [0, 1, 0, 0], [-sy, 0, cy, 0], [0, 0, 0, 1]])
+    translate = np.identity(4)
+    translate[:3, 3] = -np.asarray(position, dtype=np.float64)
+    return rx @ ry @ translate
+
+
+def extract_planes(matrix):
+    """
+    Extracts the 6 frustum planes (left, right, bottom, top, near, far) from
+    a projection @ view matrix. Returns a (6, 4) array of normalized
+    (a, b, c, d) planes, with normals pointing into the frustum.
+
+    :param matrix: The combined 4x4 matrix (row-major, column vectors).
+    """
+    m = np.asarray(matrix, dtype=np.float64)
+    planes = np.array([
+        m[3] + m[0], m[3] - m[0],
+        m[3] + m[1], m[3] - m[1],
+        m[3] + m[2], m[3] - m[2],
+    ])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def pack_boxes(mins, maxs):
+    """
+    Packs axis-aligned boxes for cull(): a (7, n) float32 array of centers,
+    half extents and a row of ones. Pack once, then cull every frame.
+
+    :param mins: (n, 3) array of box minimum corners.
+    :param maxs: (n, 3) array of box maximum corners.
+    """
+    mins = np.asarray(mins, dtype=np.float64).reshape(-1, 3)
+    maxs = np.asarray(maxs, dtype=np.float64).reshape(-1, 3)
+    boxes = np.ones((7, len(mins)), dtype=np.float32)
+    boxes[0:3] = ((mins + maxs) * 0.5).T
+    boxes[3:6] = ((maxs - mins) * 0.5).T
+    return boxes
+
+
+def cull(planes, boxes, position=None, distance=None):
+    """
+    Tests many axis-aligned boxes against the frustum at once.
+    Returns a boolean array, True for boxes that are (at least partly)
+    inside the frustum and within the distance.
+
+    :param planes: The frustum planes, from extract_planes().
+    :param boxes: The boxes, from pack_boxes().
+    :param position: The camera position, for the distance cutoff.
+    :param distance: The horizontal render distance, in blocks, or None.
+    """
+    # A box is outside a plane if even its corner furthest along the normal
+    # is behind it: center . n + extents . |n| + d < 0. All 6 planes are
+    # tested with a single (6, 7) @ (7, n) product.
+    weights = np.hstack((planes[:, :3], np.abs(planes[:, :3]), planes[:, 3:])).astype(np.float32)
+    visible = (weights @ boxes >= 0).all(axis=0)
+
+    if distance is not None:
+        # Distance from the camera to the nearest point of each box, in xz
+        dx = np.abs(boxes[0] - np.float32(position[0])) - boxes[3]
+        dz = np.abs(boxes[2] - np.float32(position[2])) - boxes[5]
+        np.maximum(dx, 0, out=dx)
+        np.maximum(dz, 0, out=dz)
+        visible &= dx * dx + dz * dz <= np.float32(distance * distance)
+    return visible
@@ -0,0 +1,325 @@
+# imports
+from collections import deque
+
+import numpy as np
+
+from core.world import BLOCKS, CHUNK_SIZE, WORLD_HEIGHT, chunk_key
+
+# constants
+MAX_LIGHT = 15
+# Light is stored as one byte per block: skylight in the high nibble, block
+# light in the low one
+SKY_SHIFT = 4
+BLOCK_MASK = 0x0F
+FULL_SKY = MAX_LIGHT << SKY_SHIFT  # Open sky, no block light: above the world and unloaded chunks
+
+# Light lost entering each block id: 1 through air, more through water, all
+# of it through opaque blocks. Unknown ids are opaque.
+ABSORB = np.full(1 << 16, MAX_LIGHT, dtype=np.int8)
+# Light given off by each block id
+EMISSION = np.zeros(1 << 16, dtype=np.int8)
+for _id, _block in BLOCKS.items():
+    if _block["transparent"]:
+        ABSORB[_id] = _block.get("absorb", 1)
+    EMISSION[_id] = _block.get("light", 0)
+
+# Vertex brightness: each light level is 80% as bright as the next, and
+# ambient occlusion darkens corners by how many of their 3 blocks are solid
+LIGHT_CURVE = 0.8 ** (MAX_LIGHT - np.arange(MAX_LIGHT + 1, dtype=np.float32))
+AO_CURVE = np.array((0.5, 0.7, 0.85, 1.0), dtype=np.float32)  # By ao value: 0 is the darkest
+
+# The (right, up) offsets of the 3 x 3 cells in front of a face, and for
+# each of its corners (0, 0), (1, 0), (0, 1), (1, 1), which of them touch it:
+# the cell in front, the sides along right and up, then the diagonal
+_NEIGHBOURHOOD = np.array([(dr, du) for du in (-1, 0, 1) for dr in (-1, 0, 1)])
+_CORNER_CELLS = np.array([
+    (4, 4 + dr, 4 + 3 * du, 4 + dr + 3 * du)
+    for du in (-1, 1) for dr in (-1, 1)
+])
+
+# Neighbour offsets; DOWN is the one skylight falls through without loss
+OFFSETS = ((1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1))
+DOWN = 3
+
+
+def sky_light(light):
+    """
+    Returns the skylight levels of packed light bytes.
+    """
+    return light >> SKY_SHIFT
+
+
+def block_light(light):
+    """
+    Returns the block light levels of packed light bytes.
+    """
+    return light & BLOCK_MASK
+
+
+def _shift(array, axis, step, fill):
+    """
+    Returns array[i - step] along an axis, filled where that is outside.
+    """
+    result = np.full_like(array, fill)
+    src = [slice(None)] * array.ndim
+    dst = [slice(None)] * array.ndim
+    if step > 0:
+        src[axis], dst[axis] = slice(None, -step), slice(step, None)
+    else:
+        src[axis], dst[axis] = slice(-step, None), slice(None, step)
+    result[tuple(dst)] = array[tuple(src)]
+    return result
+
+
+def compute_light(blocks):
+    """
+    Lights a block array from scratch, vectorized: the initial pass for a
+    newly generated chunk (see LightEngine for edits).
+    Full skylight falls straight down from above the array without loss
+    through clear blocks (ABSORB of 1), then both kinds of light spread
+    out, losing ABSORB of the block they enter, one step per iteration.
+    These are LightEngine's rules, so both give the same light.
+    Light from outside the array isn't known, so the array should include
+    a border of neighbours around the blocks that matter.
+
+    Returns the packed light bytes, same shape as blocks.
+
+    :param blocks: The (X, Y, Z) block ids; y is absolute only in that the
+                   top of the array is treated as open sky.
+    """
+    absorb = ABSORB[blocks].astype(np.int8)
+    passes = absorb < MAX_LIGHT
+
+    # Straight down from the top, as long as every block on the way is clear;
+    # the top layer is lit by the open sky above it whatever it holds
+    clear = np.minimum.accumulate((absorb == 1)[:, ::-1, :], axis=1)[:, ::-1, :]
+    sky = np.where(clear, MAX_LIGHT, 0).astype(np.int8)
+    sky[:, -1, :] = np.where(clear[:, -1, :], MAX_LIGHT, np.maximum(MAX_LIGHT - absorb[:, -1, :], 0))
+    block = EMISSION[blocks].astype(np.int8)
+
+    # Only the layers up to just above the highest unlit block can change
+    dark = (sky < MAX_LIGHT).any(axis=(0, 2))
+    top = min(int(np.nonzero(dark)[0].max()) + 2, blocks.shape[1]) if dark.any() else 0
+    for channel in (sky, block):
+        view, absorb_view, passes_view = channel[:, :top], absorb[:, :top], passes[:, :top]
+        emitted = view.copy()
+        for _ in range(MAX_LIGHT):
+            brightest = np.zeros_like(view)
+            for axis in range(3):
+                for step in (1, -1):
+                    np.maximum(brightest, _shift(view, axis, step, 0), out=brightest)
+            spread = np.where(passes_view, brightest - absorb_view, 0)
+            updated = np.maximum(np.maximum(spread, emitted), view)
+            if np.array_equal(updated, view):
+                break
+            view[...] = updated
+    return ((sky.astype(np.uint8) << SKY_SHIFT) | block.astype(np.uint8)).astype(np.uint8)
+
+
+def corner_values(blocks, light, axis, direction, right, up, mask):
+    """
+    Computes the smooth light and ambient occlusion at the 4 corners of
+    block faces in one direction, from the 4 cells touching each corner in
+    the layer in front of the face. Only the faces in mask are computed, so
+    the cost follows the number of visible faces.
+
+    Returns a (4, n) uint8 array of vertex brightness (0..255), one column
+    per face in np.nonzero(mask) order, corners ordered (right, up) =
+    (0, 0), (1, 0), (0, 1), (1, 1).
+
+    :param blocks: The padded block ids, shape (X + 2, Y + 2, Z + 2).
+    :param light: The padded packed light, same shape.
+    :param axis: The face's normal axis.
+    :param direction: The face's normal direction, 1 or -1.
+    :param right: The axis of the face's first corner coordinate.
+    :param up: The axis of its second corner coordinate.
+    :param mask: (X, Y, Z) booleans, the faces to compute.
+    """
+    # Padded coordinates of the 3 x 3 cells in front of each face
+    front = np.array(np.nonzero(mask)) + 1
+    front[axis] += direction
+    index = np.repeat(front[:, None, :], len(_NEIGHBOURHOOD), axis=1)
+    index[right] += _NEIGHBOURHOOD[:, 0, None]
+    index[up] += _NEIGHBOURHOOD[:, 1, None]
+    cells = tuple(index)
+    opaque = ABSORB[blocks[cells]] >= MAX_LIGHT
+    packed = light[cells]
+    levels = np.maximum(sky_light(packed), block_light(packed)).astype(np.float32)
+
+    # (4 corners, 4 cells: center, side along right, side along up, diagonal, n)
+    opaque, levels = opaque[_CORNER_CELLS], levels[_CORNER_CELLS]
+    side_r, side_u, diagonal = opaque[:, 1], opaque[:, 2], opaque[:, 3]
+    ao = np.where(side_r & side_u, 0, 3 - side_r.astype(np.int8) - side_u - diagonal)
+
+    # Average the cells light can reach; the diagonal is hidden when both
+    # sides are solid
+    reach = ~opaque
+    reach[:, 3] &= ~(side_r & side_u)
+    count = np.maximum(reach.sum(axis=1), 1)
+    level = (levels * reach).sum(axis=1) / count
+
+    brightness = np.interp(level, np.arange(MAX_LIGHT + 1), LIGHT_CURVE) * AO_CURVE[ao]
+    return np.rint(brightness * 255).astype(np.uint8)
+
+
+class LightEngine:
+    """
+    LightEngine
+
+    Keeps the light of loaded chunks (Chunk.light) up to date as blocks
+    change, with breadth-first flood fills: a removal pass clears the light
+    that came through a changed block, then an add pass spreads light back
+    in from its neighbours and any emitter. Only the cells whose light
+    actually changes are visited.
+    The sections around the cells whose light changed are marked dirty in
+    the world (World.mark_dirty()), to be remeshed with the new light.
+    """
+
+    def __init__(self, world):
+        """
+        Initializes the engine.
+
+        :param world: The World, whose chunks have their light computed.
+        """
+        self.world = world
+
+    def _cell(self, x, y, z):
+        """
+        Returns (light array, index) of a block, or None outside loaded
+        chunks and the world.
+        """
+        if not 0 <= y < WORLD_HEIGHT:
+            return None
+        chunk = self.world.chunks.get(chunk_key(x // CHUNK_SIZE, z // CHUNK_SIZE))
+        if chunk is None or chunk.light is None:
+            return None
+        return chunk.light, (x % CHUNK_SIZE, y, z % CHUNK_SIZE)
+
+    def get_light(self, x, y, z):
+        """
+        Returns a block's (skylight, block light).
+
+        :param x, y, z: The block position.
+        """
+        cell = self._cell(x, y, z)
+        if cell is None:
+            return (MAX_LIGHT, 0) if y >= 0 else (0, 0)
+        value = int(cell[0][cell[1]])
+        return value >> SKY_SHIFT, value & BLOCK_MASK
+
+    def set_block(self, x, y, z, block):
+        """
+        Sets a block and updates the light around it.
+
+        :param x, y, z: The block position.
+        :param block: The block id.
+        """
+        self.world.set_block(x, y, z, block)
+        self.update(x, y, z)
+
+    def update(self, x, y, z):
+        """
+        Updates the light after the block at a position changed.
+
+        :param x, y, z: The block position.
+        """
+        if self._cell(x, y, z) is None:
+            return
+        changed = []
+        for shift in (SKY_SHIFT, 0):
+            changed += self._relight(x, y, z, shift)
+        if changed:
+            changed = np.array(changed)
+            lo, hi = changed.min(axis=0), changed.max(axis=0) + 1
+            self.world.mark_dirty(*lo.tolist(), *hi.tolist())
+
+    def _relight(self, x, y, z, shift):
+        """
+        Updates one kind of light (selected by its nibble's shift) around a
+        changed block. Returns the positions whose light was set.
+        """
+        mask = BLOCK_MASK << shift
+        sky = shift == SKY_SHIFT
+        world = self.world
+        cells = {}
+        changed = []
+
+        def cell(x, y, z):
+            # Memoized _cell, for the duration of this update
+            key = (x, y, z)
+            if key not in cells:
+                cells[key] = self._cell(x, y, z)
+            return cells[key]
+
+        def get(c):
+            return (int(c[0][c[1]]) & mask) >> shift
+
+        def put(c, level, x, y, z):
+            array, index = c
+            array[index] = (int(array[index]) & ~mask & 0xFF) | (level << shift)
+            changed.append((x, y, z))
+
+        removals = deque()
+        adds = deque()
+        here = cell(x, y, z)
+        old = get(here)
+        if old:
+            put(here, 0, x, y, z)
+            removals.append((x, y, z, old))
+        block = world.get_block(x, y, z)
+        emitted = 0 if sky else int(EMISSION[block])
+        if sky and y == WORLD_HEIGHT - 1 and ABSORB[block] < MAX_LIGHT:
+            # Open to the sky above the world: only clear blocks take it whole
+            emitted = MAX_LIGHT if ABSORB[block] == 1 else MAX_LIGHT - int(ABSORB[block])
+        if emitted:
+            put(here, emitted, x, y, z)
+            adds.append((x, y, z))
+        # Light flows back in from every neighbour
+        for dx, dy, dz in OFFSETS:
+            if cell(x + dx, y + dy, z + dz) is not None:
+                adds.append((x + dx, y + dy, z + dz))
+
+        # Removal: clear what the old light lit, and requeue the neighbours
+        # lit by other sources
+        while removals:
+            rx, ry, rz, level = removals.popleft()
+            for i, (dx, dy, dz) in enumerate(OFFSETS):
+                nx, ny, nz = rx + dx, ry + dy, rz + dz
+                c = cell(nx, ny, nz)
+                if c is None:
+                    continue
+                neighbour = get(c)
+                if not neighbour:
+                    continue
+                falling = sky and i == DOWN and level == MAX_LIGHT and neighbour == MAX_LIGHT
+                if neighbour < level or falling:
+                    put(c, 0, nx, ny, nz)
+                    removals.append((nx, ny, nz, neighbour))
+                    source = 0 if sky else int(EMISSION[world.get_block(nx, ny, nz)])
+                    if source:
+                        put(c, source, nx, ny, nz)
+                        adds.append((nx, ny, nz))
+                else:
+                    adds.append((nx, ny, nz))
+
+        # Add: spread from the queued cells
+        while adds:
+            ax, ay, az = adds.popleft()
+            level = get(cell(ax, ay, az))
+            if level <= 1:
+                continue
+            for i, (dx, dy, dz) in enumerate(OFFSETS):
+                nx, ny, nz = ax + dx, ay + dy, az + dz
+                c = cell(nx, ny, nz)
+                if c is None:
+                    continue
+                absorb = int(ABSORB[world.get_block(nx, ny, nz)])
+                if absorb >= MAX_LIGHT:
+                    continue
+                new = level - absorb
+                if sky and i == DOWN and level == MAX_LIGHT and absorb == 1:
+                    new = MAX_LIGHT
+                if new > get(c):
+                    put(c, new, nx, ny, nz)
+                    adds.append((nx, ny, nz))
+        return changed
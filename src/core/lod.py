@@ -0,0 +1,217 @@
+# imports
+import numpy as np
+
+from core.config import LOD_DISTANCES, LOD_HYSTERESIS, LOD_REMESH_PER_TICK
+from core.light import SKY_SHIFT, block_light, sky_light
+from core.mesher import TRANSPARENT, mesh_blocks, mesh_chunk
+from core.world import AIR, BLOCK_DTYPE, CHUNK_SIZE, STONE, WORLD_HEIGHT
+
+# constants
+LOD_FACTORS = (1, 2, 4, 8)  # Blocks per cell side at each level; level 0 is full detail
+
+
+def downsample(blocks, factor):
+    """
+    Shrinks a block array by a factor along every axis. A cell is filled
+    when at least half its blocks are, with the topmost block found in it,
+    so surfaces keep their top blocks (grass stays grass).
+
+    :param blocks: The (X, Y, Z) block ids, each a multiple of factor.
+    :param factor: The cell size, in blocks.
+    """
+    nx, ny, nz = (n // factor for n in blocks.shape)
+    # (cell x, cell y, cell z, y in cell, x and z in cell)
+    cells = blocks.reshape(nx, factor, ny, factor, nz, factor).transpose(0, 2, 4, 3, 1, 5)
+    cells = cells.reshape(nx, ny, nz, factor, factor * factor)
+    filled = cells != AIR
+
+    coarse = np.full((nx, ny, nz), AIR, dtype=BLOCK_DTYPE)
+    for layer in range(factor):  # Bottom to top, so the top layer wins
+        present = filled[:, :, :, layer].any(axis=-1)
+        first = filled[:, :, :, layer].argmax(axis=-1)
+        block = np.take_along_axis(cells[:, :, :, layer], first[..., None], axis=-1)[..., 0]
+        coarse = np.where(present, block, coarse)
+    majority = filled.sum(axis=(-2, -1)) * 2 >= factor ** 3
+    return np.where(majority, coarse, AIR).astype(BLOCK_DTYPE)
+
+
+def _full_cells(side, factor):
+    """
+    Downsamples a one block thick slice of neighbours, (n, WORLD_HEIGHT):
+    a cell is opaque only when every block in it is.
+    """
+    n, height = side.shape
+    opaque = ~TRANSPARENT[side]
+    return opaque.reshape(n // factor, factor, height // factor, factor).all(axis=(1, 3))
+
+
+def coarse_padded(padded, factor):
+    """
+    Builds the padded block array of a chunk at a coarser level, for
+    mesh_blocks(). The border only holds the neighbour cells that are
+    completely opaque, so sides facing a partly filled neighbour cell are
+    kept. Those sides form short skirts along the surface, which hide the
+    cracks against neighbours meshed at another level.
+
+    :param padded: The chunk's blocks with a one block border, shape
+                   (CHUNK_SIZE + 2, WORLD_HEIGHT + 2, CHUNK_SIZE + 2).
+    :param factor: The cell size, in blocks.
+    """
+    inner = padded[1:-1, 1:-1, 1:-1]
+    coarse = downsample(inner, factor)
+    nx, ny, nz = coarse.shape
+    result = np.full((nx + 2, ny + 2, nz + 2), AIR, dtype=BLOCK_DTYPE)
+    result[1:-1, 1:-1, 1:-1] = coarse
+    result[0, 1:-1, 1:-1] = np.where(_full_cells(padded[0, 1:-1, 1:-1].T, factor).T, STONE, AIR)
+    result[-1, 1:-1, 1:-1] = np.where(_full_cells(padded[-1, 1:-1, 1:-1].T, factor).T, STONE, AIR)
+    result[1:-1, 1:-1, 0] = np.where(_full_cells(padded[1:-1, 1:-1, 0], factor), STONE, AIR)
+    result[1:-1, 1:-1, -1] = np.where(_full_cells(padded[1:-1, 1:-1, -1], factor), STONE, AIR)
+    return result
+
+
+def coarse_light(light, factor):
+    """
+    Shrinks a padded packed light array to the cells of coarse_padded():
+    each cell gets the brightest skylight and block light found in it, as
+    its faces are lit by the air it holds. The one cell border shrinks
+    along the border only.
+
+    :param light: The chunk's packed light with a one block border, shape
+                  (CHUNK_SIZE + 2, WORLD_HEIGHT + 2, CHUNK_SIZE + 2).
+    :param factor: The cell size, in blocks.
+    """
+    sky, block = sky_light(light), block_light(light)
+    for axis in range(3):
+        n = light.shape[axis] - 2
+        starts = np.r_[0, np.arange(1, n + 1, factor), n + 1]
+        sky = np.maximum.reduceat(sky, starts, axis=axis)
+        block = np.maximum.reduceat(block, starts, axis=axis)
+    return ((sky << SKY_SHIFT) | block).astype(np.uint8)
+
+
+def mesh_lod(padded, level, origin=(0, 0, 0), uv_table=None, tile_table=None, greedy=False, light=None):
+    """
+    Meshes a chunk at a level of detail. Level 0 is mesh_blocks() itself;
+    level n meshes cells of LOD_FACTORS[n] blocks, and scales them back up.
+    Light, if given, is shrunk with the blocks (see coarse_light()), so
+    coarse chunks are shaded like the detailed ones next to them.
+
+    :param padded: The chunk's blocks with a one block border.
+    :param level: The level of detail.
+    :param origin: World position of the first inner block.
+    :param uv_table: See mesher.mesh_blocks().
+    :param tile_table: See mesher.mesh_blocks().
+    :param greedy: See mesher.mesh_blocks().
+    :param light: See mesher.mesh_blocks().
+    """
+    factor = LOD_FACTORS[level]
+    if factor == 1:
+        return mesh_blocks(padded, origin, uv_table, tile_table, greedy, light)
+    if light is not None:
+        light = coarse_light(light, factor)
+    mesh = mesh_blocks(coarse_padded(padded, factor), (0, 0, 0), uv_table, tile_table, greedy, light)
+    vertices = mesh.vertices.reshape(-1, 3) * factor + np.asarray(origin, dtype=np.float32)
+    mesh.vertices = vertices.reshape(-1)
+    if uv_table is None:
+        mesh.texcoords *= factor  # Texcoords are in blocks: keep one texture per block
+    return mesh
+
+
+def mesh_chunk_lod(world, cx, cz, level, uv_table=None, tile_table=None, greedy=False):
+    """
+    Meshes a loaded chunk at a level of detail, like mesher.mesh_chunk(),
+    with its light if it is known. At level 0 it is mesher.mesh_chunk().
+
+    :param world: The World.
+    :param cx: The chunk x coordinate.
+    :param cz: The chunk z coordinate.
+    :param level: The level of detail.
+    :param uv_table: See mesher.mesh_blocks().
+    :param tile_table: See mesher.mesh_blocks().
+    :param greedy: See mesher.mesh_blocks().
+    """
+    if level == 0:
+        return mesh_chunk(world, cx, cz, uv_table, tile_table, greedy)
+    x0, z0 = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+    box = (x0 - 1, -1, z0 - 1, x0 + CHUNK_SIZE + 1, WORLD_HEIGHT + 1, z0 + CHUNK_SIZE + 1)
+    padded = world.get_region(*box)
+    chunk = world.get_chunk(cx, cz)
+    light = world.get_light_region(*box) if chunk is not None and chunk.light is not None else None
+    return mesh_lod(padded, level, (x0, 0, z0), uv_table, tile_table, greedy, light)
+
+
+def lod_levels(distances, margin=0.0, thresholds=LOD_DISTANCES):
+    """
+    Returns the level of detail for chunks at some distances.
+
+    :param distances: Distances from the camera, in chunks.
+    :param margin: Added to the distances (subtract it to bias towards detail).
+    :param thresholds: The distances where each coarser level starts.
+    """
+    return np.searchsorted(np.asarray(thresholds, dtype=np.float64), np.asarray(distances) + margin, side="right")
+
+
+class LODManager:
+    """
+    LODManager
+
+    Keeps every loaded chunk meshed at the level of detail its distance to
+    the camera calls for, remeshing it through the ChunkPipeline when that
+    changes. The pipeline's upload replaces the old mesh only once the new
+    one is on the GPU, so levels swap without a gap.
+    A chunk only changes level once it is LOD_HYSTERESIS chunks past the
+    threshold, so moving along it doesn't remesh back and forth.
+    Schedule it with Window.schedule_tick().
+    """
+
+    def __init__(self, pipeline, camera, thresholds=LOD_DISTANCES):
+        """
+        Initializes the manager.
+
+        :param pipeline: The ChunkPipeline that meshes and uploads chunks.
+        :param camera: The FPC.
+        :param thresholds: The distances, in chunks, where each coarser
+                           level starts.
+        """
+        self.pipeline = pipeline
+        self.camera = camera
+        self.thresholds = thresholds
+
+    def level(self, cx, cz):
+        """
+        Returns the level of detail a chunk should be requested at.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        return int(lod_levels(self.distance(np.array([cx]), np.array([cz])), thresholds=self.thresholds)[0])
+
+    def distance(self, cx, cz):
+        """
+        Returns the horizontal distances from the camera to chunk centers,
+        in chunks.
+        """
+        x, _, z = self.camera.state["position"]
+        return np.hypot((cx + 0.5) - x / CHUNK_SIZE, (cz + 0.5) - z / CHUNK_SIZE)
+
+    def tick(self, dt):
+        """
+        Remeshes the chunks whose level should change, nearest first, up to
+        LOD_REMESH_PER_TICK of them. Runs on the main thread, while the
+        shared context uploads: the pipeline's levels are read through
+        ChunkPipeline.uploaded(), under its lock.
+
+        :param dt: The tick length, in seconds.
+        """
+        levels = self.pipeline.uploaded()
+        if not levels:
+            return
+        cx, cz, current = np.array(levels, dtype=np.int64).T
+        distance = self.distance(cx, cz)
+
+        coarser = lod_levels(distance, -LOD_HYSTERESIS, self.thresholds)
+        finer = lod_levels(distance, LOD_HYSTERESIS, self.thresholds)
+        target = np.where(current < coarser, coarser, np.where(current > finer, finer, current))
+        changed = np.flatnonzero(target != current)
+        for i in changed[np.argsort(distance[changed])][:LOD_REMESH_PER_TICK]:
+            self.pipeline.remesh(int(cx[i]), int(cz[i]), int(target[i]))
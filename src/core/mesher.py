@@ -0,0 +1,350 @@
+# imports
+import numpy as np
+
+from core.light import corner_values
+from core.world import AIR, BLOCKS, CHUNK_SIZE, SECTION_SIZE, SECTIONS, WORLD_HEIGHT
+
+# constants
+# Faces, in the order used by the lookup tables below:
+# (normal axis, normal direction, right axis, up axis, texture)
+FACES = (
+    (0, 1, 2, 1, "side"),     # +x
+    (0, -1, 2, 1, "side"),    # -x
+    (1, 1, 0, 2, "top"),      # +y
+    (1, -1, 0, 2, "bottom"),  # -y
+    (2, 1, 0, 1, "side"),     # +z
+    (2, -1, 0, 1, "side"),    # -z
+)
+
+# Unit cube corners of each face as (bottom left, bottom right, top right,
+# top left), seen from outside the block.
+_QUADS = np.array([
+    ((1, 0, 1), (1, 0, 0), (1, 1, 0), (1, 1, 1)),  # +x
+    ((0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0)),  # -x
+    ((0, 1, 1), (1, 1, 1), (1, 1, 0), (0, 1, 0)),  # +y
+    ((0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)),  # -y
+    ((0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)),  # +z
+    ((1, 0, 0), (0, 0, 0), (0, 1, 0), (1, 1, 0)),  # -z
+], dtype=np.float32)
+
+# Two triangles per face, in the corner order TextureAtlas.texture_coords
+# uses: bottom right, bottom left, top left, top right, bottom right, top left
+_TRIANGLES = (1, 0, 3, 2, 1, 3)
+FACE_CORNERS = _QUADS[:, _TRIANGLES]  # (6 faces, 6 vertices, xyz)
+
+# (u, v) of each of the 6 vertices, as 0/1 fractions of the quad's size
+_FACE_UVS = np.array([(1, 0), (0, 0), (0, 1), (1, 1), (1, 0), (0, 1)], dtype=np.float32)
+
+# For each face's 6 vertices, which of corner_values()' 4 corners it is
+_VERTEX_CORNERS = np.array([
+    [int(c[right]) + 2 * int(c[up]) for c in corners]
+    for (_, _, right, up, _), corners in zip(FACES, FACE_CORNERS)
+])
+
+# Greedy merge keys: the tile key in the low bits, the light code above it
+_LIGHT_SHIFT = 17
+
+# Whether each block id lets the faces behind it show. Unknown ids are opaque.
+TRANSPARENT = np.zeros(1 << 16, dtype=bool)
+for _id, _block in BLOCKS.items():
+    TRANSPARENT[_id] = _block["transparent"]
+
+
+class Mesh:
+    """
+    Mesh
+
+    The output of the mesher: flat, contiguous float32 arrays with 6 vertices
+    per face, ready for Renderer.modify.
+    """
+
+    def __init__(self, vertices, texcoords, tiles=None, faces=None, lights=None):
+        """
+        Initializes the mesh.
+
+        :param vertices: float32 array of x, y, z per vertex.
+        :param texcoords: float32 array of u, v per vertex.
+        :param tiles: Optional uint16 array of the atlas tile of each vertex.
+        :param faces: Optional uint8 array of the face (index into FACES) of
+                      each vertex.
+        :param lights: Optional uint8 array of the brightness (light and
+                       ambient occlusion, 255 = full) of each vertex.
+        """
+        self.vertices = vertices
+        self.texcoords = texcoords
+        self.tiles = tiles
+        self.faces = faces
+        self.lights = lights
+
+    @property
+    def count(self):
+        """
+        The number of vertices.
+        """
+        return len(self.vertices) // 3
+
+    @property
+    def nbytes(self):
+        """
+        The size of the vertex data, in bytes.
+        """
+        size = self.vertices.nbytes + self.texcoords.nbytes
+        if self.tiles is not None:
+            size += self.tiles.nbytes
+        return size
+
+
+def build_uv_table(texture_atlas):
+    """
+    Builds the (block id, face) -> texture coordinates lookup table.
+
+    Returns a float32 array of shape (n_blocks, 6, 12): the 6 (u, v) pairs of
+    each face, as given by TextureAtlas.get_texture.
+
+    :param texture_atlas: The TextureAtlas with the block textures added.
+    """
+    table = np.zeros((max(BLOCKS) + 1, len(FACES), 12), dtype=np.float32)
+    for block, properties in BLOCKS.items():
+        if properties["textures"] is None:
+            continue
+        for face, (_, _, _, _, texture) in enumerate(FACES):
+            table[block, face] = texture_atlas.get_texture(properties["textures"][texture])
+    return table
+
+
+def build_tile_table(texture_atlas):
+    """
+    Builds the (block id, face) -> atlas tile index lookup table, with tiles
+    numbered in the order they were added to the atlas.
+
+    :param texture_atlas: The TextureAtlas with the block textures added.
+    """
+    tiles = {name: i for i, name in enumerate(texture_atlas.texture_coords)}
+    table = np.zeros((max(BLOCKS) + 1, len(FACES)), dtype=np.uint16)
+    for block, properties in BLOCKS.items():
+        if properties["textures"] is None:
+            continue
+        for face, (_, _, _, _, texture) in enumerate(FACES):
+            table[block, face] = tiles[properties["textures"][texture] + ".png"]
+    return table
+
+
+def exposed_faces(padded):
+    """
+    Finds the visible faces of every block.
+
+    A face is visible if its block isn't air and the neighbour it touches is
+    transparent and not the same block (so water doesn't draw inside water).
+
+    :param padded: Block ids with a one block border of neighbours on every
+                   side, shape (X + 2, Y + 2, Z + 2).
+    """
+    blocks = padded[1:-1, 1:-1, 1:-1]
+    solid = blocks != AIR
+    masks = []
+    for axis, direction, _, _, _ in FACES:
+        index = [slice(1, -1)] * 3
+        index[axis] = slice(1 + direction, padded.shape[axis] - 1 + direction)
+        neighbour = padded[tuple(index)]
+        masks.append(solid & TRANSPARENT[neighbour] & (neighbour != blocks))
+    return blocks, masks
+
+
+def _merge_runs(tiles):
+    """
+    Merges a (slices, rows, columns) array of tile keys (0 = no face) into
+    rectangles: first into runs along each row, then stacks identical runs
+    in consecutive rows.
+
+    Returns (slice, row, column, height, width, key) arrays, one per
+    rectangle.
+
+    :param tiles: The tile keys.
+    """
+    padded = np.zeros((tiles.shape[0], tiles.shape[1], tiles.shape[2] + 2), dtype=tiles.dtype)
+    padded[:, :, 1:-1] = tiles
+    inner = padded[:, :, 1:-1]
+    starts = (inner != 0) & (inner != padded[:, :, :-2])
+    ends = (inner != 0) & (inner != padded[:, :, 2:])
+    p, v, r0 = np.nonzero(starts)
+    r1 = np.nonzero(ends)[2]
+    width = r1 - r0 + 1
+    key = inner[p, v, r0]
+
+    # Runs that continue the run directly below them join its rectangle
+    order = np.lexsort((v, key, width, r0, p))
+    p, v, r0, width, key = p[order], v[order], r0[order], width[order], key[order]
+    first = np.ones(len(p), dtype=bool)
+    first[1:] = ((p[1:] != p[:-1]) | (r0[1:] != r0[:-1]) | (width[1:] != width[:-1])
+                 | (key[1:] != key[:-1]) | (v[1:] != v[:-1] + 1))
+    heads = np.nonzero(first)[0]
+    height = np.diff(np.append(heads, len(p)))
+    return p[heads], v[heads], r0[heads], height, width[heads], key[heads]
+
+
+def mesh_blocks(padded, origin=(0, 0, 0), uv_table=None, tile_table=None, greedy=False, light=None):
+    """
+    Meshes a block array into a Mesh of its visible faces.
+
+    By default every visible face becomes its own quad, textured with
+    uv_table for the atlas. With greedy=True, coplanar faces with the same
+    texture are merged into larger quads, and texcoords are given in blocks
+    (0..width, 0..height) so the texture repeats across the quad; that needs
+    a repeating texture per tile (see tile_table), not a plain atlas. Greedy
+    meshes are only drawn right by the packed renderer (Renderer(packed=True)),
+    so greedy=True with a uv_table raises ValueError.
+
+    :param padded: Block ids with a one block border of neighbours on every
+                   side, shape (X + 2, Y + 2, Z + 2).
+    :param origin: World position of the first inner block.
+    :param uv_table: Table from build_uv_table(). Without it, texcoords are
+                     given in blocks.
+    :param tile_table: Table from build_tile_table(); fills Mesh.tiles.
+    :param greedy: Whether to merge faces into larger quads.
+    :param light: Optional packed light (see core/light.py), same shape as
+                  padded. With it, smooth light and ambient occlusion are
+                  baked into Mesh.lights; greedy meshing then only merges
+                  faces whose 4 corners are all equally bright.
+    """
+    if greedy and uv_table is not None:
+        raise ValueError("Greedy meshes can't use atlas texcoords; mesh with a tile_table for the packed renderer")
+    blocks, masks = exposed_faces(padded)
+    origin = np.asarray(origin, dtype=np.float32)
+    # Each list starts empty-but-typed, so a mesh without faces still concatenates
+    vertices, texcoords = [np.zeros(0, dtype=np.float32)], [np.zeros(0, dtype=np.float32)]
+    tiles, faces, lights = [np.zeros(0, dtype=np.uint16)], [np.zeros(0, dtype=np.uint8)], [np.zeros(0, dtype=np.uint8)]
+
+    for face, ((axis, direction, right, up, _), mask) in enumerate(zip(FACES, masks)):
+        if not mask.any():
+            continue
+        if light is not None:
+            corners = corner_values(padded, light, axis, direction, right, up, mask)
+        if greedy:
+            # Lay the faces out as (normal, up, right) so runs go along right
+            if tile_table is not None:
+                keys = tile_table[blocks, face].astype(np.int64) + 1
+            else:
+                keys = blocks.astype(np.int64) + 1
+            if light is not None:
+                # Evenly lit faces merge by their brightness; the others get
+                # a code of their own (256 + face index), so they don't merge
+                uniform = (corners == corners[:1]).all(axis=0)
+                codes = np.zeros(blocks.shape, dtype=np.int64)
+                codes[mask] = np.where(uniform, corners[0], 256 + np.arange(len(uniform)))
+                keys |= codes << _LIGHT_SHIFT
+            keys = np.where(mask, keys, 0).transpose(axis, up, right)
+            p, v, r, height, width, key = _merge_runs(keys)
+
+            position = np.empty((len(p), 3), dtype=np.float32)
+            position[:, axis], position[:, up], position[:, right] = p, v, r
+            size = np.ones((len(p), 3), dtype=np.float32)
+            size[:, up], size[:, right] = height, width
+            face_blocks = (key & ((1 << _LIGHT_SHIFT) - 1)) - 1  # tile or block, depending on tile_table
+            extent = np.stack((width, height), axis=1).astype(np.float32)
+            uvs = _FACE_UVS[None, :, :] * extent[:, None, :]
+            if light is not None:
+                codes = key >> _LIGHT_SHIFT
+                face_lights = np.repeat(np.minimum(codes, 255)[:, None], 4, axis=1).astype(np.uint8)
+                single = np.flatnonzero(codes >= 256)
+                face_lights[single] = corners[:, codes[single] - 256].T
+        else:
+            position = np.argwhere(mask).astype(np.float32)
+            size = np.ones((len(position), 3), dtype=np.float32)
+            face_blocks = blocks[mask]
+            if uv_table is not None:
+                uvs = uv_table[face_blocks, face].reshape(-1, 6, 2)
+            else:
+                uvs = np.broadcast_to(_FACE_UVS, (len(position), 6, 2))
+            if light is not None:
+                face_lights = corners.T
+
+        corners = (position + origin)[:, None, :] + FACE_CORNERS[face][None, :, :] * size[:, None, :]
+        vertices.append(corners.reshape(-1))
+        texcoords.append(np.asarray(uvs, dtype=np.float32).reshape(-1))
+        faces.append(np.full(len(position) * 6, face, dtype=np.uint8))
+        if tile_table is not None:
+            face_tiles = face_blocks if greedy else tile_table[face_blocks, face]
+            tiles.append(np.repeat(face_tiles.astype(np.uint16), 6))
+        if light is not None:
+            lights.append(face_lights[:, _VERTEX_CORNERS[face]].reshape(-1))
+
+    return Mesh(
+        np.ascontiguousarray(np.concatenate(vertices), dtype=np.float32),
+        np.ascontiguousarray(np.concatenate(texcoords), dtype=np.float32),
+        np.concatenate(tiles) if tile_table is not None else None,
+        np.concatenate(faces),
+        np.concatenate(lights) if light is not None else None,
+    )
+
+
+def join_meshes(meshes):
+    """
+    Concatenates meshes into one, in order. Optional arrays are kept only
+    if every mesh has them.
+
+    :param meshes: The Meshes.
+    """
+    def join(name, dtype):
+        arrays = [getattr(mesh, name) for mesh in meshes]
+        if any(array is None for array in arrays):
+            return None
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+
+    return Mesh(join("vertices", np.float32), join("texcoords", np.float32), join("tiles", np.uint16),
+                join("faces", np.uint8), join("lights", np.uint8))
+
+
+def mesh_sections(padded, origin=(0, 0, 0), uv_table=None, tile_table=None, greedy=False, light=None):
+    """
+    Meshes a chunk one section at a time, so each section's faces are a
+    range of the chunk's mesh that can be remeshed on its own later (see
+    core/remesh.py). Greedy quads don't cross sections.
+    Returns a list of SECTIONS Meshes; sections without a visible face are
+    skipped without meshing them.
+
+    :param padded: The chunk's blocks with a one block border, shape
+                   (X + 2, WORLD_HEIGHT + 2, Z + 2).
+    :param origin: World position of the first inner block.
+    :param uv_table: See mesh_blocks().
+    :param tile_table: See mesh_blocks().
+    :param greedy: See mesh_blocks().
+    :param light: See mesh_blocks().
+    """
+    _, masks = exposed_faces(padded)
+    layers = np.logical_or.reduce([mask.any(axis=(0, 2)) for mask in masks])
+    visible = layers.reshape(SECTIONS, SECTION_SIZE).any(axis=1)
+
+    meshes = []
+    for sy in range(SECTIONS):
+        rows = slice(sy * SECTION_SIZE, (sy + 1) * SECTION_SIZE + 2)
+        if not visible[sy]:
+            meshes.append(Mesh(np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32),
+                               np.zeros(0, dtype=np.uint16) if tile_table is not None else None,
+                               np.zeros(0, dtype=np.uint8),
+                               np.zeros(0, dtype=np.uint8) if light is not None else None))
+            continue
+        section_origin = (origin[0], origin[1] + sy * SECTION_SIZE, origin[2])
+        meshes.append(mesh_blocks(padded[:, rows], section_origin, uv_table, tile_table, greedy,
+                                  light[:, rows] if light is not None else None))
+    return meshes
+
+
+def mesh_chunk(world, cx, cz, uv_table=None, tile_table=None, greedy=False):
+    """
+    Meshes a loaded chunk, culling its border faces against the neighbouring
+    chunks. Neighbours that aren't loaded count as air. If the chunk's light
+    is known (Chunk.light), it's baked into the mesh.
+
+    :param world: The World.
+    :param cx: The chunk x coordinate.
+    :param cz: The chunk z coordinate.
+    :param uv_table: See mesh_blocks().
+    :param tile_table: See mesh_blocks().
+    :param greedy: See mesh_blocks().
+    """
+    x0, z0 = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+    box = (x0 - 1, -1, z0 - 1, x0 + CHUNK_SIZE + 1, WORLD_HEIGHT + 1, z0 + CHUNK_SIZE + 1)
+    padded = world.get_region(*box)
+    chunk = world.get_chunk(cx, cz)
+    light = world.get_light_region(*box) if chunk is not None and chunk.light is not None else None
+    return mesh_blocks(padded, (x0, 0, z0), uv_table, tile_table, greedy, light)
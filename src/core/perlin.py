@@ -11,6 +11,19 @@ from itertools import product
 import math
 import random
 
+import numpy as np
+
+# Number of precomputed gradients; lattice points hash into this table, so
+# memory stays constant however far out the coordinates go.  Must be a power
+# of two.
+GRADIENT_TABLE_SIZE = 256
+
+# 64-bit hashing constants (murmur3 finalizer, golden ratio)
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_FMIX_C1 = 0xFF51AFD7ED558CCD
+_FMIX_C2 = 0xC4CEB9FE1A85EC53
+_HASH_PRIME = 0x9E3779B97F4A7C15
+
 
 def smoothstep(t):
     """Smooth curve with a zero derivative at 0 and 1, making it useful for
@@ -24,16 +37,42 @@ def lerp(t, a, b):
     return a + t * (b - a)
 
 
+def _fmix64(h):
+    """Murmur3's 64-bit finalizer: scrambles the bits of an integer so that
+    nearby inputs give unrelated outputs.
+    """
+    h ^= h >> 33
+    h = (h * _FMIX_C1) & _MASK64
+    h ^= h >> 33
+    h = (h * _FMIX_C2) & _MASK64
+    h ^= h >> 33
+    return h
+
+
+def _fmix64_array(h):
+    """``_fmix64`` for a uint64 NumPy array; multiplication wraps around
+    exactly like the masked Python version.
+    """
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(_FMIX_C1)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(_FMIX_C2)
+    h = h ^ (h >> np.uint64(33))
+    return h
+
+
 class PerlinNoiseFactory(object):
     """Callable that produces Perlin noise for an arbitrary point in an
     arbitrary number of dimensions.  The underlying grid is aligned with the
     integers.
 
-    There is no limit to the coordinates used; new gradients are generated on
-    the fly as necessary.
+    There is no limit to the coordinates used.  Each grid point's gradient is
+    picked by hashing its coordinates with the seed, so nothing is stored per
+    grid point and the same seed always gives the same noise, in any process.
     """
 
-    def __init__(self, dimension, octaves=1, tile=(), unbias=False):
+    def __init__(self, dimension, octaves=1, tile=(), unbias=False,
+                 seed=None):
         """Create a new Perlin noise factory in the given number of dimensions,
         which should be an integer and at least 1.
 
@@ -50,6 +89,10 @@ class PerlinNoiseFactory(object):
         If ``unbias`` is true, the smoothstep function will be applied to the
         output before returning it, to counteract some of Perlin noise's
         significant bias towards the center of its output range.
+
+        ``seed`` is an integer that fully determines the noise.  If it is not
+        given, one is picked from the global ``random`` module and kept in
+        ``self.seed``, so it can be handed to other processes.
         """
         self.dimension = dimension
         self.octaves = octaves
@@ -60,22 +103,30 @@ class PerlinNoiseFactory(object):
         # by this to scale to ±1
         self.scale_factor = 2 * dimension ** -0.5
 
-        self.gradient = {}
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self._seed_hash = _fmix64(seed & _MASK64)
+
+        rng = random.Random(seed)
+        self.gradients = tuple(
+            self._generate_gradient(rng) for _ in range(GRADIENT_TABLE_SIZE))
+        self._gradient_table = np.array(self.gradients, dtype=np.float64)
 
-    def _generate_gradient(self):
+    def _generate_gradient(self, rng):
         # Generate a random unit vector at each grid point -- this is the
         # "gradient" vector, in that the grid tile slopes towards it
 
         # 1 dimension is special, since the only unit vector is trivial;
         # instead, use a slope between -1 and 1
         if self.dimension == 1:
-            return (random.uniform(-1, 1),)
+            return (rng.uniform(-1, 1),)
 
         # Generate a random point on the surface of the unit n-hypersphere;
         # this is the same as a random unit vector in n dimensions.  Thanks
         # to: http://mathworld.wolfram.com/SpherePointPicking.html
         # Pick n normal random variables with stddev 1
-        random_point = [random.gauss(0, 1) for _ in range(self.dimension)]
+        random_point = [rng.gauss(0, 1) for _ in range(self.dimension)]
         # Then scale the result to a unit vector
         scale = sum(n * n for n in random_point) ** -0.5
         return tuple(coord * scale for coord in random_point)
@@ -100,9 +151,7 @@ class PerlinNoiseFactory(object):
         # gradient's "influence" on the chosen point.
         dots = []
         for grid_point in product(*grid_coords):
-            if grid_point not in self.gradient:
-                self.gradient[grid_point] = self._generate_gradient()
-            gradient = self.gradient[grid_point]
+            gradient = self.gradients[self._hash(grid_point)]
 
             dot = 0
             for i in range(self.dimension):
@@ -130,6 +179,109 @@ class PerlinNoiseFactory(object):
 
         return dots[0] * self.scale_factor
 
+    def _hash(self, grid_point):
+        """Get the gradient table index for a single integer grid point."""
+        h = self._seed_hash
+        for coord in grid_point:
+            h = _fmix64(((h ^ (coord & _MASK64)) * _HASH_PRIME) & _MASK64)
+        return h & (GRADIENT_TABLE_SIZE - 1)
+
+    def _gradient_array(self, grid_points):
+        """Get the gradient vectors for an ``(n, dimension)`` array of
+        integer grid points, as an ``(n, dimension)`` float array.
+
+        Uses the same hash as the scalar path, so both produce the same noise.
+        """
+        # Reinterpret as unsigned so negative coordinates wrap the same way
+        # as ``coord & _MASK64`` does
+        grid_points = np.ascontiguousarray(grid_points, dtype=np.int64)
+        grid_points = grid_points.view(np.uint64)
+        h = np.full(len(grid_points), self._seed_hash, dtype=np.uint64)
+        for i in range(self.dimension):
+            h = _fmix64_array((h ^ grid_points[:, i]) * np.uint64(_HASH_PRIME))
+        index = h & np.uint64(GRADIENT_TABLE_SIZE - 1)
+        return self._gradient_table[index.astype(np.intp)]
+
+    def get_plain_noise_array(self, points):
+        """Get plain noise for an array of points, without taking into
+        account either octaves or tiling.
+
+        ``points`` has shape ``(..., dimension)``; the result has shape
+        ``(...)``.  This is the vectorized counterpart of
+        ``get_plain_noise``.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.shape[-1] != self.dimension:
+            raise ValueError("Expected {} values, got {}".format(
+                self.dimension, points.shape[-1]))
+
+        flat = points.reshape(-1, self.dimension)
+        min_coords = np.floor(flat)
+        distances = flat - min_coords
+        min_coords = min_coords.astype(np.int64)
+
+        # Same as the scalar path: one dot product per grid corner, with the
+        # corners in the order product() yields them
+        dots = []
+        for offsets in product((0, 1), repeat=self.dimension):
+            offsets = np.array(offsets)
+            gradients = self._gradient_array(min_coords + offsets)
+            dots.append((gradients * (distances - offsets)).sum(axis=1))
+
+        # Collapse the last dimension first, pairing adjacent corners
+        dim = self.dimension
+        while len(dots) > 1:
+            dim -= 1
+            s = smoothstep(distances[:, dim])
+            dots = [lerp(s, dots[i], dots[i + 1])
+                    for i in range(0, len(dots), 2)]
+
+        return (dots[0] * self.scale_factor).reshape(points.shape[:-1])
+
+    def sample(self, points):
+        """Get the value of this Perlin noise function for a whole array of
+        points at once.
+
+        ``points`` has shape ``(..., dimension)``, for example ``(n, 2)`` for
+        n points in 2D.  The result has shape ``(...)`` and matches calling
+        the factory on each point in turn, to within float tolerance.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        ret = np.zeros(points.shape[:-1])
+        for o in range(self.octaves):
+            o2 = 1 << o
+            new_points = points * o2
+            for i in range(self.dimension):
+                if self.tile[i]:
+                    new_points[..., i] %= self.tile[i] * o2
+            ret += self.get_plain_noise_array(new_points) / o2
+
+        # See __call__ for the reasoning behind both of these
+        ret /= 2 - 2 ** (1 - self.octaves)
+
+        if self.unbias:
+            r = (ret + 1) / 2
+            for _ in range(int(self.octaves / 2 + 0.5)):
+                r = smoothstep(r)
+            ret = r * 2 - 1
+
+        return ret
+
+    def sample_grid(self, *axes):
+        """Get noise for every point on the grid spanned by the given axes,
+        one 1D array of coordinates per dimension.
+
+            heights = pnf.sample_grid(xs, zs)
+
+        The result has shape ``(len(xs), len(zs))``, indexed as
+        ``heights[i, j] == pnf(xs[i], zs[j])``.
+        """
+        if len(axes) != self.dimension:
+            raise ValueError("Expected {} axes, got {}".format(
+                self.dimension, len(axes)))
+        grid = np.meshgrid(*axes, indexing="ij")
+        return self.sample(np.stack(grid, axis=-1))
+
     def __call__(self, *point):
         """Get the value of this Perlin noise function at the given point.  The
         number of values given should match the number of dimensions.
@@ -0,0 +1,555 @@
+# imports
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core.light import compute_light
+from core.lod import mesh_lod
+from core.mesher import join_meshes, mesh_sections
+from core.region import decode_blocks
+from core.terrain import TerrainGenerator
+from core.vertex_format import PACKED_VERTEX, QUAD_VERTICES, encode
+from core.world import BLOCK_DTYPE, CHUNK_SIZE, WORLD_HEIGHT, Chunk, chunk_key, key_to_chunk
+
+logger = logging.getLogger("PyCraft")
+
+# constants
+SLOT_SIZE = 4 * 1024 * 1024  # Bytes of shared memory per in-flight chunk
+SLOT_ALIGNMENT = 64  # Alignment of each array inside a slot
+PADDED_SHAPE = (CHUNK_SIZE + 2, WORLD_HEIGHT + 2, CHUNK_SIZE + 2)  # A chunk with a one block border
+# Along x or z, for the neighbours at -1, 0 and 1 chunks: the (start, end)
+# of their columns in the padded array, and in their own chunk
+_NEIGHBOUR_SPANS = (
+    ((0, 1), (CHUNK_SIZE - 1, CHUNK_SIZE)),
+    ((1, CHUNK_SIZE + 1), (0, CHUNK_SIZE)),
+    ((CHUNK_SIZE + 1, CHUNK_SIZE + 2), (0, 1)),
+)
+
+# Per-process state of the worker processes, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(seed, uv_table, tile_table, greedy, packed):
+    """
+    Sets up a worker process.
+    """
+    _worker["terrain"] = TerrainGenerator(seed)
+    _worker["uv_table"] = uv_table
+    _worker["tile_table"] = tile_table
+    _worker["greedy"] = greedy
+    _worker["packed"] = packed
+
+
+def _pack(buf, arrays):
+    """
+    Copies arrays into a shared memory buffer, one after another.
+    Returns their layout, or None if they don't fit.
+
+    :param buf: The buffer.
+    :param arrays: A dictionary of name -> array.
+    """
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        if offset + array.nbytes > len(buf):
+            return None
+        layout[name] = (offset, array.shape, array.dtype.str)
+        offset += -(-array.nbytes // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+    for name, array in arrays.items():
+        _unpack(buf, layout, name)[...] = array
+    return layout
+
+
+def _unpack(buf, layout, name):
+    """
+    Returns a NumPy view of an array packed by _pack, without copying.
+
+    :param buf: The buffer.
+    :param layout: The layout returned by _pack.
+    :param name: The name of the array.
+    """
+    offset, shape, dtype = layout[name]
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=offset)
+
+
+def _build_padded(x0, z0, loaded=None, region=None, stored=None):
+    """
+    Returns a chunk's blocks with a one block border of neighbours on every
+    side, shape (CHUNK_SIZE + 2, WORLD_HEIGHT + 2, CHUNK_SIZE + 2).
+    Of the 3 x 3 chunks it spans (the chunk itself in the middle), loaded
+    ones are read from the world and saved ones from the store, so faces
+    on the border are culled against the blocks that are really there.
+    Only the others are generated.
+
+    :param x0, z0: The chunk's lower corner, in blocks.
+    :param loaded: (3, 3) bools of the chunks loaded in the world, at
+                   [dx + 1, dz + 1].
+    :param region: The padded blocks read from the world, if any is.
+    :param stored: (dx + 1, dz + 1) -> (codec, data) of the saved chunks.
+    """
+    terrain = _worker["terrain"]
+    padded = np.zeros(PADDED_SHAPE, dtype=BLOCK_DTYPE)
+    known = np.zeros((3, 3), dtype=bool)
+    if region is not None:
+        padded[...] = region
+        known |= loaded
+    for (i, k), (codec, data) in (stored or {}).items():
+        (px0, px1), (bx0, bx1) = _NEIGHBOUR_SPANS[i]
+        (pz0, pz1), (bz0, bz1) = _NEIGHBOUR_SPANS[k]
+        padded[px0:px1, 1:-1, pz0:pz1] = decode_blocks(codec, data)[bx0:bx1, :, bz0:bz1]
+        known[i, k] = True
+    if not known.any():
+        padded[:, 1:-1, :] = terrain.generate(x0 - 1, z0 - 1, CHUNK_SIZE + 2, CHUNK_SIZE + 2)
+        return padded
+
+    for i, k in zip(*np.nonzero(~known)):
+        (px0, px1), _ = _NEIGHBOUR_SPANS[i]
+        (pz0, pz1), _ = _NEIGHBOUR_SPANS[k]
+        padded[px0:px1, 1:-1, pz0:pz1] = terrain.generate(x0 - 1 + px0, z0 - 1 + pz0, px1 - px0, pz1 - pz0)
+    return padded
+
+
+def _build_chunk(cx, cz, slot_name, inputs=None, level=0):
+    """
+    Generates (or decodes) and meshes a chunk in a worker process.
+
+    The chunk is meshed with a one block border, so its faces are culled
+    against the neighbouring blocks, generated if those chunks aren't
+    loaded or saved (see _build_padded()).
+    Inputs are read from the shared memory slot, and results are written
+    into it; only the layout goes back through the pipe (unless they don't
+    fit, then the arrays do).
+
+    :param cx: The chunk x coordinate.
+    :param cz: The chunk z coordinate.
+    :param slot_name: The name of the shared memory slot to use.
+    :param inputs: (layout, arrays, codecs, loaded), from
+                   ChunkPipeline._submit(): the layout of the inputs packed
+                   in the slot (or the arrays themselves, if they didn't
+                   fit), the codec of each saved chunk and which chunks are
+                   loaded. The inputs may hold the padded "blocks" read from
+                   the world, its padded "light", and a "stored_<i><k>"
+                   per saved chunk.
+    :param level: The level of detail to mesh it at.
+    """
+    x0, z0 = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+    light = None
+    if inputs is None:
+        padded = _build_padded(x0, z0)
+    else:
+        layout, given, codecs, loaded = inputs
+        slot = shared_memory.SharedMemory(name=slot_name)
+        try:
+            if layout is not None:
+                given = {name: _unpack(slot.buf, layout, name) for name in layout}
+            stored = {(i, k): (codec, given["stored_{}{}".format(i, k)]) for (i, k), codec in codecs.items()}
+            padded = _build_padded(x0, z0, loaded, given.get("blocks"), stored)
+            if "light" in given:
+                light = np.array(given["light"])
+            del given, stored  # Release the views before closing the slot
+        finally:
+            slot.close()
+
+    arrays = {"blocks": padded[1:-1, 1:-1, 1:-1]}
+    if light is None:
+        # New chunks get their light here
+        light = compute_light(padded)
+        arrays["light"] = light[1:-1, 1:-1, 1:-1]
+    if level == 0:
+        # Laid out by sections, so edits can patch single sections later
+        sections = mesh_sections(padded, (x0, 0, z0), _worker["uv_table"], _worker["tile_table"], _worker["greedy"],
+                                 light)
+        mesh = join_meshes(sections)
+        counts = np.array([section.count for section in sections], dtype=np.int64)
+        arrays["sections"] = counts // 6 * QUAD_VERTICES if _worker["packed"] else counts
+    else:
+        mesh = mesh_lod(padded, level, (x0, 0, z0), _worker["uv_table"], _worker["tile_table"], _worker["greedy"],
+                        light)
+    if _worker["packed"]:
+        # As bytes: slot layouts only keep plain dtypes
+        arrays["packed"] = encode(mesh, (x0, z0)).view(np.uint8)
+    else:
+        arrays["vertices"] = mesh.vertices
+        arrays["texcoords"] = mesh.texcoords
+        if mesh.tiles is not None:
+            arrays["tiles"] = mesh.tiles
+
+    slot = shared_memory.SharedMemory(name=slot_name)
+    try:
+        layout = _pack(slot.buf, arrays)
+    finally:
+        slot.close()
+    if layout is None:
+        return cx, cz, None, arrays
+    return cx, cz, layout, None
+
+
+class ChunkPipeline:
+    """
+    ChunkPipeline
+
+    Generates and meshes chunks in a pool of worker processes, and uploads
+    the results from the shared context thread.
+
+    Each in-flight chunk owns a slot of shared memory, allocated once here
+    and reused: workers write their arrays into it, and the shared context
+    reads them in place, so nothing is pickled on the way back.
+    Given the window's JobScheduler (Window.jobs), finished chunks upload
+    as its jobs, within the shared context's budget per frame; otherwise
+    schedule it with Window.schedule_shared_context(). Given a camera,
+    pending chunks are built and uploaded nearest to it first.
+    cancel() and cancel_outside() drop the requests of chunks that left
+    range.
+    Requests come from the main thread while uploads finish on the shared
+    context thread: self.lock guards the pending chunks, the free slots,
+    the jobs and the levels.
+    Meshes are packed in the workers if the renderer is packed (which needs
+    a tile_table).
+    If the world has a RegionStore, saved chunks are loaded from it rather
+    than generated (the workers decompress them), and generated chunks are
+    saved to it.
+    New chunks are lit in the workers (see core/light.py), and full detail
+    meshes have their light baked in; remeshes of loaded chunks reuse the
+    world's light, which LightEngine keeps up to date.
+    """
+
+    def __init__(self, world, renderer, seed, uv_table=None, tile_table=None, greedy=False, workers=None,
+                 scheduler=None, camera=None):
+        """
+        Initializes the pipeline.
+
+        :param world: The World to store chunks in.
+        :param renderer: The Renderer to upload meshes to.
+        :param seed: The world seed.
+        :param uv_table: See mesher.mesh_blocks().
+        :param tile_table: See mesher.mesh_blocks().
+        :param greedy: See mesher.mesh_blocks().
+        :param workers: Number of worker processes; defaults to the CPU count.
+        :param scheduler: The JobScheduler to upload through, or None to be
+                          polled by the shared context.
+        :param camera: The FPC to prioritize chunks by, or None to take
+                       them in request order.
+        """
+        self.world = world
+        self.renderer = renderer
+        self.scheduler = scheduler
+        self.camera = camera
+        self.workers = workers or os.cpu_count() or 1
+
+        if os.name == "posix":
+            # Make forked workers share our resource tracker, so it doesn't
+            # clean up slots when a worker exits
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+
+        logger.log(logging.DEBUG, "[core/pipeline] Starting %d chunk workers", self.workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker,
+            initargs=(seed, uv_table, tile_table, greedy, renderer.packed))
+
+        # Two slots per worker keeps every worker busy while results upload
+        self.slots = [shared_memory.SharedMemory(create=True, size=SLOT_SIZE) for _ in range(self.workers * 2)]
+        self.free_slots = deque(self.slots)
+        self.lock = threading.Lock()  # Guards free_slots, pending, jobs and levels
+        self.pending = {}  # Key -> (cx, cz) of the requested chunks waiting for a slot
+        self.jobs = {}  # Key -> level, source and cancelled flag of the pending and in-flight chunks
+        self.done = queue.Queue()  # (slot, key, future) of finished jobs
+        self.levels = {}  # Key -> (cx, cz, level of detail) of the uploaded meshes
+
+    def request(self, cx, cz, level=0):
+        """
+        Requests a chunk to be generated (or loaded), meshed and uploaded.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param level: The level of detail to mesh it at (see core/lod.py).
+        """
+        key = chunk_key(cx, cz)
+        with self.lock:
+            if key in self.jobs:
+                self.jobs[key]["cancelled"] = False  # Back in range before its upload
+                return
+            if key in self.world.chunks:
+                return
+            self.jobs[key] = {"level": level, "source": None, "cancelled": False}
+            self.pending[key] = (cx, cz)
+        self._submit()
+
+    def remesh(self, cx, cz, level):
+        """
+        Meshes a loaded chunk again, at another level of detail. Its current
+        mesh stays drawn until the new one is uploaded.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param level: The level of detail.
+        """
+        key = chunk_key(cx, cz)
+        with self.lock:
+            if key in self.jobs:
+                self.jobs[key]["level"] = level  # Used if it hasn't been submitted yet
+                self.jobs[key]["cancelled"] = False
+                return
+            if key not in self.world.chunks:
+                return
+            self.jobs[key] = {"level": level, "source": None, "cancelled": False}
+            self.pending[key] = (cx, cz)
+        self._submit()
+
+    def cancel(self, cx, cz):
+        """
+        Cancels a chunk's request, e.g. once it leaves the view distance. A
+        pending chunk is dropped; one being built isn't uploaded, and its
+        slot is freed as soon as the worker is done. Returns whether there
+        was a request.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        key = chunk_key(cx, cz)
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None:
+                return False
+            if self.pending.pop(key, None) is not None:
+                del self.jobs[key]
+                return True
+            job["cancelled"] = True
+        # Outside the lock: the cancelled upload releases its slot
+        if self.scheduler is not None and self.scheduler.cancel(("chunk", key)):
+            self._submit()  # Its upload was queued: the slot is free already
+        return True
+
+    def cancel_outside(self, cx, cz, radius):
+        """
+        Cancels the requests of the chunks further than radius chunks from
+        a chunk. Returns how many were.
+
+        :param cx: The center chunk x coordinate.
+        :param cz: The center chunk z coordinate.
+        :param radius: The distance to keep, in chunks.
+        """
+        with self.lock:
+            keys = list(self.jobs)
+        stale = [(x, z) for x, z in map(key_to_chunk, keys)
+                 if (x - cx) ** 2 + (z - cz) ** 2 > radius * radius]
+        for x, z in stale:
+            self.cancel(x, z)
+        return len(stale)
+
+    def busy(self, cx, cz):
+        """
+        Whether a chunk is pending or being built: its upload isn't handed
+        off to the renderer yet. Thread safe.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        with self.lock:
+            return chunk_key(cx, cz) in self.jobs
+
+    def level(self, cx, cz, default=0):
+        """
+        Returns the level of detail of a chunk's uploaded mesh, or default
+        if it has none. Thread safe.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param default: The level to return for a chunk without a mesh.
+        """
+        with self.lock:
+            return self.levels.get(chunk_key(cx, cz), (cx, cz, default))[2]
+
+    def uploaded(self):
+        """
+        Returns the (cx, cz, level of detail) of every uploaded mesh, as a
+        list copied under the lock. Thread safe.
+        """
+        with self.lock:
+            return list(self.levels.values())
+
+    def distance(self, cx, cz):
+        """
+        Returns the horizontal distances from the camera to chunk centers,
+        in chunks, or 0 without a camera.
+        """
+        if self.camera is None:
+            return np.zeros(np.shape(cx))
+        x, _, z = self.camera.state["position"]
+        return np.hypot((cx + 0.5) - x / CHUNK_SIZE, (cz + 0.5) - z / CHUNK_SIZE)
+
+    def _next_pending(self):
+        """
+        Takes the pending chunk to build next: the nearest to the camera, or
+        the first requested without one. Call with self.lock held.
+        """
+        if self.camera is None:
+            key = next(iter(self.pending))
+        else:
+            keys = list(self.pending)
+            cx, cz = np.array([self.pending[key] for key in keys]).T
+            key = keys[int(np.argmin(self.distance(cx, cz)))]
+        return self.pending.pop(key)
+
+    def _submit(self):
+        """
+        Hands pending chunks to the workers while there are free slots.
+        Loaded chunks are sent from the world, saved ones from the store,
+        and the others are generated.
+        """
+        while True:
+            with self.lock:
+                if not (self.pending and self.free_slots):
+                    return
+                cx, cz = self._next_pending()
+                key = chunk_key(cx, cz)
+                job = self.jobs[key]
+                slot = self.free_slots.popleft()
+
+            x0, z0 = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+            box = (x0 - 1, -1, z0 - 1, x0 + CHUNK_SIZE + 1, WORLD_HEIGHT + 1, z0 + CHUNK_SIZE + 1)
+            chunk = self.world.chunks.get(key)
+            store = self.world.store
+
+            # The chunk and its neighbours, from the world or the store
+            inputs = {}
+            codecs = {}
+            loaded = np.array([[chunk_key(cx + dx, cz + dz) in self.world.chunks for dz in (-1, 0, 1)]
+                               for dx in (-1, 0, 1)])
+            if loaded.any():
+                inputs["blocks"] = self.world.get_region(*box)
+            if store is not None:
+                for i, k in zip(*np.nonzero(~loaded)):
+                    raw = store.load_raw(cx + int(i) - 1, cz + int(k) - 1)
+                    if raw is not None:
+                        codecs[(int(i), int(k))] = raw[0]
+                        inputs["stored_{}{}".format(i, k)] = np.frombuffer(raw[1], dtype=np.uint8)
+            if chunk is not None:
+                job["source"] = "world"
+                if chunk.light is not None:
+                    inputs["light"] = self.world.get_light_region(*box)
+            else:
+                job["source"] = "store" if (1, 1) in codecs else "terrain"
+
+            stored = None
+            if inputs:
+                layout = _pack(slot.buf, inputs)
+                stored = (layout, None if layout is not None else inputs, codecs, loaded)
+            future = self.executor.submit(_build_chunk, cx, cz, slot.name, stored, job["level"])
+            future.add_done_callback(lambda future, slot=slot, key=key: self._done(slot, key, future))
+
+    def _done(self, slot, key, future):
+        """
+        Queues a finished chunk's upload: as a job of the scheduler, nearest
+        to the camera first, or for shared_context() to poll. Runs in the
+        executor's thread, where the scheduler's back-pressure holds back
+        the results.
+        """
+        if self.scheduler is None:
+            self.done.put((slot, key, future))
+            return
+        cx, cz = key_to_chunk(key)
+        job = self.scheduler.submit(lambda: self._finish(slot, key, future), float(self.distance(cx, cz)),
+                                    ("chunk", key), lambda: self._release(slot, key))
+        if job is None:  # Closed
+            self._release(slot, key)
+
+    def _release(self, slot, key):
+        """
+        Drops a chunk's job and frees its slot.
+        """
+        with self.lock:
+            self.jobs.pop(key, None)
+            self.free_slots.append(slot)
+
+    def _finish(self, slot, key, future):
+        """
+        Stores and uploads a finished chunk, unless it was cancelled, frees
+        its slot and submits the next pending chunks. Runs in the shared
+        context.
+        """
+        with self.lock:
+            job = self.jobs[key]
+        try:
+            cx, cz, layout, arrays = future.result()
+        except Exception:
+            logger.exception("[core/pipeline] Chunk job failed")
+            self._release(slot, key)
+            self._submit()
+            return
+
+        if not job["cancelled"]:
+            if layout is not None:
+                arrays = {name: _unpack(slot.buf, layout, name) for name in layout}
+            self.upload(cx, cz, arrays, job)
+        del arrays  # Release the views before the slot is reused
+        self._release(slot, key)  # Only once its upload is handed off, see SectionRemesher.remesh()
+        self._submit()
+
+    def shared_context(self):
+        """
+        Stores and uploads the finished chunks, without a scheduler. Runs in
+        the shared context.
+        """
+        while True:
+            try:
+                slot, key, future = self.done.get_nowait()
+            except queue.Empty:
+                break
+            self._finish(slot, key, future)
+
+    def upload(self, cx, cz, arrays, job):
+        """
+        Stores a finished chunk in the world and uploads its mesh.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param arrays: The arrays built by the worker.
+        :param job: The chunk's level and source ("terrain", "store" or
+                    "world": a remesh, which leaves the world as it is).
+        """
+        if job["source"] != "world":
+            chunk = Chunk(cx, cz)
+            chunk.set_blocks(arrays["blocks"])
+            self.world.add_chunk(chunk)
+            if job["source"] == "terrain" and self.world.store is not None:
+                self.world.store.save(cx, cz, arrays["blocks"])
+        else:
+            chunk = self.world.chunks.get(chunk_key(cx, cz))
+        if "light" in arrays and chunk is not None and chunk.light is None:
+            chunk.light = np.array(arrays["light"])
+        with self.lock:
+            self.levels[chunk_key(cx, cz)] = (cx, cz, job["level"])
+
+        id = "chunk_{}_{}".format(cx, cz)
+        bounds = None
+        if "packed" in arrays:
+            packed = arrays["packed"].view(PACKED_VERTEX)
+            origin = (cx * CHUNK_SIZE, cz * CHUNK_SIZE)
+            if len(packed):
+                bounds = ((origin[0] + packed["x"].min(), packed["y"].min(), origin[1] + packed["z"].min()),
+                          (origin[0] + packed["x"].max(), packed["y"].max(), origin[1] + packed["z"].max()))
+            self.renderer.stream.upload(id, (packed,), bounds, origin, arrays.get("sections"))
+            return
+
+        if len(arrays["vertices"]):
+            vertices = arrays["vertices"].reshape(-1, 3)
+            bounds = (vertices.min(axis=0), vertices.max(axis=0))
+        self.renderer.stream.upload(id, (arrays["vertices"], arrays["texcoords"]), bounds,
+                                    sections=arrays.get("sections"))
+
+    def shutdown(self):
+        """
+        Stops the workers and frees the shared memory.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+        self.slots = []
@@ -0,0 +1,224 @@
+# imports
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from OpenGL.GL import *
+
+from core.config import PROFILER_ENABLED, PROFILER_SAMPLES
+
+logger = logging.getLogger("PyCraft")
+
+# constants
+MAX_EVENTS = 200000  # Trace events kept for export
+
+
+class NullZone:
+    """
+    NullZone
+
+    The zone handed out while the profiler is disabled: does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_ZONE = NullZone()
+
+
+class Zone:
+    """
+    Zone
+
+    Times a block of code on the CPU, and optionally on the GPU with a
+    GL_TIME_ELAPSED query. Use it through Profiler.zone().
+    """
+
+    def __init__(self, profiler, name, gpu):
+        self.profiler = profiler
+        self.name = name
+        self.gpu = gpu
+        self.query = None
+
+    def __enter__(self):
+        if self.gpu:
+            self.query = self.profiler.begin_query()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        if self.query is not None:
+            self.profiler.end_query(self.query, self.name, self.start)
+        self.profiler.record(self.name, self.start, end - self.start)
+        return False
+
+
+class Profiler:
+    """
+    Profiler
+
+    Times frames, scheduled objects and named zones:
+    rolling p50/p99 per zone, a text overlay and a Chrome trace export
+    (chrome://tracing or ui.perfetto.dev).
+
+    GPU times come from GL_TIME_ELAPSED queries, read back a few frames
+    later so the CPU never waits for them. Those queries can't nest, so
+    only the outermost GPU zone of the render thread is measured.
+    When disabled, zone() returns a shared no-op context manager.
+    """
+
+    def __init__(self, enabled=PROFILER_ENABLED, samples=PROFILER_SAMPLES):
+        """
+        Initializes the profiler.
+
+        :param enabled: Whether to start profiling right away.
+        :param samples: The number of samples per zone kept for percentiles.
+        """
+        self.enabled = enabled
+        self.samples = {}  # name -> deque of durations, in ns
+        self.size = samples
+        self.events = deque(maxlen=MAX_EVENTS)  # (name, category, thread, start, duration) in ns
+        self.queries = []  # Free GL query objects
+        self.pending = deque()  # (query, name, start) waiting for their result
+        self.gpu_busy = False  # Whether a GPU query is running
+        self.frame_start = None
+        self.epoch = time.perf_counter_ns()
+
+    def zone(self, name, gpu=False):
+        """
+        Returns a context manager timing a block of code.
+
+        :param name: The name of the zone.
+        :param gpu: Whether to also time the GPU work it issues. Only on the
+                    render thread.
+        """
+        if not self.enabled:
+            return NULL_ZONE
+        return Zone(self, name, gpu and not self.gpu_busy)
+
+    def record(self, name, start, duration, category="cpu"):
+        """
+        Records a timed zone.
+
+        :param name: The name of the zone.
+        :param start: The start time, from time.perf_counter_ns().
+        :param duration: The duration, in ns.
+        :param category: "cpu" or "gpu".
+        """
+        key = name if category == "cpu" else "gpu:" + name
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=self.size)
+        samples.append(duration)
+        self.events.append((name, category, threading.get_ident(), start, duration))
+
+    def begin_query(self):
+        """
+        Starts a GL_TIME_ELAPSED query and returns it.
+        """
+        query = self.queries.pop() if self.queries else glGenQueries(1)
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        self.gpu_busy = True
+        return query
+
+    def end_query(self, query, name, start):
+        """
+        Ends a query started by begin_query().
+
+        :param query: The query.
+        :param name: The name of the zone.
+        :param start: The CPU start time of the zone.
+        """
+        glEndQuery(GL_TIME_ELAPSED)
+        self.gpu_busy = False
+        self.pending.append((query, name, start))
+
+    def poll_queries(self):
+        """
+        Records the GPU times of the queries that have finished.
+        """
+        while self.pending:
+            query, name, start = self.pending[0]
+            if not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                break
+            self.pending.popleft()
+            self.record(name, start, int(glGetQueryObjectui64v(query, GL_QUERY_RESULT)), "gpu")
+            self.queries.append(query)
+
+    def begin_frame(self):
+        """
+        Marks the start of a frame.
+        """
+        if self.enabled:
+            self.frame_start = time.perf_counter_ns()
+
+    def end_frame(self):
+        """
+        Marks the end of a frame.
+        """
+        if self.enabled and self.frame_start is not None:
+            self.record("frame", self.frame_start, time.perf_counter_ns() - self.frame_start)
+            self.poll_queries()
+
+    def stats(self):
+        """
+        Returns {zone: {"p50", "p99", "mean", "count"}}, times in ms, over
+        the last samples of each zone.
+        """
+        stats = {}
+        for name, samples in list(self.samples.items()):
+            values = np.array(samples, dtype=np.float64) / 1e6
+            if not len(values):
+                continue
+            p50, p99 = np.percentile(values, (50, 99))
+            stats[name] = {"p50": p50, "p99": p99, "mean": values.mean(), "count": len(values)}
+        return stats
+
+    def overlay(self):
+        """
+        Returns the overlay lines: one per zone, slowest first.
+        """
+        stats = self.stats()
+        lines = ["{:<24} {:>7} {:>7}".format("zone (ms)", "p50", "p99")]
+        for name in sorted(stats, key=lambda name: -stats[name]["p50"]):
+            lines.append("{:<24} {:7.2f} {:7.2f}".format(name[:24], stats[name]["p50"], stats[name]["p99"]))
+        return lines
+
+    def drawcall(self):
+        """
+        Draws the overlay. Schedule it last, so it draws over everything.
+        """
+        if self.enabled:
+            from core.text import display_debug
+            display_debug((10, 10), self.overlay())
+
+    def export_trace(self, path):
+        """
+        Writes the recorded zones as a Chrome trace (JSON).
+        GPU zones are drawn on their own track, starting when the CPU
+        issued them.
+
+        :param path: The file to write.
+        """
+        threads = {}
+        events = []
+        for name, category, thread, start, duration in list(self.events):
+            tid = -1 if category == "gpu" else threads.setdefault(thread, len(threads))
+            events.append({
+                "name": name, "cat": category, "ph": "X", "pid": 0, "tid": tid,
+                "ts": (start - self.epoch) / 1000, "dur": duration / 1000,
+            })
+        names = [{"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": "thread %d" % tid}}
+                 for tid in threads.values()]
+        names.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": -1, "args": {"name": "GPU"}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": names + events, "displayTimeUnit": "ms"}, f)
+        logger.log(logging.DEBUG, "[core/profiler] Wrote %d trace events to %s", len(events), path)
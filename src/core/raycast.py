@@ -0,0 +1,190 @@
+# imports
+import math
+
+import numpy as np
+
+from core.collision import SOLID, clusters
+from core.world import CHUNK_SIZE, SECTION_SIZE, WORLD_HEIGHT, chunk_key
+
+# constants
+INF = float("inf")
+
+
+def look_direction(rotation):
+    """
+    Returns the unit vector the camera looks along, matching the view
+    matrix FPC.drawcall applies.
+
+    :param rotation: The camera rotation (pitch, yaw, roll) in degrees.
+    """
+    pitch, yaw = math.radians(rotation[0]), math.radians(-rotation[1])
+    return (math.sin(yaw) * math.cos(pitch), math.sin(pitch), -math.cos(yaw) * math.cos(pitch))
+
+
+def _empty_box(world, x, y, z, targets):
+    """
+    Returns the (lo, hi) corners of a box around block (x, y, z) that holds
+    no target blocks (an uniform section, an unloaded column or the space
+    above or below the world), or None if the block has to be checked.
+    """
+    cx, cz = x // CHUNK_SIZE, z // CHUNK_SIZE
+    x0, z0 = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+    if y < 0:
+        return (x0, -INF, z0), (x0 + CHUNK_SIZE, 0, z0 + CHUNK_SIZE)
+    if y >= WORLD_HEIGHT:
+        return (x0, WORLD_HEIGHT, z0), (x0 + CHUNK_SIZE, INF, z0 + CHUNK_SIZE)
+    chunk = world.chunks.get(chunk_key(cx, cz))
+    if chunk is None:
+        return (x0, 0, z0), (x0 + CHUNK_SIZE, WORLD_HEIGHT, z0 + CHUNK_SIZE)
+    section = chunk.sections[y // SECTION_SIZE]
+    if section.indices is None and not targets[section.palette[0]]:
+        y0 = y // SECTION_SIZE * SECTION_SIZE
+        return (x0, y0, z0), (x0 + CHUNK_SIZE, y0 + SECTION_SIZE, z0 + CHUNK_SIZE)
+    return None
+
+
+def raycast(world, origin, direction, max_distance=8.0, targets=SOLID):
+    """
+    Finds the first target block along a ray, with a voxel traversal
+    (Amanatides & Woo). Empty sections, unloaded chunks and the space
+    outside the world are crossed in a single step.
+
+    Returns None if nothing is hit within max_distance, else a dictionary
+    with the block position, its id, the normal of the face the ray entered
+    through ((0, 0, 0) if the ray starts inside it) and the distance.
+
+    :param world: The World.
+    :param origin: The start of the ray.
+    :param direction: The direction of the ray (needn't be normalized).
+    :param max_distance: How far to look, in blocks.
+    :param targets: Boolean table of the block ids that stop the ray.
+    """
+    length = math.sqrt(sum(c * c for c in direction))
+    if length == 0:
+        return None
+    o = [float(c) for c in origin]
+    d = [c / length for c in direction]
+    step = [1 if c > 0 else -1 for c in d]
+    delta = [abs(1 / c) if c else INF for c in d]
+    cell = [math.floor(c) for c in o]
+    normal = (0, 0, 0)
+    t = 0.0
+
+    def boundaries():
+        # Distance along the ray to the next cell boundary on each axis
+        return [((cell[a] + (step[a] > 0)) - o[a]) / d[a] if d[a] else INF for a in range(3)]
+
+    t_max = boundaries()
+    while t <= max_distance:
+        box = _empty_box(world, cell[0], cell[1], cell[2], targets)
+        if box is None:
+            block = world.get_block(cell[0], cell[1], cell[2])
+            if targets[block]:
+                return {"block": tuple(cell), "id": block, "normal": normal, "distance": t}
+            axis = t_max.index(min(t_max))
+            t = t_max[axis]
+            cell[axis] += step[axis]
+            t_max[axis] += delta[axis]
+        else:
+            # Jump to where the ray leaves the box
+            lo, hi = box
+            exits = [((hi[a] if d[a] > 0 else lo[a]) - o[a]) / d[a] if d[a] else INF for a in range(3)]
+            axis = exits.index(min(exits))
+            t = exits[axis]
+            if t == INF:
+                return None
+            for a in range(3):
+                if a == axis:
+                    cell[a] = int(hi[a]) if d[a] > 0 else int(lo[a]) - 1
+                else:
+                    # Stay inside the box despite rounding
+                    cell[a] = min(max(math.floor(o[a] + d[a] * t), lo[a]), hi[a] - 1)
+            t_max = boundaries()
+        normal = tuple(-step[a] if a == axis else 0 for a in range(3))
+    return None
+
+
+def raycast_many(world, origins, directions, max_distance=8.0, targets=SOLID):
+    """
+    Casts many rays at once. Rays are grouped into clusters of nearby
+    origins (see collision.clusters()), and the blocks around each cluster
+    are read with a single get_region() call, so far apart rays don't read
+    everything between them. Every ray of a cluster then steps one cell per
+    iteration, vectorized.
+
+    Returns a dictionary of arrays, one entry per ray: "hit" (bool),
+    "blocks" and "normals" ((n, 3) ints) and "distances" (inf on a miss).
+
+    :param world: The World.
+    :param origins: (n, 3) array of ray starts.
+    :param directions: (n, 3) array of ray directions.
+    :param max_distance: How far to look, in blocks.
+    :param targets: Boolean table of the block ids that stop the rays.
+    """
+    o = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    d = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    n = len(o)
+    result = {
+        "hit": np.zeros(n, dtype=bool),
+        "blocks": np.zeros((n, 3), dtype=np.int64),
+        "normals": np.zeros((n, 3), dtype=np.int64),
+        "distances": np.full(n, np.inf),
+    }
+    for group in clusters(o):
+        for name, values in _raycast_cluster(world, o[group], d[group], max_distance, targets).items():
+            result[name][group] = values
+    return result
+
+
+def _raycast_cluster(world, o, d, max_distance, targets):
+    """
+    Casts a cluster of rays, reading the blocks around them at once. See
+    raycast_many().
+    """
+    n = len(o)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d = d / np.linalg.norm(d, axis=1)[:, None]
+        step = np.where(d > 0, 1, -1)
+        delta = np.where(d != 0, np.abs(1 / d), np.inf)
+        cell = np.floor(o).astype(np.int64)
+        t_max = np.where(d != 0, (cell + (step > 0) - o) / d, np.inf)
+
+    result = {
+        "hit": np.zeros(n, dtype=bool),
+        "blocks": np.zeros((n, 3), dtype=np.int64),
+        "normals": np.zeros((n, 3), dtype=np.int64),
+        "distances": np.full(n, np.inf),
+    }
+
+    ends = o + np.nan_to_num(d) * max_distance
+    lo = np.floor(np.minimum(o, ends).min(axis=0)).astype(np.int64) - 1
+    hi = np.floor(np.maximum(o, ends).max(axis=0)).astype(np.int64) + 2
+    lo[1], hi[1] = max(lo[1], -1), min(hi[1], WORLD_HEIGHT + 1)
+    region = targets[world.get_region(*lo, *hi)] if (hi > lo).all() else np.zeros((0, 0, 0), dtype=bool)
+
+    t = np.zeros(n)
+    normal = np.zeros((n, 3), dtype=np.int64)
+    active = np.arange(n)
+    while len(active):
+        local = cell[active] - lo
+        inside = ((local >= 0) & (local < region.shape)).all(axis=1)
+        hit = np.zeros(len(active), dtype=bool)
+        hit[inside] = region[tuple(local[inside].T)]
+
+        done = active[hit]
+        result["hit"][done] = True
+        result["blocks"][done] = cell[done]
+        result["normals"][done] = normal[done]
+        result["distances"][done] = t[done]
+
+        # Step the others across their nearest cell boundary
+        active = active[~hit & inside]
+        axis = t_max[active].argmin(axis=1)
+        t[active] = t_max[active, axis]
+        keep = t[active] <= max_distance
+        active, axis = active[keep], axis[keep]
+        cell[active, axis] += step[active, axis]
+        t_max[active, axis] += delta[active, axis]
+        normal[active] = 0
+        normal[active, axis] = -step[active, axis]
+    return result
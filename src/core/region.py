@@ -0,0 +1,365 @@
+# imports
+import logging
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from core.allocator import Allocator
+from core.config import MAX_PENDING_SAVES, SAVE_DIR
+from core.world import BLOCK_DTYPE, CHUNK_SIZE, WORLD_HEIGHT, chunk_key
+
+logger = logging.getLogger("PyCraft")
+
+# constants
+REGION_SIZE = 32  # Chunks per region file, along x and z
+SECTOR = 4096  # Chunk data is stored in whole sectors of this many bytes
+MAGIC = b"PCRG"
+VERSION = 1
+
+# Codecs of the stored chunks
+RAW = 0  # Uncompressed: only used in memory, for chunks waiting to be written
+ZLIB = 1
+LZ4 = 2
+DEFAULT_CODEC = LZ4 if lz4 is not None else ZLIB
+ZLIB_LEVEL = 1  # Block arrays are mostly runs; higher levels barely help
+
+# File layout: a 16 byte header, the offset table, then sectors of chunk data
+HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("region_size", "<u4"), ("shape_y", "<u4")])
+ENTRY = np.dtype([("sector", "<u4"), ("sectors", "<u4"), ("length", "<u4"), ("codec", "u1"), ("pad", "u1", 3)])
+TABLE_OFFSET = HEADER.itemsize
+DATA_SECTOR = -(-(TABLE_OFFSET + REGION_SIZE * REGION_SIZE * ENTRY.itemsize) // SECTOR)
+CHUNK_SHAPE = (CHUNK_SIZE, WORLD_HEIGHT, CHUNK_SIZE)
+
+
+def region_of(cx, cz):
+    """
+    Returns the (rx, rz) region holding a chunk.
+
+    :param cx: The chunk x coordinate.
+    :param cz: The chunk z coordinate.
+    """
+    return cx // REGION_SIZE, cz // REGION_SIZE
+
+
+def encode_blocks(blocks, codec=DEFAULT_CODEC):
+    """
+    Compresses a chunk's dense block array.
+
+    :param blocks: The (16, WORLD_HEIGHT, 16) block ids.
+    :param codec: ZLIB or LZ4.
+    """
+    data = np.ascontiguousarray(blocks, dtype=BLOCK_DTYPE).tobytes()
+    if codec == LZ4:
+        return lz4.frame.compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decode_blocks(codec, data):
+    """
+    Decompresses a chunk stored by encode_blocks(). Returns a writable
+    (16, WORLD_HEIGHT, 16) array.
+
+    :param codec: The codec it was stored with.
+    :param data: The stored bytes.
+    """
+    if codec == RAW:
+        raw = bytes(data)
+    elif codec == ZLIB:
+        raw = zlib.decompress(data)
+    elif codec == LZ4:
+        if lz4 is None:
+            raise Exception("This chunk was saved with lz4, which isn't installed")
+        raw = lz4.frame.decompress(data)
+    else:
+        raise ValueError("Unknown chunk codec {}".format(codec))
+    return np.frombuffer(bytearray(raw), dtype=BLOCK_DTYPE).reshape(CHUNK_SHAPE)
+
+
+class Region:
+    """
+    Region
+
+    A file of REGION_SIZE x REGION_SIZE chunks: an offset table, then each
+    chunk's compressed blocks in whole sectors.
+    Chunks are read through a memory map, so only the sectors of the
+    chunks read are ever loaded. A rewritten chunk goes to newly allocated
+    sectors before the table points at it, and its old sectors are reused
+    later, so the file stays readable at every point. Sectors are handed out
+    by the same Allocator (core/allocator.py) as the GPU arenas' regions.
+    Methods are thread safe.
+    """
+
+    def __init__(self, path):
+        """
+        Opens a region file, creating it if needed.
+
+        :param path: The file.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        exists = os.path.exists(path)
+        self.file = open(path, "r+b" if exists else "w+b", buffering=0)
+        if not exists:
+            header = np.zeros(1, dtype=HEADER)
+            header[0] = (MAGIC, VERSION, REGION_SIZE, WORLD_HEIGHT)
+            self.file.write(header.tobytes())
+            self.file.truncate(DATA_SECTOR * SECTOR)
+
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self.map, dtype=HEADER, count=1).copy()[0]
+        if (header["magic"], header["version"], header["region_size"], header["shape_y"]) != \
+                (MAGIC, VERSION, REGION_SIZE, WORLD_HEIGHT):
+            raise Exception("{} isn't a compatible region file".format(path))
+        self.table = np.frombuffer(self.map, dtype=ENTRY, count=REGION_SIZE * REGION_SIZE,
+                                   offset=TABLE_OFFSET).copy()
+
+        # Sectors, found from the table
+        self.allocator = Allocator(1 << 32)
+        self.allocator.reserve(0, DATA_SECTOR)
+        for entry in self.table[self.table["sectors"] > 0]:
+            self.allocator.reserve(int(entry["sector"]), int(entry["sectors"]))
+
+    def index(self, cx, cz):
+        """
+        Returns a chunk's index in the table.
+        """
+        return (cz % REGION_SIZE) * REGION_SIZE + (cx % REGION_SIZE)
+
+    def contains(self, cx, cz):
+        """
+        Whether a chunk is stored.
+        """
+        return bool(self.table[self.index(cx, cz)]["sectors"])
+
+    def read_raw(self, cx, cz):
+        """
+        Returns a chunk's (codec, compressed bytes), or None if it isn't
+        stored. The bytes are copied out of the map.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        with self.lock:
+            entry = self.table[self.index(cx, cz)]
+            if not entry["sectors"]:
+                return None
+            start = int(entry["sector"]) * SECTOR
+            end = start + int(entry["length"])
+            if end > len(self.map):
+                # The file grew since it was mapped
+                self.map.close()
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            return int(entry["codec"]), self.map[start:end]
+
+    def read(self, cx, cz):
+        """
+        Returns a chunk's blocks, or None if it isn't stored.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        raw = self.read_raw(cx, cz)
+        return decode_blocks(*raw) if raw is not None else None
+
+    def write_raw(self, cx, cz, codec, data):
+        """
+        Stores a chunk's compressed bytes.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param codec: The codec of the bytes.
+        :param data: The bytes, from encode_blocks().
+        """
+        index = self.index(cx, cz)
+        sectors = -(-len(data) // SECTOR)
+        with self.lock:
+            old = self.table[index].copy()
+            sector = self.allocator.alloc(sectors)
+            self.file.seek(sector * SECTOR)
+            self.file.write(data)
+            if (sector + sectors) * SECTOR > os.fstat(self.file.fileno()).st_size:
+                self.file.truncate((sector + sectors) * SECTOR)
+
+            entry = np.zeros(1, dtype=ENTRY)
+            entry[0] = (sector, sectors, len(data), codec, 0)
+            self.file.seek(TABLE_OFFSET + index * ENTRY.itemsize)
+            self.file.write(entry.tobytes())
+            self.table[index] = entry[0]
+            if old["sectors"]:
+                self.allocator.free(int(old["sector"]))
+
+    def write(self, cx, cz, blocks, codec=DEFAULT_CODEC):
+        """
+        Compresses and stores a chunk's blocks.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param blocks: The (16, WORLD_HEIGHT, 16) block ids.
+        :param codec: ZLIB or LZ4.
+        """
+        self.write_raw(cx, cz, codec, encode_blocks(blocks, codec))
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        with self.lock:
+            self.map.close()
+            self.file.close()
+
+
+class RegionStore:
+    """
+    RegionStore
+
+    The region files of a world, opened on demand, with a background writer.
+    save() only queues a copy of the chunk; the writer thread compresses and
+    writes it. Saving a chunk again before it was written replaces the
+    queued copy, and load() sees queued chunks, so it's always up to date.
+    save() blocks while MAX_PENDING_SAVES chunks are waiting, so a producer
+    can't outrun the disk.
+    """
+
+    def __init__(self, directory=SAVE_DIR, codec=DEFAULT_CODEC):
+        """
+        Opens a world's region directory, creating it if needed.
+
+        :param directory: The directory.
+        :param codec: The codec new chunks are written with.
+        """
+        self.directory = directory
+        self.codec = codec
+        os.makedirs(directory, exist_ok=True)
+        self.regions = {}  # (rx, rz) -> Region
+        self.regions_lock = threading.Lock()
+
+        self.pending = OrderedDict()  # chunk key -> (cx, cz, blocks) waiting to be written
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.writer, name="RegionStore writer", daemon=True)
+        self.thread.start()
+
+    def region(self, cx, cz, create=False):
+        """
+        Returns the Region holding a chunk, or None if its file doesn't exist
+        and create is False.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param create: Whether to create the file if it doesn't exist.
+        """
+        rx, rz = region_of(cx, cz)
+        with self.regions_lock:
+            region = self.regions.get((rx, rz))
+            if region is None:
+                path = os.path.join(self.directory, "r.{}.{}.pcr".format(rx, rz))
+                if not create and not os.path.exists(path):
+                    return None
+                region = self.regions[(rx, rz)] = Region(path)
+            return region
+
+    def contains(self, cx, cz):
+        """
+        Whether a chunk is saved (or waiting to be).
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        if chunk_key(cx, cz) in self.pending:
+            return True
+        region = self.region(cx, cz)
+        return region is not None and region.contains(cx, cz)
+
+    def load_raw(self, cx, cz):
+        """
+        Returns a chunk's (codec, data) for decode_blocks(), or None if it
+        isn't saved. Decoding can then happen elsewhere, e.g. in a worker.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        with self.condition:
+            queued = self.pending.get(chunk_key(cx, cz))
+        if queued is not None:
+            return RAW, queued[2].tobytes()
+        region = self.region(cx, cz)
+        return region.read_raw(cx, cz) if region is not None else None
+
+    def load(self, cx, cz):
+        """
+        Returns a chunk's blocks, or None if it isn't saved.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        raw = self.load_raw(cx, cz)
+        return decode_blocks(*raw) if raw is not None else None
+
+    def save(self, cx, cz, blocks):
+        """
+        Queues a chunk to be written by the background writer.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param blocks: The (16, WORLD_HEIGHT, 16) block ids; copied.
+        """
+        blocks = np.array(blocks, dtype=BLOCK_DTYPE)
+        key = chunk_key(cx, cz)
+        with self.condition:
+            while len(self.pending) >= MAX_PENDING_SAVES and key not in self.pending and self.running:
+                self.condition.wait()
+            self.pending[key] = (cx, cz, blocks)
+            self.condition.notify_all()
+
+    def writer(self):
+        """
+        The background writer: writes the queued chunks, oldest first.
+        """
+        while True:
+            with self.condition:
+                while not self.pending and self.running:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                key, item = next(iter(self.pending.items()))
+            cx, cz, blocks = item
+            try:
+                self.region(cx, cz, create=True).write(cx, cz, blocks, self.codec)
+            except Exception:
+                logger.exception("[core/region] Failed to save chunk %d, %d", cx, cz)
+            with self.condition:
+                # Only drop it if it wasn't saved again in the meantime
+                if self.pending.get(key) is item:
+                    del self.pending[key]
+                self.condition.notify_all()
+
+    def flush(self):
+        """
+        Waits until every queued chunk is written.
+        """
+        with self.condition:
+            while self.pending:
+                self.condition.wait()
+
+    def close(self):
+        """
+        Writes the queued chunks, stops the writer and closes the files.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+        with self.regions_lock:
+            for region in self.regions.values():
+                region.close()
+            self.regions.clear()
+        logger.log(logging.DEBUG, "[core/region] Closed the region store %s", self.directory)
@@ -0,0 +1,156 @@
+# imports
+import logging
+
+import numpy as np
+
+from core.config import REMESH_SECTIONS_PER_FRAME
+from core.mesher import join_meshes, mesh_blocks, mesh_sections
+from core.renderer import UNBOUNDED
+from core.vertex_format import QUAD_VERTICES, encode
+from core.world import CHUNK_SIZE, SECTION_SIZE, SECTIONS, WORLD_HEIGHT, chunk_key
+
+logger = logging.getLogger("PyCraft")
+
+
+class SectionRemesher:
+    """
+    SectionRemesher
+
+    Keeps chunk meshes up to date with block edits, a section at a time.
+    Edits mark the sections they affect in World.dirty_sections (see
+    World.mark_dirty()); each frame, up to REMESH_SECTIONS_PER_FRAME of
+    them, nearest to the camera first, are meshed on their own (a 16³
+    section with its border) and patched into their chunk's buffer with
+    Renderer.patch(). Only that section is written from the CPU, the rest of
+    the buffer being copied by the GPU, so an edit costs a few milliseconds
+    whatever the view distance.
+    Chunks meshed without sections (the coarser levels of detail) are
+    remeshed whole, through the pipeline if there is one.
+    Schedule its drawcall before the renderer's.
+    """
+
+    def __init__(self, world, renderer, uv_table=None, tile_table=None, greedy=False, pipeline=None, camera=None):
+        """
+        Initializes the remesher.
+
+        :param world: The World, whose dirty sections are remeshed.
+        :param renderer: The Renderer holding the chunk buffers.
+        :param uv_table: See mesher.mesh_blocks().
+        :param tile_table: See mesher.mesh_blocks().
+        :param greedy: See mesher.mesh_blocks().
+        :param pipeline: Optional ChunkPipeline, to remesh whole chunks with.
+        :param camera: Optional FPC, to remesh the nearest sections first.
+        """
+        self.world = world
+        self.renderer = renderer
+        self.uv_table = uv_table
+        self.tile_table = tile_table
+        self.greedy = greedy
+        self.pipeline = pipeline
+        self.camera = camera
+
+    def drawcall(self):
+        """
+        Remeshes and patches in the dirty sections, up to the frame's budget.
+        """
+        dirty = self.world.dirty_sections
+        if not dirty:
+            return
+        sections = list(dirty)
+        if self.camera is not None and len(sections) > REMESH_SECTIONS_PER_FRAME:
+            x, y, z = self.camera.state["position"]
+            center = (np.array(sections, dtype=np.float64) + 0.5) * (CHUNK_SIZE, CHUNK_SIZE, SECTION_SIZE)
+            distance = np.hypot(np.hypot(center[:, 0] - x, center[:, 1] - z), center[:, 2] - y)
+            sections = [sections[i] for i in np.argsort(distance)]
+        for cx, cz, sy in sections[:REMESH_SECTIONS_PER_FRAME]:
+            if (cx, cz, sy) not in dirty:
+                continue  # Remeshed with its whole chunk this frame
+            if self.remesh(cx, cz, sy):
+                dirty.discard((cx, cz, sy))
+
+    def remesh(self, cx, cz, sy):
+        """
+        Remeshes a section and patches it into its chunk's buffer.
+        Returns False if it has to wait: its chunk is still being built by
+        the pipeline, or its new mesh is still being uploaded, and either
+        may not have the edit.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param sy: The section index.
+        """
+        key = chunk_key(cx, cz)
+        id = "chunk_{}_{}".format(cx, cz)
+        # Jobs are only dropped once their upload is handed off, so checking
+        # in this order can't miss one in between
+        if (self.pipeline is not None and self.pipeline.busy(cx, cz)) or self.renderer.uploading(id):
+            return False
+        chunk = self.world.chunks.get(key)
+        buffer = self.renderer.buffers.get(id)
+        if chunk is None or buffer is None:
+            return True  # Not drawn: it will be meshed with the edit when it is
+        if buffer["sections"] is None:
+            self.remesh_chunk(cx, cz)
+            # That takes every edit of the chunk along, whatever section
+            self.world.dirty_sections.difference_update((cx, cz, other) for other in range(SECTIONS))
+            return True
+
+        x0, y0, z0 = cx * CHUNK_SIZE, sy * SECTION_SIZE, cz * CHUNK_SIZE
+        box = (x0 - 1, y0 - 1, z0 - 1, x0 + CHUNK_SIZE + 1, y0 + SECTION_SIZE + 1, z0 + CHUNK_SIZE + 1)
+        padded = self.world.get_region(*box)
+        light = self.world.get_light_region(*box) if chunk.light is not None else None
+        mesh = mesh_blocks(padded, (x0, y0, z0), self.uv_table, self.tile_table, self.greedy, light)
+        self.renderer.patch(id, sy, self.arrays(mesh, cx, cz), self.bounds(mesh))
+        return True
+
+    def remesh_chunk(self, cx, cz):
+        """
+        Remeshes a whole chunk: through the pipeline, at its current level
+        of detail, or else right away at full detail, laid out by sections
+        (which also works for a chunk that isn't drawn yet).
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        key = chunk_key(cx, cz)
+        if self.pipeline is not None:
+            self.pipeline.remesh(cx, cz, self.pipeline.level(cx, cz))
+            return
+
+        x0, z0 = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+        box = (x0 - 1, -1, z0 - 1, x0 + CHUNK_SIZE + 1, WORLD_HEIGHT + 1, z0 + CHUNK_SIZE + 1)
+        padded = self.world.get_region(*box)
+        light = self.world.get_light_region(*box) if self.world.chunks[key].light is not None else None
+        sections = mesh_sections(padded, (x0, 0, z0), self.uv_table, self.tile_table, self.greedy, light)
+        mesh = join_meshes(sections)
+        counts = np.array([section.count for section in sections], dtype=np.int64)
+
+        id = "chunk_{}_{}".format(cx, cz)
+        renderer = self.renderer
+        if id in renderer.buffers:
+            renderer.remove_buffer(id)
+        renderer.create_buffer(id, self.bounds(mesh) or UNBOUNDED, (x0, z0))
+        if renderer.packed:
+            renderer.modify_packed(id, *self.arrays(mesh, cx, cz))
+            counts = counts // 6 * QUAD_VERTICES
+        else:
+            renderer.modify(id, mesh.vertices, mesh.texcoords)
+        renderer.set_sections(id, counts)
+        logger.log(logging.DEBUG, "[core/remesh] Remeshed chunk %d, %d by sections", cx, cz)
+
+    def arrays(self, mesh, cx, cz):
+        """
+        Returns a mesh's vertex arrays, in the renderer's format.
+        """
+        if self.renderer.packed:
+            return (encode(mesh, (cx * CHUNK_SIZE, cz * CHUNK_SIZE)),)
+        return mesh.vertices, mesh.texcoords
+
+    def bounds(self, mesh):
+        """
+        Returns the (mins, maxs) box around a mesh, or None if it's empty.
+        """
+        if not mesh.count:
+            return None
+        vertices = mesh.vertices.reshape(-1, 3)
+        return vertices.min(axis=0), vertices.max(axis=0)
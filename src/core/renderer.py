@@ -1,12 +1,31 @@
 # imports
 import ctypes
+import logging
+import queue
+import threading
+from collections import deque
 
+import numpy as np
 from OpenGL.GL import *
 
-from core.buffer import Buffer
+from core.buffer import Arena
+from core.config import BUFFER_SIZE, RENDER_DISTANCE
+from core.frustum import cull, extract_planes, pack_boxes, view_matrix
+from core.profiler import Profiler
+from core.shader import (BLOCK_ARRAY_FRAGMENT_SHADER, BLOCK_FRAGMENT_SHADER, BLOCK_VERTEX_SHADER, Shader,
+                         tile_rects)
+from core.stream import SIGNALED, StreamUploader
+from core.vertex_format import PACKED_STRIDE, QUAD_INDICES, QUAD_VERTICES, quad_indices
+from core.world import CHUNK_SIZE
+
+logger = logging.getLogger("PyCraft")
 
 # constants
 flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+VERTEX_STRIDE = 3 * 4  # x, y, z GLfloats
+TEXTURE_STRIDE = 2 * 4  # u, v GLfloats
+MIN_REGION = 6 * 256  # Vertices reserved for a buffer on its first write
+UNBOUNDED = ((-1e30,) * 3, (1e30,) * 3)  # Bounds of buffers that are never culled
 
 
 class Renderer:
@@ -14,87 +33,607 @@ class Renderer:
     Renderer
 
     The renderer class for PyCraft: with buffer threading support.
+    Buffers are regions of a few large shared arenas, which grow or move
+    their region as needed. Each arena is drawn with one multi-draw call,
+    from a command list that is only rebuilt when buffers or their
+    visibility change. Buffers with bounds are frustum and distance culled
+    against the camera, if there is one.
+
+    Meshes built off the render thread go through self.stream, and are
+    switched in by drawcall() once their upload fence has signalled.
+    Replaced regions are freed once a fence placed after the last frame that
+    could draw them has signalled.
+
+    With packed=True, buffers hold PACKED_VERTEX quads (see
+    core/vertex_format.py) instead of float vertices and texcoords, drawn
+    as indexed quads by the block shader. That needs OpenGL 4.3, and is the
+    only way to draw with a texture array (TextureAtlas(array=True)).
     """
 
-    def __init__(self, window, texture_manager):
+    def __init__(self, window, texture_manager, camera=None, packed=False):
         """
         Initializes the renderer.
+
+        :param window: The window.
+        :param texture_manager: The texture atlas.
+        :param camera: Optional FPC to cull buffers against.
+        :param packed: Whether buffers use the packed vertex format.
         """
         # Window stuff
         self.window = window
+        self.profiler = window.profiler if window is not None else Profiler(enabled=False)
         
         # Texture stuff
         self.texture_manager = texture_manager
         
         # buffer stuff
+        self.packed = packed
+        self.strides = (PACKED_STRIDE,) if packed else (VERTEX_STRIDE, TEXTURE_STRIDE)
+        self.arenas = []
         self.buffers = {}
+        self.lock = threading.RLock()  # Guards the arenas' allocators
+        self.removed = {}  # Buffer ID -> its uploads still in flight when it was removed, dropped as they land
         self.create_buffer("default")
 
+        # upload stuff
+        self.stream = StreamUploader(self)
+        self.handoff = queue.Queue()  # Uploads from the shared context
+        self.uploads = deque()  # Uploads waiting for their fence
+        self.retiring = []  # Regions drawn for the last time this frame
+        self.retired = deque()  # (fence, regions) waiting to be freed
+        self.drawn = None  # Fence after the last frame's draws
+
+        # draw stuff
+        self.batches = {}  # arena -> VAO and draw commands
+        self.dirty = True  # Whether the buffers changed since the last frame
+        self.entries = None  # Flat arrays of the drawable buffers
+        self.entry_index = {}  # Buffer ID -> its index in the entries
+        self.visible = None  # Which entries passed culling last frame
+        self.stats = {"draw_calls": 0, "visible": 0, "culled": 0, "triangles": 0,
+                      "upload_bytes": 0}  # upload_bytes counts up from the start
+
+        # culling stuff
+        self.camera = camera
+        self.projection = None  # Read from OpenGL when None
+        self.render_distance = RENDER_DISTANCE * CHUNK_SIZE  # In blocks
+
         # OpenGL stuff
-        self.sync = GLsync
-        glEnableClientState(GL_VERTEX_ARRAY)
-        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        self.indirect = bool(glMultiDrawArraysIndirect)
         glEnable(GL_TEXTURE_2D)
+        if packed:
+            if not self.indirect:
+                raise Exception("The packed vertex format needs OpenGL 4.3")
+            array = getattr(texture_manager, "array", False)
+            self.shader = Shader(BLOCK_VERTEX_SHADER, BLOCK_ARRAY_FRAGMENT_SHADER if array else BLOCK_FRAGMENT_SHADER)
+            self.shader.use()
+            self.shader.set_int("atlas", 0)
+            self.shader.set_vec4_array("tiles", tile_rects(texture_manager))
+            glUseProgram(0)
+            self.index_buffer = glGenBuffers(1)  # Shared quad indices
+            self.index_quads = 0  # Quads the index buffer covers
+        else:
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
 
-    def create_buffer(self, id):
+    def create_buffer(self, id, bounds=UNBOUNDED, origin=(0, 0)):
         """
         Creates a buffer.
 
         :param id: The ID of the buffer.
+        :param bounds: The (mins, maxs) box around its vertices, for culling.
+        :param origin: The (x, z) its packed vertices are relative to.
         """
-        # Create the buffers
-        vertices_vbo = Buffer(id + "_vertices")
-        texture_vbo = Buffer(id + "_texture")
-        
+        # The region is allocated on the first write
+        self.removed.pop(id, None)  # Uploads from before it was removed still don't apply
         self.buffers[id] = {
-            "vertices_buffer": vertices_vbo,
-            "texture_buffer": texture_vbo,
-            "vertices": [],
-            "texture": [],
+            "arena": None,
+            "first": 0,
+            "capacity": 0,
+            "count": 0,  # Vertices written so far
+            "bounds": bounds,
+            "origin": tuple(origin),
             "enabled": True,
+            "sections": None,  # Vertices per section, when laid out by sections (see patch())
         }
+
+    def set_bounds(self, id, mins, maxs):
+        """
+        Sets the box around a buffer's vertices, for culling.
+
+        :param id: The ID of the buffer.
+        :param mins: The minimum corner.
+        :param maxs: The maximum corner.
+        """
+        self.buffers[id]["bounds"] = (tuple(mins), tuple(maxs))
+        self.dirty = True
         
     def remove_buffer(self, id):
         """
-        Removes a buffer.
+        Removes a buffer. Its streamed uploads still in flight are dropped
+        when they land, rather than bringing it back.
 
         :param id: The ID of the buffer.
         """
-        del self.buffers[id]
+        in_flight = self.uploading(id)
+        if in_flight:
+            self.removed[id] = in_flight + self.removed.get(id, 0)
+        buffer = self.buffers.pop(id, None)
+        if buffer is None:
+            if not in_flight:
+                raise KeyError(id)
+            return
+        if buffer["arena"] is not None:
+            self.retiring.append((buffer["arena"], buffer["first"]))
+        self.dirty = True
+
+    def set_enabled(self, id, enabled):
+        """
+        Enables or disables drawing a buffer.
+
+        :param id: The ID of the buffer.
+        :param enabled: Whether to draw it.
+        """
+        if self.buffers[id]["enabled"] != enabled:
+            self.buffers[id]["enabled"] = enabled
+            self.dirty = True
+
+    def allocate(self, count):
+        """
+        Allocates room for some vertices in one of the arenas, adding a new
+        one if needed. Returns (arena, first vertex). Thread safe.
+
+        :param count: The number of vertices.
+        """
+        with self.lock:
+            for arena in self.arenas:
+                first = arena.alloc(count)
+                if first is not None:
+                    return arena, first
+
+            arena = Arena("arena_{}".format(len(self.arenas)), self.strides,
+                          max(BUFFER_SIZE, count * max(self.strides)))
+            self.arenas.append(arena)
+            return arena, arena.alloc(count)
+
+    def free(self, arena, first):
+        """
+        Frees a region allocated with allocate().
+
+        :param arena: The arena.
+        :param first: The first vertex of the region.
+        """
+        with self.lock:
+            arena.free(first)
+
+    def compact(self, arena):
+        """
+        Compacts an arena and moves its buffers' regions accordingly, on the
+        GPU. Call this from the render thread. It does nothing (and returns
+        False) while any upload or retired region is still in flight, since
+        those hold offsets that compaction would invalidate, or while the last
+        frame drawn may still be drawing the regions it would move.
+
+        :param arena: The arena.
+        """
+        with self.lock:
+            if (self.stream.busy or self.uploads or self.retiring or self.retired
+                    or not self.handoff.empty()):
+                return False
+            moves = arena.compact(self.drawn)
+            if moves is None:
+                return False
+            moves = {src: dst for src, dst, _ in moves}
+        for buffer in self.buffers.values():
+            if buffer["arena"] is arena and buffer["first"] in moves:
+                buffer["first"] = moves[buffer["first"]]
+        self.dirty = True
+        return True
+
+    def reserve(self, id, count, written=None):
+        """
+        Makes sure a buffer has room for some vertices, moving its data to a
+        larger region if needed. The GPU copies the data over, after the
+        frames already drawn from the old region, which is then retired.
+
+        :param id: The ID of the buffer.
+        :param count: The number of vertices.
+        :param written: Optional (start, end) vertices the caller overwrites
+                        next. They aren't copied, so the copy can't land on
+                        top of the new data written from the CPU.
+        """
+        buffer = self.buffers[id]
+        if count <= buffer["capacity"]:
+            return
+        capacity = max(count, 2 * buffer["capacity"], MIN_REGION)
+        arena, first = self.allocate(capacity)
+        if buffer["arena"] is not None:
+            start, end = written if written is not None else (buffer["count"], buffer["count"])
+            for src, stop in ((0, min(start, buffer["count"])), (end, buffer["count"])):
+                if stop > src:
+                    buffer["arena"].copy_to(arena, buffer["first"] + src, first + src, stop - src)
+            self.retiring.append((buffer["arena"], buffer["first"]))
+        buffer["arena"] = arena
+        buffer["first"] = first
+        buffer["capacity"] = capacity
+        self.dirty = True
 
     def modify(self, id, vertices, texture, offset=0):
         """
         Modifies a buffer's data.
+        Vertices and texture coordinates can be NumPy arrays, memoryviews or
+        anything else with float32 data; each is written with one memmove.
 
         :param id: The ID of the buffer.
         :param vertices: The vertices.
         :param texture: The texture.
-        :param offset: The offset.
+        :param offset: The offset into the vertices, in GLfloats, or -1 to append.
         """
+        buffer = self.buffers[id]
         if offset == -1:
-            offset = len(self.buffers[id]["vertices"])
-            _offset = len(self.buffers[id]["texture"])
+            offset = buffer["count"] * 3
+        vertices = np.ravel(np.asarray(vertices, dtype=np.float32))
+        texture = np.ravel(np.asarray(texture, dtype=np.float32))
+        _offset = offset // 3 * 2
+        count = max((offset + len(vertices)) // 3, (_offset + len(texture)) // 2)
+
         # Modify the buffers
-        self.buffers[id]["vertices_buffer"].modify(data=vertices, offset=offset)
-        self.buffers[id]["texture_buffer"].modify(data=texture, offset=_offset)
-        self.buffers[id]["vertices"][offset:offset + len(vertices)] = vertices
-        self.buffers[id]["texture"][offset:offset + len(texture)] = texture
+        self.reserve(id, count, (offset // 3, count))
+        buffer["arena"].buffers[0].write(vertices, buffer["first"] * VERTEX_STRIDE + offset * 4)
+        buffer["arena"].buffers[1].write(texture, buffer["first"] * TEXTURE_STRIDE + _offset * 4)
+        self.stats["upload_bytes"] += vertices.nbytes + texture.nbytes
+        if count > buffer["count"]:
+            buffer["count"] = count
+            self.dirty = True
+
+    def set_sections(self, id, counts):
+        """
+        Declares that a buffer's vertices are laid out by sections, one
+        after another, so patch() can replace a single section.
+
+        :param id: The ID of the buffer.
+        :param counts: The number of vertices of each section, in order.
+        """
+        self.buffers[id]["sections"] = np.array(counts, dtype=np.int64)
+
+    def patch(self, id, section, arrays, bounds=None):
+        """
+        Replaces one section of a buffer laid out by sections (see
+        set_sections()). The section is written to a fresh region, and the
+        GPU copies the sections around it over, so frames in flight keep
+        drawing the old region untouched; it is retired like the regions
+        apply_uploads() replaces. The draw commands are updated in place,
+        without gathering every buffer again. Call this from the render
+        thread.
+
+        :param id: The ID of the buffer.
+        :param section: The index of the section.
+        :param arrays: One array per vertex attribute, as for
+                       StreamUploader.upload().
+        :param bounds: Optional (mins, maxs) box around the new vertices;
+                       the buffer's bounds grow to include it.
+        """
+        buffer = self.buffers[id]
+        sections = buffer["sections"]
+        arrays = [np.ascontiguousarray(array).view(np.uint8).reshape(-1) for array in arrays]
+        new = len(arrays[0]) // self.strides[0]
+        start = int(sections[:section].sum())
+        end = start + int(sections[section])
+        tail = buffer["count"] - end
+        count = buffer["count"] - (end - start) + new
+
+        capacity = buffer["capacity"]
+        if count > capacity:
+            capacity = max(count, 2 * capacity, MIN_REGION)
+        arena, first = self.allocate(capacity)
+        buffer["arena"].copy_to(arena, buffer["first"], first, start)
+        buffer["arena"].copy_to(arena, buffer["first"] + end, first + start + new, tail)
+        for array, target, stride in zip(arrays, arena.buffers, arena.strides):
+            target.write(array, (first + start) * stride)
+        self.retiring.append((buffer["arena"], buffer["first"]))
+        buffer["arena"] = arena
+        buffer["first"] = first
+        buffer["capacity"] = capacity
+        self.stats["upload_bytes"] += sum(len(array) for array in arrays)
+
+        sections[section] = new
+        buffer["count"] = count
+        if bounds is not None:
+            mins, maxs = buffer["bounds"]
+            buffer["bounds"] = (tuple(np.minimum(mins, bounds[0]).tolist()),
+                                tuple(np.maximum(maxs, bounds[1]).tolist()))
+        self.update_entry(id)
+
+    def update_entry(self, id):
+        """
+        Updates a buffer's entry in place after its region, count or bounds
+        changed, and has the draw commands rebuilt. Falls back to gathering
+        every buffer again if it has no entry yet.
+
+        :param id: The ID of the buffer.
+        """
+        i = self.entry_index.get(id)
+        if self.dirty or i is None:
+            self.dirty = True
+            return
+        buffer = self.buffers[id]
+        entries = self.entries
+        entries["arenas"][i] = self.arenas.index(buffer["arena"])
+        entries["firsts"][i] = buffer["first"]
+        entries["counts"][i] = buffer["count"]
+        entries["boxes"][:, i] = pack_boxes(*buffer["bounds"])[:, 0]
+        self.visible = None
+
+    def modify_packed(self, id, packed, offset=0):
+        """
+        Modifies a packed buffer's data, with one memmove.
+
+        :param id: The ID of the buffer.
+        :param packed: The PACKED_VERTEX vertices, 4 per quad.
+        :param offset: The offset into the buffer, in vertices, or -1 to append.
+        """
+        buffer = self.buffers[id]
+        if offset == -1:
+            offset = buffer["count"]
+        packed = np.ascontiguousarray(packed)
+        count = offset + packed.nbytes // PACKED_STRIDE
+
+        self.reserve(id, count, (offset, count))
+        buffer["arena"].buffers[0].write(packed, (buffer["first"] + offset) * PACKED_STRIDE)
+        self.stats["upload_bytes"] += packed.nbytes
+        if count > buffer["count"]:
+            buffer["count"] = count
+            self.dirty = True
+
+    def apply_uploads(self):
+        """
+        Switches buffers over to the regions streamed in by self.stream,
+        for every upload whose fence has signalled. Never blocks.
+        """
+        while True:
+            try:
+                self.uploads.append(self.handoff.get_nowait())
+            except queue.Empty:
+                break
+
+        # Uploads finish in order, so stop at the first one still running
+        while self.uploads:
+            fence, id, arena, first, count, bounds, origin, sections = self.uploads[0]
+            if glClientWaitSync(fence, 0, 0) not in SIGNALED:
+                break
+            self.uploads.popleft()
+            glDeleteSync(fence)
+
+            if id in self.removed:
+                # Removed while this was in flight: free the region instead
+                self.removed[id] -= 1
+                if not self.removed[id]:
+                    del self.removed[id]
+                self.retiring.append((arena, first))
+                continue
+            if id not in self.buffers:
+                self.create_buffer(id)
+            buffer = self.buffers[id]
+            if buffer["arena"] is not None:
+                self.retiring.append((buffer["arena"], buffer["first"]))
+            buffer["arena"] = arena
+            buffer["first"] = first
+            buffer["capacity"] = count
+            buffer["count"] = count
+            if bounds is not None:
+                buffer["bounds"] = (tuple(bounds[0]), tuple(bounds[1]))
+            buffer["origin"] = tuple(origin)
+            buffer["sections"] = np.array(sections, dtype=np.int64) if sections is not None else None
+            self.dirty = True
+
+    def uploading(self, id):
+        """
+        Returns how many streamed uploads of a buffer are on their way (so
+        it is true when one is), each replacing the buffer's region once it
+        is switched in.
+
+        :param id: The ID of the buffer.
+        """
+        with self.handoff.mutex:
+            handed_off = sum(upload[1] == id for upload in self.handoff.queue)
+        return handed_off + sum(upload[1] == id for upload in self.uploads)
+
+    def free_retired(self):
+        """
+        Frees the replaced regions that no frame in flight can draw anymore.
+        """
+        while self.retired and glClientWaitSync(self.retired[0][0], 0, 0) in SIGNALED:
+            fence, regions = self.retired.popleft()
+            glDeleteSync(fence)
+            for arena, first in regions:
+                self.free(arena, first)
+
+    def create_batch(self, arena):
+        """
+        Creates the VAO and draw command buffer of an arena. VAOs can't be
+        shared between contexts, so this runs on the draw thread.
+
+        :param arena: The arena.
+        """
+        vao = glGenVertexArrays(1)
+        origins_buffer = None
+        glBindVertexArray(vao)
+        if self.packed:
+            arena.buffers[0].bind()
+            glEnableVertexAttribArray(0)
+            glVertexAttribIPointer(0, 4, GL_UNSIGNED_BYTE, PACKED_STRIDE, ctypes.c_void_p(0))
+            glEnableVertexAttribArray(1)
+            glVertexAttribIPointer(1, 2, GL_UNSIGNED_SHORT, PACKED_STRIDE, ctypes.c_void_p(4))
+            # One origin per draw, picked by the command's base instance
+            origins_buffer = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, origins_buffer)
+            glEnableVertexAttribArray(2)
+            glVertexAttribIPointer(2, 2, GL_INT, 0, None)
+            glVertexAttribDivisor(2, 1)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        else:
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            arena.buffers[0].bind()
+            glVertexPointer(3, GL_FLOAT, 0, None)
+            arena.buffers[1].bind()
+            glTexCoordPointer(2, GL_FLOAT, 0, None)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.batches[arena] = {
+            "vao": vao,
+            "commands_buffer": glGenBuffers(1) if self.indirect else None,
+            "origins_buffer": origins_buffer,
+            "firsts": np.zeros(0, dtype=np.int32),
+            "counts": np.zeros(0, dtype=np.int32),
+            "origins": np.zeros((0, 2), dtype=np.int32),
+        }
+
+    def build_entries(self):
+        """
+        Gathers the drawable buffers into flat arrays for culling and drawing.
+        """
+        self.dirty = False
+        arenas = {arena: i for i, arena in enumerate(self.arenas)}
+        ids = [id for id, buffer in list(self.buffers.items())
+               if buffer["enabled"] and buffer["count"] and buffer["arena"] is not None]
+        buffers = [self.buffers[id] for id in ids]
+        self.entry_index = {id: i for i, id in enumerate(ids)}
+        self.entries = {
+            "arenas": np.array([arenas[buffer["arena"]] for buffer in buffers], dtype=np.int32),
+            "firsts": np.array([buffer["first"] for buffer in buffers], dtype=np.int32),
+            "counts": np.array([buffer["count"] for buffer in buffers], dtype=np.int32),
+            "origins": np.array([buffer["origin"] for buffer in buffers], dtype=np.int32).reshape(-1, 2),
+            "boxes": pack_boxes([buffer["bounds"][0] for buffer in buffers],
+                                [buffer["bounds"][1] for buffer in buffers]),
+        }
+        self.visible = None
+
+    def update_visibility(self):
+        """
+        Culls the entries against the camera, and rebuilds the draw commands
+        if the set of visible entries changed.
+        """
+        entries = self.entries
+        if self.camera is None:
+            visible = np.ones(len(entries["counts"]), dtype=bool)
+        else:
+            projection = self.projection
+            if projection is None:
+                projection = np.array(glGetFloatv(GL_PROJECTION_MATRIX), dtype=np.float64).reshape(4, 4).T
+            position = np.asarray(self.camera.state["view_position"], dtype=np.float64)
+            planes = extract_planes(projection @ view_matrix(position, self.camera.state["rotation"]))
+            visible = cull(planes, entries["boxes"], position, self.render_distance)
+
+        self.stats["visible"] = int(visible.sum())
+        self.stats["culled"] = len(visible) - self.stats["visible"]
+        counts = entries["counts"][visible]
+        if self.packed:
+            self.stats["triangles"] = int((counts // QUAD_VERTICES).sum()) * 2
+        else:
+            self.stats["triangles"] = int(counts.sum()) // 3
+        if self.visible is None or not np.array_equal(visible, self.visible):
+            self.visible = visible
+            self.build_commands()
+
+    def reserve_indices(self, quads):
+        """
+        Grows the shared quad index buffer to cover at least some quads.
+
+        :param quads: The number of quads.
+        """
+        if quads <= self.index_quads:
+            return
+        self.index_quads = max(quads, 2 * self.index_quads, MIN_REGION // QUAD_VERTICES)
+        indices = quad_indices(self.index_quads)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def build_commands(self):
+        """
+        Rebuilds every arena's list of draws from the visible entries.
+        """
+        entries = self.entries
+        if self.packed and len(entries["counts"]):
+            self.reserve_indices(int(entries["counts"].max()) // QUAD_VERTICES)
+        for i, arena in enumerate(self.arenas):
+            if arena not in self.batches:
+                self.create_batch(arena)
+            batch = self.batches[arena]
+            mask = self.visible & (entries["arenas"] == i)
+            batch["firsts"] = np.ascontiguousarray(entries["firsts"][mask])
+            batch["counts"] = np.ascontiguousarray(entries["counts"][mask])
+
+            if self.packed and len(batch["counts"]):
+                # count, instance count, first index, base vertex, base instance
+                commands = np.zeros((len(batch["counts"]), 5), dtype=np.uint32)
+                commands[:, 0] = batch["counts"] // QUAD_VERTICES * len(QUAD_INDICES)
+                commands[:, 1] = 1
+                commands[:, 3] = batch["firsts"]
+                commands[:, 4] = np.arange(len(batch["counts"]))
+                origins = np.ascontiguousarray(entries["origins"][mask])
+                glBindBuffer(GL_DRAW_INDIRECT_BUFFER, batch["commands_buffer"])
+                glBufferData(GL_DRAW_INDIRECT_BUFFER, commands.nbytes, commands, GL_DYNAMIC_DRAW)
+                glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+                glBindBuffer(GL_ARRAY_BUFFER, batch["origins_buffer"])
+                glBufferData(GL_ARRAY_BUFFER, origins.nbytes, origins, GL_DYNAMIC_DRAW)
+                glBindBuffer(GL_ARRAY_BUFFER, 0)
+            elif self.indirect and len(batch["counts"]):
+                # count, instance count, first, base instance
+                commands = np.zeros((len(batch["counts"]), 4), dtype=np.uint32)
+                commands[:, 0] = batch["counts"]
+                commands[:, 1] = 1
+                commands[:, 2] = batch["firsts"]
+                glBindBuffer(GL_DRAW_INDIRECT_BUFFER, batch["commands_buffer"])
+                glBufferData(GL_DRAW_INDIRECT_BUFFER, commands.nbytes, commands, GL_DYNAMIC_DRAW)
+                glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
 
     def drawcall(self, lvl=0):
         """
-        Renders the buffers.
+        Renders the buffers: one multi-draw call per arena.
         """
         if lvl >= 1:
-            print("Warning: drawcall() called recursively", lvl, "times.")
+            logger.log(logging.WARNING, "[core/renderer] drawcall() called recursively %d times", lvl)
+        profiler = self.profiler
         try:
-            for id in self.buffers.keys():
-                buffer = self.buffers[id]
-                if buffer["enabled"]: # If the buffer is enabled
-                    buffer["vertices_buffer"].bind()
-                    glVertexPointer(3, GL_FLOAT, 0, None)
-                    buffer["texture_buffer"].bind()
-                    glTexCoordPointer(2, GL_FLOAT, 0, None)
-                    glDrawArrays(GL_TRIANGLES, 0, len(buffer["vertices"]) // 3)
-                    glBindBuffer(GL_ARRAY_BUFFER, 0)
+            with profiler.zone("Renderer.uploads"):
+                self.free_retired()
+                self.apply_uploads()
+            with profiler.zone("Renderer.culling"):
+                if self.dirty:
+                    self.build_entries()
+                self.update_visibility()
+            draw_calls = 0
+            if self.packed:
+                self.shader.use()
+            for arena, batch in self.batches.items():
+                n = len(batch["counts"])
+                if not n:
+                    continue
+                glBindVertexArray(batch["vao"])
+                if self.packed:
+                    glBindBuffer(GL_DRAW_INDIRECT_BUFFER, batch["commands_buffer"])
+                    glMultiDrawElementsIndirect(GL_TRIANGLES, GL_UNSIGNED_INT, None, n, 0)
+                    glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+                elif self.indirect:
+                    glBindBuffer(GL_DRAW_INDIRECT_BUFFER, batch["commands_buffer"])
+                    glMultiDrawArraysIndirect(GL_TRIANGLES, None, n, 0)
+                    glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+                else:
+                    glMultiDrawArrays(GL_TRIANGLES, batch["firsts"], batch["counts"], n)
+                draw_calls += 1
+            glBindVertexArray(0)
+            if self.packed:
+                glUseProgram(0)
+            self.stats["draw_calls"] = draw_calls
+
+            # Regions replaced this frame can be freed once it's drawn
+            if self.drawn is not None:
+                glDeleteSync(self.drawn)
+            self.drawn = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            if self.retiring:
+                self.retired.append((glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0), self.retiring))
+                self.retiring = []
         except RuntimeError:
-            self.drawcall(lvl+1)
\ No newline at end of file
+            self.drawcall(lvl+1)
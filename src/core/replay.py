@@ -0,0 +1,204 @@
+# imports
+import json
+import logging
+import math
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger("PyCraft")
+
+# constants
+PATH_VERSION = 1
+
+
+class CameraPath:
+    """
+    CameraPath
+
+    The camera position and rotation at every tick, recorded from play
+    (set it as FPC.recording) and replayed later (set it as FPC.path).
+    Replayed in a headless window, which runs one tick per frame, every
+    run draws the same frames.
+    """
+
+    def __init__(self, keyframes=None):
+        """
+        Initializes the path.
+
+        :param keyframes: A list of (position, rotation) pairs, one per tick.
+        """
+        self.keyframes = keyframes if keyframes is not None else []
+        self.index = 0  # Next keyframe to replay
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    @property
+    def done(self):
+        """
+        Whether every keyframe has been replayed.
+        """
+        return self.index >= len(self.keyframes)
+
+    def record(self, camera):
+        """
+        Appends the camera's current position and rotation.
+
+        :param camera: The FPC.
+        """
+        self.keyframes.append((list(camera.state["position"]), list(camera.state["rotation"])))
+
+    def step(self, camera):
+        """
+        Moves the camera to the next keyframe. Past the end, it stays on the
+        last one.
+
+        :param camera: The FPC.
+        """
+        if not self.keyframes:
+            return
+        position, rotation = self.keyframes[min(self.index, len(self.keyframes) - 1)]
+        camera.state["position"] = list(position)
+        camera.state["rotation"] = list(rotation)
+        camera.state["velocity"] = [0, 0, 0]
+        self.index += 1
+
+    def rewind(self):
+        """
+        Starts the replay over.
+        """
+        self.index = 0
+
+    def save(self, path):
+        """
+        Writes the path as JSON.
+
+        :param path: The file to write.
+        """
+        with open(path, "w") as f:
+            json.dump({"version": PATH_VERSION, "keyframes": self.keyframes}, f)
+        logger.log(logging.DEBUG, "[core/replay] Saved %d keyframes to %s", len(self.keyframes), path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a path written by save().
+
+        :param path: The file to read.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != PATH_VERSION:
+            raise ValueError("Unsupported camera path version: {}".format(data.get("version")))
+        return cls([(list(position), list(rotation)) for position, rotation in data["keyframes"]])
+
+    @classmethod
+    def orbit(cls, center, radius, height, ticks, pitch=-20.0):
+        """
+        Builds a path circling a point once, looking at it: a stand-in
+        when no recorded path is at hand.
+
+        :param center: The (x, z) to circle.
+        :param radius: The radius of the circle, in blocks.
+        :param height: The camera height.
+        :param ticks: The number of keyframes.
+        :param pitch: The camera pitch, in degrees.
+        """
+        keyframes = []
+        for i in range(ticks):
+            angle = 2 * math.pi * i / ticks
+            x, z = center[0] + radius * math.sin(angle), center[1] + radius * math.cos(angle)
+            # Yaw that looks back at the center (see raycast.look_direction)
+            yaw = math.degrees(angle)
+            keyframes.append(([x, height, z], [pitch, yaw, 0]))
+        return cls(keyframes)
+
+
+class FrameRecorder:
+    """
+    FrameRecorder
+
+    Collects frame times, triangles drawn and bytes uploaded for every
+    frame, and optionally dumps the frames as images for visual diffing.
+    Schedule its drawcall last, so the dumps hold the finished frame.
+    """
+
+    def __init__(self, window, renderer, dump_dir=None, dump_every=1):
+        """
+        Initializes the recorder.
+
+        :param window: The Window.
+        :param renderer: The Renderer, whose stats are read.
+        :param dump_dir: A directory to write frame_NNNNN.png to, or None.
+        :param dump_every: Dump one frame out of this many.
+        """
+        self.window = window
+        self.renderer = renderer
+        self.dump_dir = dump_dir
+        self.dump_every = dump_every
+        self.last = None  # Time of the previous drawcall
+        self.uploaded = 0  # renderer.stats["upload_bytes"] at the previous drawcall
+        self.frame_times = []  # Seconds between drawcalls, so each includes a whole frame
+        self.triangles = []
+        self.upload_bytes = []
+        if dump_dir is not None:
+            os.makedirs(dump_dir, exist_ok=True)
+
+    def drawcall(self):
+        """
+        Records the frame.
+        """
+        now = time.perf_counter()
+        stats = self.renderer.stats
+        if self.last is not None:
+            self.frame_times.append(now - self.last)
+            self.triangles.append(stats["triangles"])
+            self.upload_bytes.append(stats["upload_bytes"] - self.uploaded)
+        self.last = now
+        self.uploaded = stats["upload_bytes"]
+
+        if self.dump_dir is not None and self.window.frame % self.dump_every == 0:
+            from PIL import Image
+            Image.fromarray(self.window.read_pixels()).save(
+                os.path.join(self.dump_dir, "frame_{:05d}.png".format(self.window.frame)))
+            self.last = time.perf_counter()  # Don't count the dump in the next frame
+
+    def report(self):
+        """
+        Returns a summary: frame time percentiles (ms) and fps, and the
+        triangles and upload bytes per frame.
+        """
+        times = np.array(self.frame_times) * 1000
+        if not len(times):
+            return {"frames": 0}
+        p50, p95, p99 = np.percentile(times, (50, 95, 99))
+        triangles = np.array(self.triangles)
+        uploads = np.array(self.upload_bytes)
+        return {
+            "frames": len(times),
+            "frame_ms": {"mean": times.mean(), "p50": p50, "p95": p95, "p99": p99,
+                         "min": times.min(), "max": times.max()},
+            "fps": 1000 / times.mean(),
+            "triangles": {"mean": triangles.mean(), "max": int(triangles.max())},
+            "upload_bytes": {"mean": uploads.mean(), "max": int(uploads.max()), "total": int(uploads.sum())},
+        }
+
+
+def diff_frames(dir_a, dir_b):
+    """
+    Compares two frame dumps. Returns {filename: mean absolute difference
+    per channel, 0..255} for the frames both hold.
+
+    :param dir_a: The first dump directory.
+    :param dir_b: The second dump directory.
+    """
+    from PIL import Image
+
+    diffs = {}
+    for name in sorted(set(os.listdir(dir_a)) & set(os.listdir(dir_b))):
+        a = np.asarray(Image.open(os.path.join(dir_a, name)), dtype=np.int16)
+        b = np.asarray(Image.open(os.path.join(dir_b, name)), dtype=np.int16)
+        diffs[name] = float(np.abs(a - b).mean()) if a.shape == b.shape else float("inf")
+    return diffs
@@ -0,0 +1,212 @@
+# imports
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from core.config import MAX_SHARED_JOBS, SHARED_CONTEXT_BUDGET
+
+logger = logging.getLogger("PyCraft")
+
+
+class JobScheduler:
+    """
+    JobScheduler
+
+    The job queue of the shared context thread (Window.jobs). Jobs run
+    lowest priority first (e.g. distance to the camera), for at most
+    `budget` seconds per frame drawn, so background uploads can't starve
+    the render thread. With nothing to run, or the frame's budget spent,
+    the shared context sleeps until a job or the next frame arrives.
+
+    A job submitted with a key replaces the queued job with that key, and
+    can be cancelled by it; cancel_where() drops every job whose key went
+    stale. A cancelled job's cancel callback runs instead of the job, so
+    its producer can release what the job held.
+    submit() blocks while max_jobs jobs are queued, so producers can't run
+    ahead of the uploads, except on the shared context thread itself.
+    Methods are thread safe.
+    """
+
+    def __init__(self, budget=SHARED_CONTEXT_BUDGET, max_jobs=MAX_SHARED_JOBS):
+        """
+        Initializes the scheduler.
+
+        :param budget: Seconds of jobs to run per frame.
+        :param max_jobs: Queued jobs before submit() blocks.
+        """
+        self.budget = budget
+        self.max_jobs = max_jobs
+        self.heap = []  # (priority, sequence, job); cancelled jobs stay until popped
+        self.keys = {}  # Key -> its queued job
+        self.count = 0  # Queued jobs that aren't cancelled
+        self.sequence = itertools.count()  # First in, first out among equal priorities
+        self.condition = threading.Condition()
+        self.running = True
+        self.owner = None  # Ident of the thread that runs the jobs
+
+        # Budget
+        self.frame = 0  # Frames drawn, counted by next_frame()
+        self.budget_frame = 0  # Frame self.spent is counted for
+        self.spent = 0.0  # Seconds of jobs run in that frame
+        self.stats = {"run": 0, "cancelled": 0}
+
+    def __len__(self):
+        return self.count
+
+    def submit(self, run, priority=0.0, key=None, cancel=None, block=True):
+        """
+        Queues a job. Returns it (a dict), or None if the queue is full and
+        block is False, or the scheduler is closed.
+
+        :param run: The function to run, without arguments.
+        :param priority: Lower runs first.
+        :param key: Optional key, to replace or cancel the job by.
+        :param cancel: Optional function to run instead if the job is
+                       cancelled or replaced.
+        :param block: Whether to wait for room in the queue.
+        """
+        job = {"run": run, "cancel": cancel, "key": key, "priority": priority, "cancelled": False}
+        replaced = None
+        with self.condition:
+            full = lambda: self.count >= self.max_jobs and key not in self.keys
+            if block and threading.get_ident() != self.owner:
+                while full() and self.running:
+                    self.condition.wait()
+            elif full():
+                return None
+            if not self.running:
+                return None
+            if key is not None:
+                replaced = self.keys.get(key)
+                if replaced is not None:
+                    self._drop(replaced)
+                self.keys[key] = job
+            heapq.heappush(self.heap, (priority, next(self.sequence), job))
+            self.count += 1
+            self.condition.notify_all()
+        if replaced is not None and replaced["cancel"] is not None:
+            replaced["cancel"]()
+        return job
+
+    def cancel(self, key):
+        """
+        Cancels the queued job with a key. Returns whether there was one.
+
+        :param key: The job's key.
+        """
+        return self.cancel_where(lambda other: other == key) > 0
+
+    def cancel_where(self, stale):
+        """
+        Cancels every queued job whose key stale(key) is true, e.g. the
+        chunks that left the view distance. Returns how many were.
+
+        :param stale: A function of a key.
+        """
+        with self.condition:
+            jobs = [job for key, job in self.keys.items() if stale(key)]
+            for job in jobs:
+                self._drop(job)
+        for job in jobs:
+            if job["cancel"] is not None:
+                job["cancel"]()
+        return len(jobs)
+
+    def _drop(self, job):
+        """
+        Marks a queued job cancelled. Call with the condition held.
+        """
+        job["cancelled"] = True
+        if self.keys.get(job["key"]) is job:
+            del self.keys[job["key"]]
+        self.count -= 1
+        self.stats["cancelled"] += 1
+        self.condition.notify_all()
+
+    def _pop(self):
+        """
+        Takes the next job off the queue, or None. Call with the condition
+        held.
+        """
+        while self.heap:
+            _, _, job = heapq.heappop(self.heap)
+            if job["cancelled"]:
+                continue
+            if self.keys.get(job["key"]) is job:
+                del self.keys[job["key"]]
+            self.count -= 1
+            self.condition.notify_all()  # Room for blocked producers
+            return job
+        return None
+
+    def next_frame(self):
+        """
+        Gives the jobs a new frame's budget. The main loop calls it after
+        every frame.
+        """
+        with self.condition:
+            self.frame += 1
+            self.condition.notify_all()
+
+    def _within_budget(self):
+        """
+        Whether the current frame's budget isn't spent. Call with the
+        condition held.
+        """
+        if self.budget_frame != self.frame:
+            self.budget_frame, self.spent = self.frame, 0.0
+        return self.spent < self.budget
+
+    def run(self):
+        """
+        Runs queued jobs, first priority first, until the frame's budget is
+        spent or the queue is empty. A job that overruns the budget still
+        finishes; the overrun isn't carried over. Returns the number of jobs
+        run. Runs in the shared context.
+        """
+        self.owner = threading.get_ident()
+        ran = 0
+        while True:
+            with self.condition:
+                if not self._within_budget():
+                    break
+                job = self._pop()
+            if job is None:
+                break
+            start = time.perf_counter()
+            try:
+                job["run"]()
+            except Exception:
+                logger.exception("[core/scheduler] Job %s failed", job["key"])
+            with self.condition:
+                self.spent += time.perf_counter() - start
+            ran += 1
+        self.stats["run"] += ran
+        return ran
+
+    def wait(self, timeout=None):
+        """
+        Sleeps until there are jobs to run within a budget, the scheduler is
+        closed or the timeout passes.
+
+        :param timeout: The longest to sleep, in seconds.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not self.running or (self.count and self._within_budget()), timeout)
+
+    def close(self):
+        """
+        Cancels every queued job and wakes everyone waiting. Later jobs
+        aren't queued.
+        """
+        with self.condition:
+            self.running = False
+            jobs = [job for _, _, job in self.heap if not job["cancelled"]]
+            for job in jobs:
+                self._drop(job)
+            self.heap = []
+        for job in jobs:
+            if job["cancel"] is not None:
+                job["cancel"]()
@@ -0,0 +1,152 @@
+# imports
+import logging
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
+
+logger = logging.getLogger("PyCraft")
+
+# constants
+MAX_TILES = 128  # Atlas tiles the block shader can address
+
+# Draws PACKED_VERTEX vertices (see core/vertex_format.py). The chunk origin
+# comes from a per-instance attribute: each draw command's base instance
+# picks its buffer's origin. Kept on the compatibility profile, so the
+# camera's fixed-function matrices still apply.
+BLOCK_VERTEX_SHADER = """
+#version 330 compatibility
+#define MAX_TILES %d
+
+const vec3 RIGHT[6] = vec3[6](vec3(0, 0, -1), vec3(0, 0, 1), vec3(1, 0, 0), vec3(1, 0, 0), vec3(1, 0, 0), vec3(-1, 0, 0));
+const vec3 UP[6] = vec3[6](vec3(0, 1, 0), vec3(0, 1, 0), vec3(0, 0, -1), vec3(0, 0, 1), vec3(0, 1, 0), vec3(0, 1, 0));
+
+layout(location = 0) in uvec4 xzfl;    // x, z, face, light
+layout(location = 1) in uvec2 ytile;   // y, tile
+layout(location = 2) in ivec2 origin;  // Chunk origin, per draw
+
+uniform vec4 tiles[MAX_TILES];  // Atlas (u, v, width, height) of each tile
+
+out vec2 local;
+flat out vec4 rect;
+flat out uint tile;
+out float shade;
+
+void main() {
+    vec3 position = vec3(ivec3(xzfl.x, ytile.x, xzfl.y) + ivec3(origin.x, 0, origin.y));
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(position, 1.0);
+    local = vec2(dot(position, RIGHT[xzfl.z]), dot(position, UP[xzfl.z]));
+    rect = tiles[ytile.y];
+    tile = ytile.y;
+    shade = float(xzfl.w) / 255.0;
+}
+""" % MAX_TILES
+
+# Repeats the tile across merged quads. The gradients come from the
+# unwrapped coordinates, so the wrap doesn't show up as seams.
+BLOCK_FRAGMENT_SHADER = """
+#version 330 compatibility
+
+uniform sampler2D atlas;
+
+in vec2 local;
+flat in vec4 rect;
+in float shade;
+
+void main() {
+    vec2 uv = rect.xy + fract(local) * rect.zw;
+    vec4 color = textureGrad(atlas, uv, dFdx(local) * rect.zw, dFdy(local) * rect.zw);
+    gl_FragColor = vec4(color.rgb * shade, color.a);
+}
+"""
+
+# The same, for a TextureAtlas with array=True: one layer per tile, so the
+# texture repeats and mipmaps by itself.
+BLOCK_ARRAY_FRAGMENT_SHADER = """
+#version 330 compatibility
+
+uniform sampler2DArray atlas;
+
+in vec2 local;
+flat in uint tile;
+in float shade;
+
+void main() {
+    vec4 color = texture(atlas, vec3(local, float(tile)));
+    gl_FragColor = vec4(color.rgb * shade, color.a);
+}
+"""
+
+
+class Shader:
+    """
+    Shader
+
+    A linked GLSL program, with its uniform locations cached.
+    """
+
+    def __init__(self, vertex_source, fragment_source):
+        """
+        Compiles and links the program.
+
+        :param vertex_source: The vertex shader source.
+        :param fragment_source: The fragment shader source.
+        """
+        logger.log(logging.DEBUG, "[core/shader] Compiling shader program")
+        self.program = compileProgram(
+            compileShader(vertex_source, GL_VERTEX_SHADER),
+            compileShader(fragment_source, GL_FRAGMENT_SHADER),
+        )
+        self.uniforms = {}
+
+    def use(self):
+        """
+        Makes this the current program.
+        """
+        glUseProgram(self.program)
+
+    def location(self, name):
+        """
+        Returns the location of a uniform.
+
+        :param name: The name of the uniform.
+        """
+        if name not in self.uniforms:
+            self.uniforms[name] = glGetUniformLocation(self.program, name)
+        return self.uniforms[name]
+
+    def set_int(self, name, value):
+        """
+        Sets an int (or sampler) uniform. The program must be in use.
+
+        :param name: The name of the uniform.
+        :param value: The value.
+        """
+        glUniform1i(self.location(name), value)
+
+    def set_vec4_array(self, name, values):
+        """
+        Sets a vec4 array uniform. The program must be in use.
+
+        :param name: The name of the uniform.
+        :param values: An (n, 4) array.
+        """
+        values = np.ascontiguousarray(values, dtype=np.float32).reshape(-1, 4)
+        glUniform4fv(self.location(name), len(values), values)
+
+
+def tile_rects(texture_atlas):
+    """
+    Builds the tiles uniform of the block shader: the atlas (u, v, width,
+    height) of each tile, in the order of mesher.build_tile_table.
+
+    :param texture_atlas: The TextureAtlas with the block textures added.
+    """
+    rects = np.zeros((MAX_TILES, 4), dtype=np.float32)
+    coords = list(texture_atlas.texture_coords.values())
+    if len(coords) > MAX_TILES:
+        raise ValueError("The block shader supports at most {} tiles".format(MAX_TILES))
+    for i, c in enumerate(coords):
+        # Corners 1 and 2 are the bottom left and top left (u, v)
+        rects[i] = (c[2], c[3] % 1.0, c[0] - c[2], c[5] - c[3])
+    return rects
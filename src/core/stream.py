@@ -0,0 +1,117 @@
+# imports
+import numpy as np
+from OpenGL.GL import *
+
+from core.buffer import SIGNALED, Buffer
+from core.config import STREAM_REGIONS, STREAM_SIZE
+
+# constants
+WAIT_TIMEOUT = 1000000  # Nanoseconds per glClientWaitSync attempt
+
+
+class StreamUploader:
+    """
+    StreamUploader
+
+    Streams meshes from the shared context thread to the render thread.
+
+    Data is written into a persistently mapped staging buffer split into
+    regions used round-robin, then copied into a fresh arena region by the
+    GPU. Each region is fenced when the uploader moves past it, and is only
+    written again once that fence has signalled, so the GPU never copies
+    half-overwritten data. Each upload also gets a fence of its own, handed
+    to the render thread through Renderer.handoff: the render thread swaps
+    the buffer to its new region once that fence has signalled, without ever
+    waiting on it. Only the uploader blocks.
+    """
+
+    def __init__(self, renderer, size=STREAM_SIZE, regions=STREAM_REGIONS):
+        """
+        Initializes the uploader.
+
+        :param renderer: The Renderer to upload into.
+        :param size: The size of the staging buffer, in bytes.
+        :param regions: The number of regions to split it into.
+        """
+        self.renderer = renderer
+        self.staging = Buffer("stream", size, GL_COPY_READ_BUFFER)
+        self.region_size = size // regions
+        self.fences = [None] * regions
+        self.region = 0
+        self.cursor = 0  # Bytes used in the current region
+        self.busy = False  # Whether an upload is between allocation and handoff
+
+    def next_region(self):
+        """
+        Fences the current region and moves to the next one, waiting until
+        the GPU is done copying out of it.
+        """
+        self.fences[self.region] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.region = (self.region + 1) % len(self.fences)
+        self.cursor = 0
+
+        fence = self.fences[self.region]
+        if fence is not None:
+            while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, WAIT_TIMEOUT) not in SIGNALED:
+                pass
+            glDeleteSync(fence)
+            self.fences[self.region] = None
+
+    def copy(self, data, buffer, offset):
+        """
+        Copies data into a buffer through the staging regions.
+
+        :param data: A contiguous NumPy array.
+        :param buffer: The destination Buffer.
+        :param offset: The destination offset, in bytes.
+        """
+        data = data.view(np.uint8).reshape(-1)
+        done = 0
+        while done < len(data):
+            if self.cursor == self.region_size:
+                self.next_region()
+            size = min(len(data) - done, self.region_size - self.cursor)
+            src = self.region * self.region_size + self.cursor
+            self.staging.write(data[done:done + size], src)
+
+            self.staging.bind()
+            glBindBuffer(GL_COPY_WRITE_BUFFER, buffer.buf)
+            glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, src, offset + done, size)
+            self.cursor += size
+            done += size
+
+    def upload(self, id, arrays, bounds=None, origin=(0, 0), sections=None):
+        """
+        Uploads a buffer's whole mesh into a new region. The render thread
+        switches the buffer over once the GPU has finished the copy.
+        Runs in the shared context.
+
+        :param id: The ID of the buffer (created if it doesn't exist).
+        :param arrays: One array per vertex attribute of the renderer: the
+                       float32 vertices and texture coordinates, or the
+                       PACKED_VERTEX vertices when it's packed.
+        :param bounds: Optional (mins, maxs) box around the vertices.
+        :param origin: The (x, z) packed vertices are relative to.
+        :param sections: Optional vertices per section, if the mesh is laid
+                         out by sections (see Renderer.set_sections()).
+        """
+        arrays = [np.ascontiguousarray(array) for array in arrays]
+        count = arrays[0].nbytes // self.renderer.strides[0]
+
+        self.busy = True
+        try:
+            arena, first = self.renderer.allocate(count)
+            for array, buffer, stride in zip(arrays, arena.buffers, arena.strides):
+                self.copy(array, buffer, first * stride)
+            glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+            glBindBuffer(GL_COPY_READ_BUFFER, 0)
+
+            self.renderer.stats["upload_bytes"] += sum(array.nbytes for array in arrays)
+
+            fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            glFlush()  # Make sure the fence reaches the GPU, for the render thread
+            if sections is not None:
+                sections = np.array(sections)  # It may be a view of a reused slot
+            self.renderer.handoff.put((fence, id, arena, first, count, bounds, origin, sections))
+        finally:
+            self.busy = False
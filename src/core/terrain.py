@@ -0,0 +1,61 @@
+# imports
+import numpy as np
+
+from core.perlin import PerlinNoiseFactory
+from core.world import AIR, BLOCK_DTYPE, DIRT, GRASS, SAND, STONE, WATER, WORLD_HEIGHT
+
+# constants
+TERRAIN_SCALE = 64  # Blocks per noise unit
+TERRAIN_HEIGHT = 64  # Average ground height
+TERRAIN_AMPLITUDE = 32  # Height variation above/below the average
+WATER_LEVEL = 62  # Water fills everything below this
+DIRT_DEPTH = 4  # Dirt layer thickness under the surface
+
+
+class TerrainGenerator:
+    """
+    TerrainGenerator
+
+    Generates block columns from a seeded heightmap.
+    The same seed always generates the same terrain, in any process.
+    """
+
+    def __init__(self, seed):
+        """
+        Initializes the generator.
+
+        :param seed: The world seed.
+        """
+        self.seed = seed
+        self.noise = PerlinNoiseFactory(2, octaves=4, seed=seed)
+
+    def heightmap(self, x0, z0, size_x, size_z):
+        """
+        Returns the ground height of each column in a rectangle, as an int
+        array of shape (size_x, size_z).
+
+        :param x0, z0: The lower corner, in blocks.
+        :param size_x, size_z: The size, in blocks.
+        """
+        xs = (np.arange(size_x) + x0) / TERRAIN_SCALE
+        zs = (np.arange(size_z) + z0) / TERRAIN_SCALE
+        heights = self.noise.sample_grid(xs, zs) * TERRAIN_AMPLITUDE + TERRAIN_HEIGHT
+        return np.clip(heights.astype(np.int32), 1, WORLD_HEIGHT - 1)
+
+    def generate(self, x0, z0, size_x, size_z):
+        """
+        Generates the blocks of a rectangle of columns, as an array of shape
+        (size_x, WORLD_HEIGHT, size_z).
+
+        :param x0, z0: The lower corner, in blocks.
+        :param size_x, size_z: The size, in blocks.
+        """
+        heights = self.heightmap(x0, z0, size_x, size_z)[:, None, :]
+        y = np.arange(WORLD_HEIGHT, dtype=np.int32)[None, :, None]
+
+        surface = y == heights - 1
+        blocks = np.select(
+            [y < heights - DIRT_DEPTH, y < heights - 1,
+             surface & (heights > WATER_LEVEL), surface, y < WATER_LEVEL],
+            [STONE, DIRT, GRASS, SAND, WATER], AIR)
+        return blocks.astype(BLOCK_DTYPE)
@@ -1,10 +1,208 @@
 # imports
-import sys
+import numpy as np
+from OpenGL.GL import *
 
-from OpenGL.GL import glPushMatrix, glPopMatrix, glWindowPos2f
-from OpenGL.GLUT import glutInit, glutBitmapCharacter, GLUT_BITMAP_8_BY_13
+# constants
+FIRST_CHAR = 32  # Printable ASCII: space...
+LAST_CHAR = 126  # ...to tilde; anything else draws as "?"
+ATLAS_COLUMNS = 16
+MAX_LINES = 32  # Lines drawn by one TextRenderer.draw call
+MAX_CHARS = 128  # Characters per line, longer lines are cut
 
-glutInit(sys.argv)  # Initialize glut
+
+def build_glyph_atlas():
+    """
+    Renders the printable ASCII glyphs of PIL's default font into a grid.
+    Returns the (height, width) alpha array (top row first) and the size of
+    a cell.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default()
+    chars = [chr(c) for c in range(FIRST_CHAR, LAST_CHAR + 1)]
+    boxes = [font.getbbox(char) for char in chars]
+    cell_w = max(1, max(box[2] for box in boxes))
+    cell_h = max(1, max(box[3] for box in boxes))
+    rows = -(-len(chars) // ATLAS_COLUMNS)
+
+    atlas = Image.new("L", (ATLAS_COLUMNS * cell_w, rows * cell_h), 0)
+    draw = ImageDraw.Draw(atlas)
+    for i, char in enumerate(chars):
+        draw.text(((i % ATLAS_COLUMNS) * cell_w, (i // ATLAS_COLUMNS) * cell_h), char, fill=255, font=font)
+    return np.asarray(atlas, dtype=np.uint8), (cell_w, cell_h)
+
+
+class TextRenderer:
+    """
+    TextRenderer
+
+    Draws lines of text from a glyph atlas, all in a single draw call.
+    Each line owns a slot of a vertex buffer holding its quads, which is
+    only rebuilt and re-uploaded when the line's text or position changes.
+    Lines are given slots in order, or kept in the slot of a key (see
+    slot()) when drawn one at a time.
+    """
+
+    def __init__(self):
+        """
+        Builds the glyph atlas texture and the line buffers.
+        Needs a current OpenGL context.
+        """
+        alpha, (self.cell_w, self.cell_h) = build_glyph_atlas()
+        height, width = alpha.shape
+        pixels = np.full((height, width, 4), 255, dtype=np.uint8)
+        pixels[:, :, 3] = alpha
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        # Texcoords of each glyph's (left, top, right, bottom) edges
+        codes = np.arange(LAST_CHAR - FIRST_CHAR + 1)
+        u = (codes % ATLAS_COLUMNS) * self.cell_w / width
+        v = (codes // ATLAS_COLUMNS) * self.cell_h / height
+        self.glyphs = np.stack((u, v, u + self.cell_w / width, v + self.cell_h / height), axis=1).astype(np.float32)
+
+        # One slot of MAX_CHARS quads per line, 6 vertices per quad
+        slot = MAX_CHARS * 6 * 2 * 4
+        self.vertex_buffer, self.texture_buffer = glGenBuffers(2)
+        for buffer in (self.vertex_buffer, self.texture_buffer):
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            glBufferData(GL_ARRAY_BUFFER, MAX_LINES * slot, None, GL_DYNAMIC_DRAW)
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glVertexPointer(2, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, self.texture_buffer)
+        glTexCoordPointer(2, GL_FLOAT, 0, None)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.lines = [None] * MAX_LINES  # (position, text) in each slot
+        self.slots = {}  # Key -> its slot, least recently used first
+        self.counts = np.zeros(MAX_LINES, dtype=np.int32)
+        self.firsts = np.arange(MAX_LINES, dtype=np.int32) * MAX_CHARS * 6
+
+    def build_line(self, position, text):
+        """
+        Builds the quads of a line: (vertices, texcoords), each a float32
+        array of 6 (x, y) pairs per character.
+
+        :param position: The window position of the line's bottom left corner.
+        :param text: The text.
+        """
+        codes = np.frombuffer(text[:MAX_CHARS].encode("ascii", "replace"), dtype=np.uint8).astype(np.int64)
+        codes = np.where((codes >= FIRST_CHAR) & (codes <= LAST_CHAR), codes, ord("?")) - FIRST_CHAR
+        n = len(codes)
+
+        left = position[0] + np.arange(n, dtype=np.float32) * self.cell_w
+        x = np.stack((left, left + self.cell_w), axis=1)  # (n, 2): left, right
+        y = (position[1], position[1] + self.cell_h)  # bottom, top
+        glyphs = self.glyphs[codes]
+
+        # Corners in triangle order: BL, BR, TR, BL, TR, TL
+        corners = ((0, 0), (1, 0), (1, 1), (0, 0), (1, 1), (0, 1))
+        vertices = np.empty((n, 6, 2), dtype=np.float32)
+        texcoords = np.empty((n, 6, 2), dtype=np.float32)
+        for i, (cx, cy) in enumerate(corners):
+            vertices[:, i, 0] = x[:, cx]
+            vertices[:, i, 1] = y[cy]
+            texcoords[:, i, 0] = glyphs[:, 2 if cx else 0]
+            texcoords[:, i, 1] = glyphs[:, 1 if cy else 3]  # The atlas is top row first
+        return vertices, texcoords
+
+    def slot(self, key):
+        """
+        Returns the slot kept for a key, so a line drawn on its own keeps
+        its quads cached between calls. When the slots run out, the least
+        recently used key gives its slot up.
+
+        :param key: Any hashable, e.g. where the line is drawn.
+        """
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            if len(self.slots) < MAX_LINES:
+                slot = len(self.slots)
+            else:
+                slot = self.slots.pop(next(iter(self.slots)))
+                self.lines[slot] = None
+        self.slots[key] = slot
+        return slot
+
+    def draw(self, lines, slots=None):
+        """
+        Draws lines of text in the current color, in one draw call.
+
+        :param lines: Up to MAX_LINES (position, text) pairs, positions in
+                      window pixels from the bottom left corner.
+        :param slots: The slot of each line; by default they take the
+                      first ones in order.
+        """
+        lines = list(lines)[:MAX_LINES]
+        slots = list(range(len(lines)) if slots is None else slots)[:len(lines)]
+        for slot, line in zip(slots, lines):
+            if self.lines[slot] == line:
+                continue
+            self.lines[slot] = line
+            vertices, texcoords = self.build_line(*line)
+            self.counts[slot] = len(vertices) * 6
+            if len(vertices):
+                offset = slot * MAX_CHARS * 6 * 2 * 4
+                glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+                glBufferSubData(GL_ARRAY_BUFFER, offset, vertices.nbytes, vertices)
+                glBindBuffer(GL_ARRAY_BUFFER, self.texture_buffer)
+                glBufferSubData(GL_ARRAY_BUFFER, offset, texcoords.nbytes, texcoords)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        n = len(lines)
+        if not n:
+            return
+
+        # Window pixel coordinates, like glWindowPos
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT | GL_TEXTURE_BIT)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, viewport[2], 0, viewport[3], -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_CULL_FACE)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+
+        glBindVertexArray(self.vao)
+        slots = np.array(slots, dtype=np.intp)
+        glMultiDrawArrays(GL_TRIANGLES, self.firsts[slots], self.counts[slots], n)
+        glBindVertexArray(0)
+
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPopAttrib()
+
+
+# The renderers behind text() and display_debug(), created on first use
+renderers = {}
+
+
+def get_renderer(name):
+    """
+    Returns a shared TextRenderer, creating it the first time.
+
+    :param name: Which one; each keeps its own line cache.
+    """
+    if name not in renderers:
+        renderers[name] = TextRenderer()
+    return renderers[name]
 
 
 def text(position, text):
@@ -14,12 +212,10 @@ def text(position, text):
     :param position: The position of the text.
     :param text: The text to draw.
     """
-    x, y = position
-    glPushMatrix()
-    glWindowPos2f(x, y)
-    for char in text:
-        glutBitmapCharacter(GLUT_BITMAP_8_BY_13, ord(char))
-    glPopMatrix()
+    renderer = get_renderer("text")
+    position = tuple(position)
+    # Each position keeps its own slot, so unchanged text isn't rebuilt
+    renderer.draw([(position, text)], [renderer.slot(position)])
 
 
 def display_debug(position, array):
@@ -30,8 +226,7 @@ def display_debug(position, array):
     :param array: The array of text to display.
     """
     array = array[::-1]
-    array = array[:32]
-    position = list(position)
-    for i, line in enumerate(array):
-        text(position, line)
-        position[1] += 10
\ No newline at end of file
+    array = array[:MAX_LINES]
+    x, y = position
+    renderer = get_renderer("debug")
+    renderer.draw([((x, y + i * renderer.cell_h), line) for i, line in enumerate(array)])
@@ -1,112 +1,240 @@
 from OpenGL.GL import *
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import math
+import os
 import pickle
+import time
 
-class TextureAtlasGenerator:
-    def __init__(self, texture_size=32, n_textures = 100):
-        self.texture_size = texture_size * n_textures
-        self.n_textures = n_textures
-        self.texture_atlas = Image.new("RGBA", (self.texture_size, self.texture_size), (0, 0, 0, 0))
-        self.texture_atlas_data = self.texture_atlas.load()
-        self.current_side = 0
-        self.current_x = 0
-        self.current_y = 0
-        self.used = []
-
-    def add(self, image):
-        # Add image to texture atlas.
-        if image.size[0] > self.texture_size or image.size[1] > self.texture_size:
-            raise Exception("Image is too large for texture atlas.")
-
-        if self.current_x + image.size[0] > self.texture_size:
-            self.current_x = 0
-            self.current_y += image.size[1]
-            self.current_side += 1
-
-        if self.current_y + image.size[1] > self.texture_size:
-            raise Exception("Texture atlas is full.")
-
-        self.texture_atlas.paste(image, (self.current_x, self.current_y))
-        self.used.append((self.current_side, self.current_x, self.current_y, image.size[0], image.size[1]))
-        self.current_x += image.size[0]
-        return self.current_side, self.current_x, self.current_y, image.size[0], image.size[1]
-
-    def get_texture_atlas(self):
-        return self.texture_atlas
+import numpy as np
 
-    def save(self, path):
-        self.texture_atlas.save(path)
+from core.atlas import TextureAtlasGenerator
+from core.config import ATLAS_CACHE_DIR
+
+logger = logging.getLogger("PyCraft")
+
+CACHE_VERSION = 1  # Bump when the cache layout or packing changes
 
-    def get_rect(self, index):
-        side, x, y, w, h = self.used[index]
-        return side, x, y, w, h
 
 class TextureAtlas:
-    def __init__(self):
+    """
+    TextureAtlas
+
+    The block textures, as one atlas texture, or with array=True as a
+    GL_TEXTURE_2D_ARRAY with one layer per texture (in the order they were
+    added), which needs textures of the same size and the packed renderer.
+    Both are mipmapped unless mipmaps=False.
+
+    load_folder() caches the built atlas as raw RGBA, keyed by a hash of the
+    source files: later runs map it straight into the texture, without
+    decoding a single PNG.
+    """
+
+    def __init__(self, array=False, mipmaps=True):
         self.atlas_generator = TextureAtlasGenerator()
         self.textures = []
         self.texture_coords = {}
+        self.pixels = None  # (size, size, 4) RGBA, bottom row first
         self.save_path = None
+        self.array = array
+        self.mipmaps = mipmaps
+        self.target = GL_TEXTURE_2D_ARRAY if array else GL_TEXTURE_2D
 
     def add(self, image, name, parent):
+        size = self.atlas_generator.texture_size
         self.atlas_generator.add(image)
         self.textures.append(image)
-
-        # get texture coordinates
-        _ = self.atlas_generator.get_rect(len(self.textures) - 1)
+        self.pixels = None
+        self.texture_coords[parent + "/" + name] = None
+        if self.atlas_generator.texture_size != size:
+            self.update_coords()  # The atlas grew, and every texture moved
+        else:
+            self.texture_coords[parent + "/" + name] = self.get_coords(len(self.textures) - 1)
+
+    def update_coords(self):
+        """
+        Recomputes the texture coordinates of every texture, as the atlas
+        may have grown (and been repacked) since they were added.
+        """
+        for i, name in enumerate(self.texture_coords):
+            self.texture_coords[name] = self.get_coords(i)
+
+    def get_coords(self, index):
+        """
+        Returns the texture coordinates of a texture: two triangles' worth.
+
+        :param index: The index of the texture, in the order it was added.
+        """
+        size = self.atlas_generator.texture_size
+        _ = self.atlas_generator.get_rect(index)
         x = _[1]
         y = -_[2]
         w = _[3]
         h = _[4]
         # TexCoords for OpenGL
-        self.texture_coords[parent + "/" + name] = (
-            (x + w) / self.atlas_generator.texture_size,
-            (y - h) / self.atlas_generator.texture_size,
+        return (
+            (x + w) / size,
+            (y - h) / size,
 
-            x / self.atlas_generator.texture_size,
-            (y - h) / self.atlas_generator.texture_size,
+            x / size,
+            (y - h) / size,
 
-            x / self.atlas_generator.texture_size,
-            y / self.atlas_generator.texture_size,
+            x / size,
+            y / size,
 
-            (x + w) / self.atlas_generator.texture_size,
-            y / self.atlas_generator.texture_size,
+            (x + w) / size,
+            y / size,
 
-            (x + w) / self.atlas_generator.texture_size,
-            (y - h) / self.atlas_generator.texture_size,
+            (x + w) / size,
+            (y - h) / size,
 
-            x / self.atlas_generator.texture_size,
-            y / self.atlas_generator.texture_size,
+            x / size,
+            y / size,
         )
 
     def get_texture(self, name):
         return self.texture_coords[name + ".png"]
 
+    def get_pixels(self):
+        """
+        Returns the atlas as a (size, size, 4) RGBA array, bottom row first
+        as OpenGL expects it.
+        """
+        if self.pixels is None:
+            atlas = np.asarray(self.atlas_generator.get_texture_atlas().convert("RGBA"))
+            self.pixels = np.ascontiguousarray(atlas[::-1])
+        return self.pixels
+
     def save(self, path):
-        self.atlas_generator.save(path)
+        Image.fromarray(np.ascontiguousarray(self.get_pixels()[::-1])).save(path)
         self.save_path = path
-        pickle.dump(self.texture_coords, open("assets/textures/textures.pickle", "wb"))
+        with open(os.path.splitext(path)[0] + ".pickle", "wb") as f:
+            pickle.dump(self.texture_coords, f)
 
     def add_from_folder(self, path, parent):
-        import os
-        for filename in os.listdir(path):
+        for filename in sorted(os.listdir(path)):
             if filename.endswith(".png"):
                 image = Image.open(path + filename)
                 self.add(image, filename, parent)
 
+    def load_folder(self, path, parent, cache_dir=ATLAS_CACHE_DIR):
+        """
+        Adds the textures of a folder, like add_from_folder() on an empty
+        atlas, through the cache. On a miss, the textures are decoded in
+        parallel and the result is cached.
+
+        :param path: The folder, ending with a slash.
+        :param parent: The prefix of the texture names.
+        :param cache_dir: The cache directory.
+        """
+        if self.texture_coords:
+            raise Exception("Textures can only be loaded into an empty atlas.")
+        start = time.perf_counter()
+        filenames = sorted(filename for filename in os.listdir(path) if filename.endswith(".png"))
+        key = hashlib.sha1(repr((CACHE_VERSION, parent, self.atlas_generator.texture_size, self.atlas_generator.max_size)).encode())
+        for filename in filenames:
+            with open(path + filename, "rb") as f:
+                key.update(filename.encode() + b"\0" + hashlib.sha1(f.read()).digest())
+        cache = os.path.join(cache_dir, key.hexdigest())
+
+        index = None
+        if os.path.exists(cache + ".json") and os.path.exists(cache + ".rgba"):
+            try:
+                with open(cache + ".json") as f:
+                    index = json.load(f)
+            except ValueError:
+                logger.log(logging.WARNING, "[core/texture_manager] Rebuilding the atlas cache: its index is corrupt")
+        if index is not None:
+            size = index["size"]
+            self.atlas_generator.texture_size = size
+            self.atlas_generator.used = [tuple(rect) for _, rect in index["textures"]]
+            self.pixels = np.memmap(cache + ".rgba", dtype=np.uint8, mode="r", shape=(size, size, 4))
+            self.texture_coords = {name: None for name, _ in index["textures"]}
+            self.update_coords()
+            logger.log(logging.DEBUG, "[core/texture_manager] Loaded %d textures from the atlas cache in %.1f ms",
+                       len(filenames), (time.perf_counter() - start) * 1000)
+            return
+
+        def decode(filename):
+            image = Image.open(path + filename)
+            image.load()
+            return image
+
+        with ThreadPoolExecutor() as executor:
+            images = list(executor.map(decode, filenames))
+        for image, filename in zip(images, filenames):
+            self.add(image, filename, parent)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        pixels = self.get_pixels()
+        pixels.tofile(cache + ".rgba.tmp")
+        os.replace(cache + ".rgba.tmp", cache + ".rgba")
+        # The index goes last, and like the pixels is only ever seen whole
+        with open(cache + ".json.tmp", "w") as f:
+            json.dump({"size": self.atlas_generator.texture_size,
+                       "textures": [(name, self.atlas_generator.get_rect(i))
+                                    for i, name in enumerate(self.texture_coords)]}, f)
+        os.replace(cache + ".json.tmp", cache + ".json")
+        logger.log(logging.DEBUG, "[core/texture_manager] Built and cached the atlas of %d textures in %.1f ms",
+                   len(filenames), (time.perf_counter() - start) * 1000)
+
     def generate(self):
-        Img = Image.open(self.save_path)
-        width, height = Img.size
-        texData = Img.convert("RGBA").tobytes("raw", "RGBA", 0, -1)
+        if self.array:
+            return self.generate_array()
+
+        pixels = self.get_pixels()
+        height, width = pixels.shape[:2]
+        levels = self.atlas_generator.get_mip_levels() if self.mipmaps else 1
         texid = glGenTextures(1)
         glBindTexture(GL_TEXTURE_2D, texid)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 
-                0, GL_RGBA, GL_UNSIGNED_BYTE, texData)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height,
+                0, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, levels - 1)
+        self.set_parameters(GL_TEXTURE_2D, levels)
         return texid
-    
+
+    def generate_array(self):
+        """
+        Uploads the textures as the layers of a GL_TEXTURE_2D_ARRAY.
+        """
+        rects = self.atlas_generator.used
+        _, _, _, width, height = rects[0]
+        if any((w, h) != (width, height) for _, _, _, w, h in rects):
+            raise Exception("Texture arrays need textures of the same size.")
+        levels = int(math.log2(min(width, height))) + 1 if self.mipmaps else 1
+
+        # Layers are cut out of the atlas, which is stored bottom row first
+        pixels = self.get_pixels()
+        size = pixels.shape[0]
+        texid = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, texid)
+        glTexStorage3D(GL_TEXTURE_2D_ARRAY, levels, GL_RGBA8, width, height, len(rects))
+        for layer, (_, x, y, w, h) in enumerate(rects):
+            texData = np.ascontiguousarray(pixels[size - y - h:size - y, x:x + w])
+            glTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 0, 0, layer, width, height, 1,
+                            GL_RGBA, GL_UNSIGNED_BYTE, texData)
+        self.set_parameters(GL_TEXTURE_2D_ARRAY, levels)
+        return texid
+
+    def set_parameters(self, target, levels):
+        """
+        Sets the wrapping and filtering of the bound texture, and generates
+        its mip levels.
+
+        :param target: The texture target.
+        :param levels: The number of mip levels.
+        """
+        glTexParameteri(target, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(target, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameteri(target, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        if levels > 1:
+            glTexParameteri(target, GL_TEXTURE_MIN_FILTER, GL_NEAREST_MIPMAP_LINEAR)
+            glGenerateMipmap(target)
+        else:
+            glTexParameteri(target, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+
     def bind(self, texid):
-        glBindTexture(GL_TEXTURE_2D, texid)
\ No newline at end of file
+        glBindTexture(self.target, texid)
@@ -0,0 +1,99 @@
+# imports
+import numpy as np
+
+from core.mesher import Mesh
+
+# constants
+# One packed vertex, 8 bytes. x and z are relative to the chunk origin, the
+# face indexes mesher.FACES, the tile indexes the atlas (see
+# mesher.build_tile_table) and light scales the texture colour (255 = full).
+# Laid out as two integer attributes: (x, z, face, light) bytes, then
+# (y, tile) shorts.
+PACKED_VERTEX = np.dtype([
+    ("x", np.uint8),
+    ("z", np.uint8),
+    ("face", np.uint8),
+    ("light", np.uint8),
+    ("y", "<u2"),
+    ("tile", "<u2"),
+])
+PACKED_STRIDE = PACKED_VERTEX.itemsize
+
+# The mesher gives 6 vertices per face: bottom right, bottom left, top left,
+# top right, bottom right, top left. The first 4 are the quad's corners, and
+# these indices rebuild the two triangles from them.
+QUAD_VERTICES = 4
+QUAD_INDICES = np.array((0, 1, 2, 3, 0, 2), dtype=np.uint32)
+
+# Texture directions (right, up) of each face, as in mesher._QUADS
+FACE_RIGHT = np.array([(0, 0, -1), (0, 0, 1), (1, 0, 0), (1, 0, 0), (1, 0, 0), (-1, 0, 0)], dtype=np.float32)
+FACE_UP = np.array([(0, 1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1), (0, 1, 0), (0, 1, 0)], dtype=np.float32)
+
+
+def encode(mesh, origin=(0, 0), light=None):
+    """
+    Packs a mesh into PACKED_VERTEX vertices, 4 per quad.
+    Needs a mesh with tiles, i.e. meshed with a tile_table.
+
+    :param mesh: The Mesh, with 6 vertices per face.
+    :param origin: The (x, z) world position the vertices are relative to.
+    :param light: The light of every vertex, or an array with one per packed
+                  vertex. By default, the mesh's baked lights, or full light
+                  without them.
+    """
+    if mesh.tiles is None or mesh.faces is None:
+        raise ValueError("Packing a mesh needs its tiles and faces")
+    quads = mesh.count // 6
+    corners = mesh.vertices.reshape(quads, 6, 3)[:, :QUAD_VERTICES].reshape(-1, 3)
+    local = np.rint(corners - np.array((origin[0], 0, origin[1]), dtype=np.float64)).astype(np.int64)
+    if len(local) and (local[:, [0, 2]].min() < 0 or local[:, [0, 2]].max() > 0xFF
+                       or local[:, 1].min() < 0 or local[:, 1].max() > 0xFFFF):
+        raise ValueError("Mesh doesn't fit the packed vertex format around {}".format(tuple(origin)))
+
+    packed = np.empty(len(local), dtype=PACKED_VERTEX)
+    packed["x"] = local[:, 0]
+    packed["y"] = local[:, 1]
+    packed["z"] = local[:, 2]
+    packed["face"] = mesh.faces.reshape(quads, 6)[:, :QUAD_VERTICES].reshape(-1)
+    packed["tile"] = mesh.tiles.reshape(quads, 6)[:, :QUAD_VERTICES].reshape(-1)
+    if light is None:
+        light = mesh.lights.reshape(quads, 6)[:, :QUAD_VERTICES].reshape(-1) if mesh.lights is not None else 255
+    packed["light"] = light
+    return packed
+
+
+def decode(packed, origin=(0, 0)):
+    """
+    Unpacks PACKED_VERTEX vertices back into a Mesh with 6 vertices per face,
+    and the light of each of its vertices. Texcoords are given in blocks,
+    along each face's texture directions, as the shader computes them.
+
+    :param packed: The packed vertices.
+    :param origin: The (x, z) world position the vertices are relative to.
+    """
+    packed = np.asarray(packed).view(PACKED_VERTEX)
+    quads = len(packed) // QUAD_VERTICES
+    order = quad_indices(quads)
+    packed = packed[order]
+
+    vertices = np.empty((len(packed), 3), dtype=np.float32)
+    vertices[:, 0] = packed["x"].astype(np.float32) + origin[0]
+    vertices[:, 1] = packed["y"]
+    vertices[:, 2] = packed["z"].astype(np.float32) + origin[1]
+    faces = packed["face"].copy()
+    texcoords = np.stack((
+        (vertices * FACE_RIGHT[faces]).sum(axis=1),
+        (vertices * FACE_UP[faces]).sum(axis=1),
+    ), axis=1)
+
+    mesh = Mesh(vertices.reshape(-1), np.ascontiguousarray(texcoords.reshape(-1)), packed["tile"].copy(), faces)
+    return mesh, packed["light"].copy()
+
+
+def quad_indices(quads):
+    """
+    Builds the element indices for drawing quads of 4 packed vertices.
+
+    :param quads: The number of quads.
+    """
+    return (QUAD_INDICES[None, :] + (np.arange(quads, dtype=np.uint32) * QUAD_VERTICES)[:, None]).reshape(-1)
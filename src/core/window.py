@@ -1,7 +1,18 @@
 import threading
 import logging
+import os
+import time
 
 import glfw
+import numpy as np
+from OpenGL.GL import GL_PACK_ALIGNMENT, GL_RGB, GL_UNSIGNED_BYTE, glPixelStorei, glReadPixels
+
+from core.config import MAX_TICKS_PER_FRAME, SHARED_CONTEXT_POLL, TICK_RATE, WINDOW_SIZE
+from core.profiler import Profiler
+from core.scheduler import JobScheduler
+
+# Time the process started importing PyCraft, for the time to first frame
+start_time = time.perf_counter()
 
 # Config the logger
 logger = logging.getLogger("PyCraft")
@@ -11,21 +22,45 @@ logger.addHandler(file_handler)
 logger.setLevel(logging.DEBUG)
 
 class Window:
-    def __init__(self):
+    def __init__(self, headless=False, size=WINDOW_SIZE):
         """
         Init GLFW, and create a new window
+
+        :param headless: Whether to render offscreen: the window is hidden,
+                         and every frame runs exactly one tick so a replayed
+                         camera path gives the same frames on every run. With
+                         PYOPENGL_PLATFORM=osmesa, GLFW uses its null platform
+                         and an OSMesa context, so no display is needed.
+        :param size: The (width, height) of the window.
         """
+        self.headless = headless
+        self.size = size
         logger.log(logging.DEBUG, "[core/window] Initializing GLFW")
+        if headless and os.environ.get("PYOPENGL_PLATFORM") == "osmesa":
+            if not hasattr(glfw, "PLATFORM_NULL"):
+                raise Exception("Rendering without a display needs GLFW 3.4 or newer")
+            glfw.init_hint(glfw.PLATFORM, glfw.PLATFORM_NULL)
         if not glfw.init():
             logger.log(logging.FATAL, "[core/window] GLFW failed to initialize")
             raise Exception("GLFW failed to initialize")
         
         self.context_event = threading.Event()
+        self.first_frame_time = None  # Seconds from startup to the first frame
         self.shared_context_scheduled = []
+        self.tick_scheduled = []
         self.drawcall_scheduled = []
+        self.tick_time = 1 / TICK_RATE  # Seconds of simulation per tick
+        self.alpha = 0.0  # How far the frame is between the last two ticks, 0..1
+        self.frame = 0  # Frames drawn so far
+        self.profiler = Profiler()
+        self.jobs = JobScheduler()  # Jobs for the shared context, see core/scheduler.py
         
         logger.log(logging.DEBUG, "[core/window] Creating window")
-        self.window = glfw.create_window(800, 600, "PyCraft", None, None)
+        if headless:
+            glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+            if os.environ.get("PYOPENGL_PLATFORM") == "osmesa":
+                glfw.window_hint(glfw.CONTEXT_CREATION_API, glfw.OSMESA_CONTEXT_API)
+        self.window = glfw.create_window(size[0], size[1], "PyCraft", None, None)
         if not self.window:
             logger.log(logging.FATAL, "[core/window] Failed to create window")
             glfw.terminate()
@@ -33,52 +68,139 @@ class Window:
         glfw.make_context_current(self.window)
         
         logger.log(logging.DEBUG, "[core/window] Creating shared context")
+        # Windows can only be made on the main thread; the shared context
+        # thread just makes this one current
+        glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+        self.shared_window = glfw.create_window(500, 500, "Shared Context", None, self.window)
+        if not self.shared_window:
+            logger.log(logging.FATAL, "[core/window] Failed to create shared context")
+            glfw.terminate()
+            raise Exception("Failed to create shared context")
         self.thread = threading.Thread(target=self.shared_context)
         self.thread.start()
         self.context_event.wait()
         
     def shared_context(self):
         """
-        Make another window, and share the context with the main window
-        Then we can use this window to process the scheduled stuff.
+        Runs the shared context: makes the hidden window sharing the main
+        window's objects current, then runs the jobs submitted to self.jobs,
+        within their budget per frame, and the scheduled objects. Between
+        runs it sleeps until there is something to do, rather than spinning
+        against the render thread. Events and buffer swaps are left to the
+        main thread.
         """
-        logger.log(logging.DEBUG, "[core/window: shared_context] Initializing shared context")
-        if not glfw.init():
-            logger.log(logging.FATAL, "[core/window: shared_context] GLFW failed to initialize in shared context")
-            raise logger("GLFW failed to initialize in shared context")
-        glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
-        new_window = glfw.create_window(500, 500, "Shared Context", None, self.window)
-        glfw.make_context_current(new_window)
+        glfw.make_context_current(self.shared_window)
         self.context_event.set()
         logger.log(logging.DEBUG, "[core/window: shared_context] Shared context initialized")
         
-        while not glfw.window_should_close(self.window):
-            glfw.poll_events()
+        profiler = self.profiler
+        jobs = self.jobs
+        while not glfw.window_should_close(self.window) and jobs.running:
             for obj in self.shared_context_scheduled:
-                obj.shared_context()
-            glfw.swap_buffers(self.window)
+                with profiler.zone(type(obj).__name__ + ".shared_context"):
+                    obj.shared_context()
+            with profiler.zone("JobScheduler.run"):
+                jobs.run()
+            # Scheduled objects are polled; jobs wake the thread themselves
+            jobs.wait(SHARED_CONTEXT_POLL if self.shared_context_scheduled else None)
         
+        glfw.make_context_current(None)
         logger.log(logging.DEBUG, "[core/window: shared_context] Shared context terminated")
-        glfw.destroy_window(new_window)
-        glfw.terminate()
         
     def schedule_shared_context(self, obj):
         """
-        Schedule an object to be processed in the shared context
+        Schedule an object to be polled in the shared context. Work that
+        can be split up should rather be submitted to self.jobs, to be
+        prioritized and budgeted.
         """
         self.shared_context_scheduled.append(obj)
         
-    def mainloop(self):
+    def mainloop(self, frames=None):
         """
-        The main loop of the window
+        The main loop of the window.
+        Ticks run at a fixed rate, catching up on the time the last frame
+        took (up to MAX_TICKS_PER_FRAME, then the rest is dropped so a slow
+        frame can't snowball). Then one frame is drawn, with self.alpha
+        telling how far it is between the last two ticks.
+        A headless window runs one tick per frame instead, whatever the
+        frame took.
+        Each frame drawn gives the shared context jobs a new budget. Once the
+        window closes, the shared context is stopped and GLFW terminated.
+
+        :param frames: Close the window after this many frames; None runs
+                       until it is closed.
         """
         logger.log(logging.DEBUG, "[core/window] Main loop started")
+        first_frame = True
+        previous = time.perf_counter()
+        accumulator = 0.0
+        profiler = self.profiler
         while not glfw.window_should_close(self.window):
+            profiler.begin_frame()
             glfw.poll_events()
+
+            if self.headless:
+                with profiler.zone("tick"):
+                    self.tick(1)
+                self.alpha = 1.0
+            else:
+                now = time.perf_counter()
+                accumulator += now - previous
+                previous = now
+                with profiler.zone("tick"):
+                    self.tick(accumulator // self.tick_time)
+                accumulator %= self.tick_time
+                self.alpha = accumulator / self.tick_time
+
             for obj in self.drawcall_scheduled:
-                obj.drawcall()
-            glfw.swap_buffers(self.window)
-            
+                with profiler.zone(type(obj).__name__ + ".drawcall", gpu=True):
+                    obj.drawcall()
+            with profiler.zone("swap_buffers"):
+                glfw.swap_buffers(self.window)
+            profiler.end_frame()
+            self.jobs.next_frame()
+            self.frame += 1
+            if first_frame:
+                first_frame = False
+                self.first_frame_time = time.perf_counter() - start_time
+                logger.log(logging.INFO, "[core/window] Time to first frame: %.3f s", self.first_frame_time)
+            if frames is not None and self.frame >= frames:
+                glfw.set_window_should_close(self.window, True)
+        self.jobs.close()  # Wakes the shared context to finish
+        self.thread.join()
+        logger.log(logging.DEBUG, "[core/window] Main loop stopped")
+        glfw.destroy_window(self.shared_window)
+        glfw.terminate()
+
+    def read_pixels(self):
+        """
+        Reads back the frame just drawn, as a (height, width, 3) uint8 array,
+        top row first. Call it from a drawcall, before the buffers are swapped.
+        """
+        width, height = glfw.get_framebuffer_size(self.window)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+        return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)[::-1]
+
+    def tick(self, ticks):
+        """
+        Runs the scheduled ticks.
+
+        :param ticks: The number of ticks due.
+        """
+        if ticks > MAX_TICKS_PER_FRAME:
+            logger.log(logging.DEBUG, "[core/window] Dropping %d ticks to catch up", ticks - MAX_TICKS_PER_FRAME)
+            ticks = MAX_TICKS_PER_FRAME
+        for _ in range(int(ticks)):
+            for obj in self.tick_scheduled:
+                obj.tick(self.tick_time)
+
+    def schedule_tick(self, obj):
+        """
+        Schedule an object to be ticked at the fixed tick rate
+        """
+        self.tick_scheduled.append(obj)
+
     def schedule_drawcall(self, obj):
         """
         Schedule an object to be processed in the main loop
@@ -0,0 +1,562 @@
+# imports
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger("PyCraft")
+
+# constants
+CHUNK_SIZE = 16  # Blocks along x and z in a chunk
+SECTION_SIZE = 16  # Blocks along y in a section
+WORLD_HEIGHT = 256  # Blocks along y in the world
+SECTIONS = WORLD_HEIGHT // SECTION_SIZE  # Sections per chunk
+BLOCK_DTYPE = np.uint16  # dtype of the dense block arrays handed out
+
+# Block ids
+AIR = 0
+STONE = 1
+DIRT = 2
+GRASS = 3
+SAND = 4
+WATER = 5
+
+# Block properties, by id. Textures are TextureAtlas names (without ".png").
+BLOCKS = {
+    AIR: {"name": "air", "solid": False, "transparent": True, "textures": None},
+    STONE: {"name": "stone", "solid": True, "transparent": False, "textures": {
+        "top": "block/stone", "bottom": "block/stone", "side": "block/stone"}},
+    DIRT: {"name": "dirt", "solid": True, "transparent": False, "textures": {
+        "top": "block/dirt", "bottom": "block/dirt", "side": "block/dirt"}},
+    GRASS: {"name": "grass", "solid": True, "transparent": False, "textures": {
+        "top": "block/grass_top", "bottom": "block/dirt", "side": "block/grass_side"}},
+    SAND: {"name": "sand", "solid": True, "transparent": False, "textures": {
+        "top": "block/sand", "bottom": "block/sand", "side": "block/sand"}},
+    WATER: {"name": "water", "solid": False, "transparent": True, "absorb": 2, "textures": {
+        "top": "block/water", "bottom": "block/water", "side": "block/water"}},
+}
+
+# Player collision probes, relative to the camera position
+PLAYER_HEIGHT = 1.8
+PLAYER_EYE = 1.62
+PLAYER_RADIUS = 0.3
+
+
+def chunk_key(cx, cz):
+    """
+    Packs chunk coordinates into a single integer key.
+
+    :param cx: The chunk x coordinate.
+    :param cz: The chunk z coordinate.
+    """
+    return ((cx & 0xFFFFFFFF) << 32) | (cz & 0xFFFFFFFF)
+
+
+def key_to_chunk(key):
+    """
+    Unpacks a key made by chunk_key() back into chunk coordinates.
+
+    :param key: The chunk key.
+    """
+    cx = key >> 32
+    cz = key & 0xFFFFFFFF
+    if cx >= 0x80000000:
+        cx -= 0x100000000
+    if cz >= 0x80000000:
+        cz -= 0x100000000
+    return cx, cz
+
+
+class Section:
+    """
+    Section
+
+    A 16x16x16 cube of blocks, palette compressed.
+    Uniform sections (all air, all stone) store a single id and no array,
+    sections with up to 256 distinct ids store uint8 indices into a palette,
+    and anything else falls back to raw uint16 ids.
+    """
+
+    def __init__(self, block=AIR):
+        """
+        Initializes a uniform section.
+
+        :param block: The block id filling the section.
+        """
+        self.palette = [block]
+        self.lookup = {block: 0}
+        self.indices = None
+
+    @property
+    def uniform(self):
+        """
+        Whether the whole section is a single block id.
+        """
+        return self.indices is None
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the section's block storage, in bytes.
+        """
+        size = 0 if self.indices is None else self.indices.nbytes
+        if self.palette is not None:
+            size += len(self.palette) * np.dtype(BLOCK_DTYPE).itemsize
+        return size
+
+    def get(self, x, y, z):
+        """
+        Gets a block id.
+
+        :param x, y, z: The position inside the section.
+        """
+        if self.indices is None:
+            return self.palette[0]
+        if self.palette is None:
+            return int(self.indices[x, y, z])
+        return self.palette[self.indices[x, y, z]]
+
+    def set(self, x, y, z, block):
+        """
+        Sets a block id.
+
+        :param x, y, z: The position inside the section.
+        :param block: The block id.
+        """
+        if self.palette is None:
+            self.indices[x, y, z] = block
+            return
+
+        index = self.lookup.get(block)
+        if index is None:
+            if len(self.palette) == 256:
+                # Too many ids for uint8 indices: store raw ids instead
+                self.indices = self.to_array()
+                self.palette = None
+                self.lookup = None
+                self.indices[x, y, z] = block
+                return
+            index = len(self.palette)
+            self.palette.append(block)
+            self.lookup[block] = index
+
+        if self.indices is None:
+            if index == 0:
+                return
+            self.indices = np.zeros((CHUNK_SIZE, SECTION_SIZE, CHUNK_SIZE), dtype=np.uint8)
+        self.indices[x, y, z] = index
+
+    def to_array(self):
+        """
+        Returns the section as a dense (16, 16, 16) array of block ids.
+        """
+        if self.indices is None:
+            return np.full((CHUNK_SIZE, SECTION_SIZE, CHUNK_SIZE), self.palette[0], dtype=BLOCK_DTYPE)
+        if self.palette is None:
+            return self.indices.copy()
+        return np.asarray(self.palette, dtype=BLOCK_DTYPE)[self.indices]
+
+    def from_array(self, blocks):
+        """
+        Replaces the section with a dense (16, 16, 16) array of block ids,
+        picking the most compact storage for it.
+
+        :param blocks: The block ids.
+        """
+        palette, inverse = np.unique(blocks, return_inverse=True)
+        if len(palette) == 1:
+            self.palette = [int(palette[0])]
+            self.indices = None
+        elif len(palette) <= 256:
+            self.palette = palette.tolist()
+            self.indices = inverse.reshape(blocks.shape).astype(np.uint8)
+        else:
+            self.palette = None
+            self.lookup = None
+            self.indices = np.array(blocks, dtype=BLOCK_DTYPE)
+            return
+        self.lookup = {block: index for index, block in enumerate(self.palette)}
+
+    def read(self, slices):
+        """
+        Reads a box of blocks.
+
+        :param slices: A tuple of three slices into the section.
+        """
+        if self.indices is None:
+            shape = [len(range(*s.indices(n))) for s, n in zip(slices, (CHUNK_SIZE, SECTION_SIZE, CHUNK_SIZE))]
+            return np.full(shape, self.palette[0], dtype=BLOCK_DTYPE)
+        if self.palette is None:
+            return self.indices[slices].copy()
+        return np.asarray(self.palette, dtype=BLOCK_DTYPE)[self.indices[slices]]
+
+    def write(self, slices, blocks):
+        """
+        Writes a box of blocks.
+
+        :param slices: A tuple of three slices into the section.
+        :param blocks: The block ids, broadcastable to the box.
+        """
+        if self.palette is None:
+            self.indices[slices] = blocks
+            return
+        dense = self.to_array()
+        dense[slices] = blocks
+        self.from_array(dense)
+
+    def compact(self):
+        """
+        Drops unused palette entries and collapses the section to a single
+        id if it became uniform.
+        """
+        if self.indices is not None:
+            self.from_array(self.to_array())
+
+
+class Chunk:
+    """
+    Chunk
+
+    A 16 x WORLD_HEIGHT x 16 column of blocks, stored as a stack of sections.
+    """
+
+    def __init__(self, cx, cz):
+        """
+        Initializes an empty (all air) chunk.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        self.cx = cx
+        self.cz = cz
+        self.key = chunk_key(cx, cz)
+        self.sections = [Section() for _ in range(SECTIONS)]
+        self.light = None  # Packed (16, WORLD_HEIGHT, 16) uint8 light, see core/light.py
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the chunk's block storage, in bytes.
+        """
+        return sum(section.nbytes for section in self.sections)
+
+    def get_block(self, x, y, z):
+        """
+        Gets a block id.
+
+        :param x, y, z: The position inside the chunk.
+        """
+        return self.sections[y // SECTION_SIZE].get(x, y % SECTION_SIZE, z)
+
+    def set_block(self, x, y, z, block):
+        """
+        Sets a block id.
+
+        :param x, y, z: The position inside the chunk.
+        :param block: The block id.
+        """
+        self.sections[y // SECTION_SIZE].set(x, y % SECTION_SIZE, z, block)
+
+    def get_blocks(self):
+        """
+        Returns the whole chunk as a dense (16, WORLD_HEIGHT, 16) array.
+        """
+        return np.concatenate([section.to_array() for section in self.sections], axis=1)
+
+    def set_blocks(self, blocks):
+        """
+        Replaces the whole chunk with a dense (16, WORLD_HEIGHT, 16) array.
+
+        :param blocks: The block ids.
+        """
+        for i, section in enumerate(self.sections):
+            section.from_array(blocks[:, i * SECTION_SIZE:(i + 1) * SECTION_SIZE, :])
+
+    def get_region(self, x0, y0, z0, x1, y1, z1):
+        """
+        Reads the box [x0, x1) x [y0, y1) x [z0, z1) of blocks.
+
+        :param x0, y0, z0: The lower corner, inside the chunk.
+        :param x1, y1, z1: The upper corner (exclusive), inside the chunk.
+        """
+        blocks = np.empty((x1 - x0, y1 - y0, z1 - z0), dtype=BLOCK_DTYPE)
+        for sy in range(y0 // SECTION_SIZE, (y1 - 1) // SECTION_SIZE + 1):
+            base = sy * SECTION_SIZE
+            lo, hi = max(y0, base), min(y1, base + SECTION_SIZE)
+            blocks[:, lo - y0:hi - y0, :] = self.sections[sy].read(
+                (slice(x0, x1), slice(lo - base, hi - base), slice(z0, z1)))
+        return blocks
+
+    def set_region(self, x0, y0, z0, blocks):
+        """
+        Writes a box of blocks with its lower corner at (x0, y0, z0).
+
+        :param x0, y0, z0: The lower corner, inside the chunk.
+        :param blocks: The block ids.
+        """
+        x1, y1, z1 = x0 + blocks.shape[0], y0 + blocks.shape[1], z0 + blocks.shape[2]
+        for sy in range(y0 // SECTION_SIZE, (y1 - 1) // SECTION_SIZE + 1):
+            base = sy * SECTION_SIZE
+            lo, hi = max(y0, base), min(y1, base + SECTION_SIZE)
+            self.sections[sy].write(
+                (slice(x0, x1), slice(lo - base, hi - base), slice(z0, z1)),
+                blocks[:, lo - y0:hi - y0, :])
+
+    def compact(self):
+        """
+        Compacts every section.
+        """
+        for section in self.sections:
+            section.compact()
+
+
+class World:
+    """
+    World
+
+    The voxel world: a dictionary of chunks keyed by chunk_key().
+    Blocks outside loaded chunks, or above/below the world, read as air.
+    With a RegionStore, edited chunks are saved when unloaded or on save().
+    """
+
+    def __init__(self, store=None):
+        """
+        Initializes an empty world.
+
+        :param store: Optional RegionStore (see core/region.py) to save to.
+        """
+        self.chunks = {}
+        self.store = store
+        self.dirty = set()  # Keys of the chunks edited since they were saved
+        self.dirty_sections = set()  # (cx, cz, sy) of the sections to remesh, see mark_dirty()
+
+    def get_chunk(self, cx, cz):
+        """
+        Gets a loaded chunk, or None.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        return self.chunks.get(chunk_key(cx, cz))
+
+    def load_chunk(self, cx, cz, blocks=None):
+        """
+        Gets a chunk, creating it if it isn't loaded yet.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        :param blocks: Optional dense block array to fill the chunk with.
+        """
+        key = chunk_key(cx, cz)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk(cx, cz)
+        if blocks is not None:
+            chunk.set_blocks(blocks)
+        return chunk
+
+    def add_chunk(self, chunk):
+        """
+        Adds a fully built chunk, replacing any loaded chunk at its position.
+
+        :param chunk: The Chunk.
+        """
+        self.chunks[chunk.key] = chunk
+
+    def unload_chunk(self, cx, cz):
+        """
+        Unloads a chunk. Its sections waiting to be remeshed are dropped,
+        as it has no mesh left to patch.
+
+        :param cx: The chunk x coordinate.
+        :param cz: The chunk z coordinate.
+        """
+        key = chunk_key(cx, cz)
+        chunk = self.chunks.pop(key, None)
+        self.dirty_sections.difference_update((cx, cz, sy) for sy in range(SECTIONS))
+        if key in self.dirty:
+            self.dirty.discard(key)
+            if chunk is not None and self.store is not None:
+                self.store.save(cx, cz, chunk.get_blocks())
+
+    def save(self):
+        """
+        Queues every edited chunk to be saved to the store.
+        """
+        if self.store is None:
+            return
+        for key in list(self.dirty):
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                self.store.save(chunk.cx, chunk.cz, chunk.get_blocks())
+        self.dirty.clear()
+
+    def mark_dirty(self, x0, y0, z0, x1, y1, z1):
+        """
+        Marks the sections whose meshes depend on the box [x0, x1) x
+        [y0, y1) x [z0, z1) of blocks as dirty: those holding the box grown
+        by one block, since faces, ambient occlusion and smooth light all
+        read the neighbouring blocks.
+
+        :param x0, y0, z0: The lower corner.
+        :param x1, y1, z1: The upper corner (exclusive).
+        """
+        lo_y, hi_y = max(y0 - 1, 0) // SECTION_SIZE, min(y1, WORLD_HEIGHT - 1) // SECTION_SIZE
+        for cx in range((x0 - 1) // CHUNK_SIZE, x1 // CHUNK_SIZE + 1):
+            for cz in range((z0 - 1) // CHUNK_SIZE, z1 // CHUNK_SIZE + 1):
+                for sy in range(lo_y, hi_y + 1):
+                    self.dirty_sections.add((cx, cz, sy))
+
+    def get_block(self, x, y, z):
+        """
+        Gets a block id.
+
+        :param x, y, z: The block position.
+        """
+        if not 0 <= y < WORLD_HEIGHT:
+            return AIR
+        chunk = self.chunks.get(chunk_key(x // CHUNK_SIZE, z // CHUNK_SIZE))
+        if chunk is None:
+            return AIR
+        return chunk.get_block(x % CHUNK_SIZE, y, z % CHUNK_SIZE)
+
+    def set_block(self, x, y, z, block):
+        """
+        Sets a block id, loading the chunk if needed.
+
+        :param x, y, z: The block position.
+        :param block: The block id.
+        """
+        if not 0 <= y < WORLD_HEIGHT:
+            raise ValueError("Block y={} is outside the world".format(y))
+        chunk = self.load_chunk(x // CHUNK_SIZE, z // CHUNK_SIZE)
+        chunk.set_block(x % CHUNK_SIZE, y, z % CHUNK_SIZE, block)
+        self.dirty.add(chunk.key)
+        self.mark_dirty(x, y, z, x + 1, y + 1, z + 1)
+
+    def get_region(self, x0, y0, z0, x1, y1, z1):
+        """
+        Reads the box [x0, x1) x [y0, y1) x [z0, z1) of blocks as a dense
+        array, which may span several chunks.
+
+        :param x0, y0, z0: The lower corner.
+        :param x1, y1, z1: The upper corner (exclusive).
+        """
+        blocks = np.zeros((x1 - x0, y1 - y0, z1 - z0), dtype=BLOCK_DTYPE)
+        lo_y, hi_y = max(y0, 0), min(y1, WORLD_HEIGHT)
+        if lo_y >= hi_y:
+            return blocks
+        for cx in range(x0 // CHUNK_SIZE, (x1 - 1) // CHUNK_SIZE + 1):
+            for cz in range(z0 // CHUNK_SIZE, (z1 - 1) // CHUNK_SIZE + 1):
+                chunk = self.chunks.get(chunk_key(cx, cz))
+                if chunk is None:
+                    continue
+                bx, bz = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+                lo_x, hi_x = max(x0, bx), min(x1, bx + CHUNK_SIZE)
+                lo_z, hi_z = max(z0, bz), min(z1, bz + CHUNK_SIZE)
+                blocks[lo_x - x0:hi_x - x0, lo_y - y0:hi_y - y0, lo_z - z0:hi_z - z0] = chunk.get_region(
+                    lo_x - bx, lo_y, lo_z - bz, hi_x - bx, hi_y, hi_z - bz)
+        return blocks
+
+    def get_light_region(self, x0, y0, z0, x1, y1, z1):
+        """
+        Reads the box [x0, x1) x [y0, y1) x [z0, z1) of packed light (see
+        core/light.py) as a dense uint8 array, like get_region(). Above the
+        world and in chunks without light it's open sky, below it's dark.
+
+        :param x0, y0, z0: The lower corner.
+        :param x1, y1, z1: The upper corner (exclusive).
+        """
+        light = np.full((x1 - x0, y1 - y0, z1 - z0), 0xF0, dtype=np.uint8)
+        if y0 < 0:
+            light[:, :min(-y0, y1 - y0), :] = 0
+        lo_y, hi_y = max(y0, 0), min(y1, WORLD_HEIGHT)
+        if lo_y >= hi_y:
+            return light
+        for cx in range(x0 // CHUNK_SIZE, (x1 - 1) // CHUNK_SIZE + 1):
+            for cz in range(z0 // CHUNK_SIZE, (z1 - 1) // CHUNK_SIZE + 1):
+                chunk = self.chunks.get(chunk_key(cx, cz))
+                if chunk is None or chunk.light is None:
+                    continue
+                bx, bz = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+                lo_x, hi_x = max(x0, bx), min(x1, bx + CHUNK_SIZE)
+                lo_z, hi_z = max(z0, bz), min(z1, bz + CHUNK_SIZE)
+                light[lo_x - x0:hi_x - x0, lo_y - y0:hi_y - y0, lo_z - z0:hi_z - z0] = \
+                    chunk.light[lo_x - bx:hi_x - bx, lo_y:hi_y, lo_z - bz:hi_z - bz]
+        return light
+
+    def set_region(self, x0, y0, z0, blocks):
+        """
+        Writes a box of blocks with its lower corner at (x0, y0, z0),
+        loading chunks as needed.
+
+        :param x0, y0, z0: The lower corner.
+        :param blocks: The block ids, as a 3D array.
+        """
+        x1, y1, z1 = x0 + blocks.shape[0], y0 + blocks.shape[1], z0 + blocks.shape[2]
+        if y0 < 0 or y1 > WORLD_HEIGHT:
+            raise ValueError("Region y={}..{} is outside the world".format(y0, y1))
+        for cx in range(x0 // CHUNK_SIZE, (x1 - 1) // CHUNK_SIZE + 1):
+            for cz in range(z0 // CHUNK_SIZE, (z1 - 1) // CHUNK_SIZE + 1):
+                chunk = self.load_chunk(cx, cz)
+                bx, bz = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+                lo_x, hi_x = max(x0, bx), min(x1, bx + CHUNK_SIZE)
+                lo_z, hi_z = max(z0, bz), min(z1, bz + CHUNK_SIZE)
+                chunk.set_region(lo_x - bx, y0, lo_z - bz,
+                                 blocks[lo_x - x0:hi_x - x0, :, lo_z - z0:hi_z - z0])
+                self.dirty.add(chunk.key)
+        self.mark_dirty(x0, y0, z0, x1, y1, z1)
+
+    def is_solid(self, x, y, z):
+        """
+        Whether the block containing a (float) point is solid.
+
+        :param x, y, z: The point.
+        """
+        block = self.get_block(math.floor(x), math.floor(y), math.floor(z))
+        return BLOCKS[block]["solid"]
+
+    def check_collision(self, position):
+        """
+        Probes the blocks around the player. Point probes miss blocks the
+        player moves past within a frame; collision.sweep() doesn't.
+
+        Returns ten booleans: below the feet, above the head, then +x, -x, +z
+        and -z, each probed at feet and head height.
+
+        :param position: The camera position.
+        """
+        x, y, z = position
+        feet = y - PLAYER_EYE
+        head = feet + PLAYER_HEIGHT
+        low, high = feet + 0.1, head - 0.1
+        r = PLAYER_RADIUS
+        return [
+            self.is_solid(x, feet - 0.01, z),
+            self.is_solid(x, head + 0.01, z),
+            self.is_solid(x + r, low, z), self.is_solid(x + r, high, z),
+            self.is_solid(x - r, low, z), self.is_solid(x - r, high, z),
+            self.is_solid(x, low, z + r), self.is_solid(x, high, z + r),
+            self.is_solid(x, low, z - r), self.is_solid(x, high, z - r),
+        ]
+
+    def compact(self):
+        """
+        Compacts every loaded chunk.
+        """
+        for chunk in self.chunks.values():
+            chunk.compact()
+
+    def memory_report(self):
+        """
+        Reports the block storage used by loaded chunks, to size the view
+        distance against available RAM.
+        """
+        sizes = [chunk.nbytes for chunk in self.chunks.values()]
+        total = sum(sizes)
+        return {
+            "chunks": len(sizes),
+            "bytes": total,
+            "bytes_per_chunk": total / len(sizes) if sizes else 0,
+            "max_chunk_bytes": max(sizes) if sizes else 0,
+        }
@@ -0,0 +1,6 @@
+# imports
+import os
+import sys
+
+# The game runs from src/, which holds the core package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
@@ -0,0 +1,59 @@
+# imports
+import random
+
+import pytest
+
+from core.atlas import TextureAtlasGenerator, pack_shelves
+
+
+class _Image:
+    """
+    Stands in for a PIL image: packing only looks at the size.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+
+def _smallest_packing(sizes, start):
+    """
+    Packs every size at once into the smallest power of two atlas, as the
+    generator did before it packed incrementally.
+    """
+    size = max(start, 1 << (max(max(s) for s in sizes) - 1).bit_length())
+    while True:
+        packed = pack_shelves(sizes, size)
+        if packed is not None and packed[1] <= size:
+            return size, [(shelf, x, y, w, h) for (shelf, x, y), (w, h) in zip(packed[0], sizes)]
+        size *= 2
+
+
+def test_empty_atlas_has_one_mip_level():
+    assert TextureAtlasGenerator().get_mip_levels() == 1
+
+
+def test_uniform_tiles_keep_their_mip_levels():
+    generator = TextureAtlasGenerator(16, 100)
+    for _ in range(40):
+        generator.add(_Image((16, 16)))
+    assert generator.get_mip_levels() == 5  # Down to one pixel per tile
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_packing_matches_a_full_repack(seed):
+    rng = random.Random(seed)
+    generator = TextureAtlasGenerator()
+    sizes = []
+    for _ in range(rng.randint(1, 120)):
+        size = (rng.choice((8, 16, 32, 64)), rng.choice((8, 16, 32, 64)))
+        sizes.append(size)
+        generator.add(_Image(size))
+        assert (generator.texture_size, generator.used) == _smallest_packing(sizes, 32)
+
+
+def test_full_atlas():
+    generator = TextureAtlasGenerator(16, 2)
+    for _ in range(4):
+        generator.add(_Image((16, 16)))
+    with pytest.raises(Exception, match="full"):
+        generator.add(_Image((16, 16)))
@@ -0,0 +1,76 @@
+# imports
+import numpy as np
+import pytest
+
+from core.light import LightEngine, compute_light, sky_light
+from core.terrain import TerrainGenerator
+from core.world import AIR, CHUNK_SIZE, STONE, WATER, WORLD_HEIGHT, World
+
+# constants
+CHUNKS = 2  # The world is CHUNKS x CHUNKS chunks
+SIZE = CHUNKS * CHUNK_SIZE
+
+
+def _world(blocks):
+    """
+    Loads a (SIZE, WORLD_HEIGHT, SIZE) block array as a world, lit from
+    scratch. Returns the world and a LightEngine for it.
+    """
+    world = World()
+    light = compute_light(blocks)
+    for cx in range(CHUNKS):
+        for cz in range(CHUNKS):
+            x, z = cx * CHUNK_SIZE, cz * CHUNK_SIZE
+            world.load_chunk(cx, cz, blocks[x:x + CHUNK_SIZE, :, z:z + CHUNK_SIZE].copy())
+            world.get_chunk(cx, cz).light = light[x:x + CHUNK_SIZE, :, z:z + CHUNK_SIZE].copy()
+    return world, LightEngine(world)
+
+
+def _light(world):
+    """
+    Gathers the light the engine keeps in the chunks into one array.
+    """
+    light = np.zeros((SIZE, WORLD_HEIGHT, SIZE), dtype=np.uint8)
+    for cx in range(CHUNKS):
+        for cz in range(CHUNKS):
+            chunk = world.get_chunk(cx, cz)
+            light[cx * CHUNK_SIZE:(cx + 1) * CHUNK_SIZE, :, cz * CHUNK_SIZE:(cz + 1) * CHUNK_SIZE] = chunk.light
+    return light
+
+
+def _assert_matches_recompute(world):
+    np.testing.assert_array_equal(_light(world), compute_light(world.get_region(0, 0, 0, SIZE, WORLD_HEIGHT, SIZE)))
+
+
+def test_water_on_a_floor():
+    blocks = np.zeros((SIZE, WORLD_HEIGHT, SIZE), dtype=np.uint16)
+    blocks[:, :60, :] = STONE
+    world, engine = _world(blocks)
+    engine.set_block(24, 60, 24, WATER)
+    assert sky_light(_light(world)[24, 60, 24]) == 13  # Full skylight, less what water absorbs
+    _assert_matches_recompute(world)
+
+
+def test_top_of_the_world():
+    blocks = np.zeros((SIZE, WORLD_HEIGHT, SIZE), dtype=np.uint16)
+    blocks[:, :60, :] = STONE
+    world, engine = _world(blocks)
+    engine.set_block(5, WORLD_HEIGHT - 1, 5, WATER)
+    _assert_matches_recompute(world)
+    engine.set_block(5, WORLD_HEIGHT - 1, 5, STONE)
+    _assert_matches_recompute(world)
+
+
+@pytest.mark.parametrize("seed", (0, 1))
+def test_edits_match_recompute(seed):
+    blocks = TerrainGenerator(seed).generate(0, 0, SIZE, SIZE)
+    world, engine = _world(blocks)
+    _assert_matches_recompute(world)
+
+    rng = np.random.default_rng(seed)
+    heights = (blocks != AIR).sum(axis=1)
+    for _ in range(20):
+        x, z = (int(v) for v in rng.integers(0, SIZE, 2))
+        y = int(heights[x, z]) + int(rng.integers(-3, 3))
+        engine.set_block(x, y, z, int(rng.choice((AIR, STONE, WATER))))
+        _assert_matches_recompute(world)
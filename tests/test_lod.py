@@ -0,0 +1,39 @@
+# imports
+import numpy as np
+import pytest
+
+from core.light import FULL_SKY, compute_light
+from core.lod import LOD_FACTORS, coarse_light, mesh_lod
+from core.terrain import TerrainGenerator
+from core.world import BLOCK_DTYPE, CHUNK_SIZE, WORLD_HEIGHT
+
+# constants
+PADDED = (CHUNK_SIZE + 2, WORLD_HEIGHT + 2, CHUNK_SIZE + 2)
+
+
+def _terrain(seed):
+    padded = np.zeros(PADDED, dtype=BLOCK_DTYPE)
+    padded[:, 1:-1, :] = TerrainGenerator(seed).generate(-1, -1, CHUNK_SIZE + 2, CHUNK_SIZE + 2)
+    return padded
+
+
+def test_coarse_light_keeps_the_brightest_of_each_kind():
+    light = np.zeros(PADDED, dtype=np.uint8)
+    light[1, 1, 1] = 0x30  # Skylight 3
+    light[2, 2, 2] = 0x05  # Block light 5
+    light[0, 5, 5] = FULL_SKY  # In the border
+    coarse = coarse_light(light, 2)
+    assert coarse.shape == (CHUNK_SIZE // 2 + 2, WORLD_HEIGHT // 2 + 2, CHUNK_SIZE // 2 + 2)
+    assert coarse[1, 1, 1] == 0x35
+    assert coarse[0, 3, 3] == FULL_SKY
+    assert coarse[1, 3, 3] == 0
+
+
+@pytest.mark.parametrize("level", range(1, len(LOD_FACTORS)))
+def test_coarse_levels_are_shaded_like_full_detail(level):
+    padded = _terrain(3)
+    light = compute_light(padded)
+    detailed = mesh_lod(padded, 0, light=light).lights.mean()
+    coarse = mesh_lod(padded, level, light=light)
+    assert coarse.lights is not None
+    assert abs(coarse.lights.mean() - detailed) < 0.1 * 255  # Not full brightness next to lit chunks
@@ -0,0 +1,108 @@
+# imports
+import os
+
+import numpy as np
+import pytest
+
+from core.region import (DATA_SECTOR, REGION_SIZE, SECTOR, ZLIB, Region, RegionStore, decode_blocks,
+                         encode_blocks, region_of)
+from core.world import BLOCK_DTYPE, CHUNK_SIZE, WORLD_HEIGHT
+
+# constants
+SHAPE = (CHUNK_SIZE, WORLD_HEIGHT, CHUNK_SIZE)
+
+
+def _blocks(seed, kinds=4):
+    """
+    Random blocks for a chunk; with few kinds they still take many sectors.
+    """
+    return np.random.default_rng(seed).integers(0, kinds, SHAPE).astype(BLOCK_DTYPE)
+
+
+def test_encode_round_trip():
+    blocks = _blocks(0)
+    decoded = decode_blocks(ZLIB, encode_blocks(blocks, ZLIB))
+    np.testing.assert_array_equal(decoded, blocks)
+    decoded[0, 0, 0] = 1  # Writable
+
+
+def test_header_check(tmp_path):
+    path = str(tmp_path / "r.0.0.pcr")
+    with open(path, "wb") as file:
+        file.write(b"\0" * DATA_SECTOR * SECTOR)
+    with pytest.raises(Exception, match="compatible"):
+        Region(path)
+
+
+def test_negative_chunk_coordinates(tmp_path):
+    assert region_of(-1, -1) == (-1, -1)
+    assert region_of(-REGION_SIZE, REGION_SIZE - 1) == (-1, 0)
+    region = Region(str(tmp_path / "r.-1.-1.pcr"))
+    chunks = {(-1, -1): _blocks(1), (-REGION_SIZE, -1): _blocks(2), (-1, -REGION_SIZE): _blocks(3)}
+    for (cx, cz), blocks in chunks.items():
+        region.write(cx, cz, blocks, ZLIB)
+    for (cx, cz), blocks in chunks.items():
+        np.testing.assert_array_equal(region.read(cx, cz), blocks)
+    assert region.read(-2, -2) is None
+    region.close()
+
+
+def test_rewrite_reuses_sectors(tmp_path):
+    path = str(tmp_path / "r.0.0.pcr")
+    region = Region(path)
+    region.write(0, 0, _blocks(4), ZLIB)
+    old = int(region.table[region.index(0, 0)]["sector"])
+    region.write(1, 0, _blocks(5), ZLIB)
+    region.write(0, 0, _blocks(6), ZLIB)  # To new sectors, freeing the old ones
+    assert int(region.table[region.index(0, 0)]["sector"]) != old
+    size = os.path.getsize(path)
+    region.write(2, 0, _blocks(4), ZLIB)  # Fits in the sectors (0, 0) had
+    assert int(region.table[region.index(2, 0)]["sector"]) == old
+    assert os.path.getsize(path) == size
+    np.testing.assert_array_equal(region.read(0, 0), _blocks(6))
+    np.testing.assert_array_equal(region.read(1, 0), _blocks(5))
+    np.testing.assert_array_equal(region.read(2, 0), _blocks(4))
+    region.close()
+
+
+def test_reopen_from_table(tmp_path):
+    path = str(tmp_path / "r.0.0.pcr")
+    region = Region(path)
+    for i in range(3):
+        region.write(i, i, _blocks(10 + i), ZLIB)
+    region.close()
+
+    region = Region(path)
+    assert region.allocator.used_space == DATA_SECTOR + int(region.table["sectors"].sum())
+    region.write(5, 5, _blocks(20), ZLIB)  # Mustn't land on the sectors already used
+    for i in range(3):
+        np.testing.assert_array_equal(region.read(i, i), _blocks(10 + i))
+    np.testing.assert_array_equal(region.read(5, 5), _blocks(20))
+    region.close()
+
+
+def test_store_pending_flush_close(tmp_path):
+    directory = str(tmp_path / "world")
+    store = RegionStore(directory, codec=ZLIB)
+    blocks = _blocks(30)
+    store.save(-3, 40, blocks)
+    blocks[:] = 0  # save() keeps its own copy
+    assert store.contains(-3, 40)
+    np.testing.assert_array_equal(store.load(-3, 40), _blocks(30))  # Pending or written
+    for i in range(8):
+        store.save(i, 0, _blocks(40 + i))
+    store.save(0, 0, _blocks(50))  # Saved again: the last copy wins
+    store.flush()
+    assert not store.pending
+    assert os.path.exists(os.path.join(directory, "r.-1.1.pcr"))
+    store.save(1, 1, _blocks(60))
+    store.close()  # Writes what is still queued
+
+    store = RegionStore(directory, codec=ZLIB)
+    np.testing.assert_array_equal(store.load(-3, 40), _blocks(30))
+    np.testing.assert_array_equal(store.load(0, 0), _blocks(50))
+    np.testing.assert_array_equal(store.load(7, 0), _blocks(47))
+    np.testing.assert_array_equal(store.load(1, 1), _blocks(60))
+    assert store.load(2, 2) is None
+    assert not store.contains(2, 2)
+    store.close()
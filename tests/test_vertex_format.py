@@ -0,0 +1,97 @@
+# imports
+import numpy as np
+import pytest
+
+from core.light import compute_light
+from core.mesher import FACES, mesh_blocks
+from core.vertex_format import PACKED_VERTEX, QUAD_VERTICES, decode, encode, quad_indices
+from core.world import AIR, BLOCKS, STONE, WATER
+
+# constants
+ORIGIN = (32, -16)  # A chunk away from the world origin, so offsets matter
+
+
+def _padded(seed=0):
+    """
+    Builds a small padded block array of scattered blocks.
+    """
+    rng = np.random.default_rng(seed)
+    padded = rng.choice(np.array(list(BLOCKS), dtype=np.uint16), size=(18, 34, 18)).astype(np.uint16)
+    padded[rng.random(padded.shape) < 0.5] = AIR
+    return padded
+
+
+def _tile_table():
+    """
+    Gives every (block, face) its own tile.
+    """
+    return np.arange((max(BLOCKS) + 1) * len(FACES), dtype=np.uint16).reshape(-1, len(FACES))
+
+
+@pytest.mark.parametrize("greedy", (False, True))
+@pytest.mark.parametrize("lit", (False, True))
+def test_round_trip(greedy, lit):
+    padded = _padded()
+    light = compute_light(padded) if lit else None
+    mesh = mesh_blocks(padded, (ORIGIN[0], 0, ORIGIN[1]), tile_table=_tile_table(), greedy=greedy, light=light)
+    assert mesh.count
+
+    packed = encode(mesh, ORIGIN)
+    assert packed.dtype == PACKED_VERTEX
+    assert len(packed) == mesh.count // 6 * QUAD_VERTICES
+
+    decoded, lights = decode(packed, ORIGIN)
+    np.testing.assert_array_equal(decoded.vertices, mesh.vertices)
+    np.testing.assert_array_equal(decoded.tiles, mesh.tiles)
+    np.testing.assert_array_equal(decoded.faces, mesh.faces)
+    if lit:
+        np.testing.assert_array_equal(lights, mesh.lights)
+    else:
+        assert (lights == 255).all()
+
+
+def test_decode_accepts_raw_bytes():
+    mesh = mesh_blocks(_padded(1), tile_table=_tile_table())
+    packed = encode(mesh)
+    decoded, _ = decode(np.frombuffer(packed.tobytes(), dtype=np.uint8))
+    np.testing.assert_array_equal(decoded.vertices, mesh.vertices)
+
+
+def test_texcoords_follow_face_directions():
+    padded = np.zeros((3, 3, 3), dtype=np.uint16)
+    padded[1, 1, 1] = STONE
+    mesh = mesh_blocks(padded, tile_table=_tile_table())
+    decoded, _ = decode(encode(mesh))
+    # Every face of a unit cube spans exactly one block of texture
+    uv = decoded.texcoords.reshape(-1, 6, 2)
+    np.testing.assert_array_equal(uv.max(axis=1) - uv.min(axis=1), np.ones((len(FACES), 2)))
+
+
+def test_explicit_light():
+    padded = np.zeros((3, 3, 3), dtype=np.uint16)
+    padded[1, 1, 1] = WATER
+    mesh = mesh_blocks(padded, tile_table=_tile_table())
+    light = np.arange(mesh.count // 6 * QUAD_VERTICES, dtype=np.uint8)
+    _, lights = decode(encode(mesh, light=light))
+    np.testing.assert_array_equal(lights, light[quad_indices(len(light) // QUAD_VERTICES)])
+
+
+def test_out_of_range_raises():
+    padded = np.zeros((3, 3, 3), dtype=np.uint16)
+    padded[1, 1, 1] = STONE
+    mesh = mesh_blocks(padded, (-1, 0, 0), tile_table=_tile_table())
+    with pytest.raises(ValueError):
+        encode(mesh)
+
+
+def test_needs_tiles():
+    padded = np.zeros((3, 3, 3), dtype=np.uint16)
+    padded[1, 1, 1] = STONE
+    with pytest.raises(ValueError):
+        encode(mesh_blocks(padded))
+
+
+def test_quad_indices():
+    np.testing.assert_array_equal(quad_indices(0), np.zeros(0, dtype=np.uint32))
+    np.testing.assert_array_equal(quad_indices(2), [0, 1, 2, 3, 0, 2, 4, 5, 6, 7, 4, 6])
+    assert quad_indices(3).dtype == np.uint32